@@ -3,11 +3,7 @@ Excel文章转音频工具 v1.0
 功能：从Excel读取微信文章链接，抓取正文，转换为语音
 """
 
-import pandas as pd
 import asyncio
-import edge_tts
-import requests
-from bs4 import BeautifulSoup
 import re
 import os
 import sys
@@ -132,6 +128,9 @@ def fetch_wechat_article(url):
         'Connection': 'keep-alive',
     }
 
+    import requests
+    from bs4 import BeautifulSoup
+
     try:
         import urllib3
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -186,6 +185,8 @@ def fetch_wechat_article(url):
 async def text_to_speech(text, output_path, voice=None):
     """使用Edge TTS转换文本为语音"""
 
+    import edge_tts
+
     if voice is None:
         voice = CONFIG['voice']
 
@@ -265,6 +266,7 @@ async def main(excel_path, test_mode=False, start_index=1, end_index=None):
 
     # 读取Excel
     print(f"\n[1/5] Reading Excel: {excel_path}")
+    import pandas as pd
     df = pd.read_excel(excel_path)
 
     total = len(df)
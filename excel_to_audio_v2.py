@@ -4,11 +4,7 @@ Excel文章转音频工具 v2.0
 改进：彻底清理非正文内容 + 支持长文章分段生成
 """
 
-import pandas as pd
 import asyncio
-import edge_tts
-import requests
-from bs4 import BeautifulSoup
 import re
 import os
 import sys
@@ -204,6 +200,9 @@ def fetch_wechat_article(url):
         'Connection': 'keep-alive',
     }
 
+    import requests
+    from bs4 import BeautifulSoup
+
     try:
         import urllib3
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -258,6 +257,8 @@ def fetch_wechat_article(url):
 async def text_to_speech(text, output_path, voice=None):
     """使用Edge TTS转换文本为语音"""
 
+    import edge_tts
+
     if voice is None:
         voice = CONFIG['voice']
 
@@ -423,6 +424,7 @@ async def main(excel_path, test_mode=False, start_index=1, end_index=None):
 
     # 读取Excel
     print(f"\n[1/5] Reading Excel: {excel_path}")
+    import pandas as pd
     df = pd.read_excel(excel_path)
 
     total = len(df)
@@ -2,9 +2,6 @@
 批量抓取所有文章文本（不生成音频）
 """
 
-import pandas as pd
-import requests
-from bs4 import BeautifulSoup
 import re
 import sys
 import io
@@ -113,6 +110,9 @@ def fetch_wechat_article(url):
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
     }
 
+    import requests
+    from bs4 import BeautifulSoup
+
     try:
         import urllib3
         urllib3.disable_warnings()
@@ -171,6 +171,7 @@ def main():
 
     # 读取Excel
     print(f"\n[1/4] Reading Excel...")
+    import pandas as pd
     df = pd.read_excel('科协之声-用作转音频.xlsx')
 
     total = len(df)
@@ -3,34 +3,53 @@
 - 背景音乐音量30%
 - 音乐循环直到配音结束
 - 结尾渐出3秒
-- 支持批量处理
+- 支持批量处理（--jobs 多进程并行）
+- BGM按文章编号固定选择，重复运行只处理有变化的文章
+- 可选响度归一化（--loudnorm），使用缓存的响度统计，一遍混音完成
+- 可选输出编码方案（--output-profile），如语音用的单声道MP3/Opus/AAC
+- 可选性能剖析（--profile），按阶段统计CPU热点、Python内存峰值和ffmpeg峰值内存
 """
 
 import subprocess
-import random
+import json
 import os
 import sys
 import io
+import time
+from contextlib import redirect_stdout
 from pathlib import Path
 
+from skills.audio_probe import (get_audio_duration, save_probe_cache, file_digest, get_loudness,
+                                normalized_levels, DEFAULT_LOUDNESS_TARGETS)
+from skills.encode_profiles import ENCODE_PROFILES, DEFAULT_PROFILE, output_suffix
+from skills.encode_profiles import encode_args as profile_encode_args
+from skills.run_state import partial_path, commit_partial, discard_partial
+from skills.profiling import PROFILE, profile_enable, profile_call, profile_summary, save_profile
+from skills.audio_mix import (prepare_bgm_bed, bed_input_args, mix_with_bed_numpy, compare_pcm,
+                              mix_within_tolerance, pick_bgm, article_id_from_name, amix_filter,
+                              DEFAULT_SAMPLE_RATE, DEFAULT_CHANNELS)
+
+# 默认输出编码（其他方案见 skills/encode_profiles.py，用 --output-profile 选择）
+MP3_ENCODE_ARGS = profile_encode_args(DEFAULT_PROFILE)
+
+# 输出清单：记录每篇配音的 (配音哈希, BGM哈希, 混音参数) → 输出文件
+MANIFEST_NAME = '.mix_manifest.json'
+
 # 设置UTF-8输出
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
-def get_audio_duration(file_path):
-    """获取音频时长（秒）"""
-    cmd = [
-        'ffprobe', '-v', 'error',
-        '-show_entries', 'format=duration',
-        '-of', 'default=noprint_wrappers=1:nokey=1',
-        str(file_path)
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    return float(result.stdout.strip())
-
-def mix_voice_with_bgm(voice_file, bgm_file, output_file, bgm_volume=0.3, fade_out_duration=3):
+def mix_voice_with_bgm(voice_file, bgm_file, output_file, bgm_volume=0.3, fade_out_duration=3,
+                       engine='ffmpeg', encode_args=None, threads=None, loudnorm=None):
     """
     混合配音和背景音乐
+    engine: 'ffmpeg' 滤镜图混音，'numpy' 分块混音（内存占用固定）
+    threads: 限制单个ffmpeg的线程数（并行批处理时避免超额占用CPU）
+    loudnorm: 响度目标（如 DEFAULT_LOUDNESS_TARGETS），按缓存的测量结果调整配音增益和BGM音量
+    输出先写 .part 再改名，失败或中断时删掉 .part，不留下半个文件
     """
+    if encode_args is None:
+        encode_args = MP3_ENCODE_ARGS
+
     print(f"[*] Processing: {Path(voice_file).name}")
 
     # 获取配音时长
@@ -41,37 +60,79 @@ def mix_voice_with_bgm(voice_file, bgm_file, output_file, bgm_volume=0.3, fade_o
     bgm_duration = get_audio_duration(bgm_file)
     print(f"    BGM duration: {bgm_duration:.2f}s")
 
-    # 计算循环次数
-    loop_count = int(voice_duration / bgm_duration) + 1
-    print(f"    BGM will loop {loop_count} times")
+    # 响度归一化：BGM只测量一次，配音通常在合成时已测量，都从缓存读取
+    voice_gain_db = 0.0
+    if loudnorm:
+        voice_gain_db, bgm_volume = normalized_levels(get_loudness(voice_file), get_loudness(bgm_file),
+                                                      loudnorm, bgm_volume)
+        print(f"    Loudness: voice {voice_gain_db:+.2f} dB, BGM volume {bgm_volume*100:.1f}%")
+
+    # BGM底乐：已按音量和采样率预处理的PCM，循环读取，不再解码BGM
+    try:
+        bed_path, bed_meta = prepare_bgm_bed(bgm_file, bgm_volume, DEFAULT_SAMPLE_RATE, DEFAULT_CHANNELS)
+    except RuntimeError as e:
+        print(f"    [!] Error: {e}")
+        return False
+
+    if engine == 'numpy':
+        print(f"    Mixing with BGM at {bgm_volume*100}% volume (numpy, chunked)...")
+        try:
+            mix_with_bed_numpy(voice_file, bed_path, bed_meta, partial_path(output_file), voice_duration,
+                               fade_out_duration, encode_args, voice_gain_db=voice_gain_db,
+                               normalize=not loudnorm)
+        except ImportError:
+            discard_partial(output_file)
+            print(f"    [!] numpy not installed - use --engine ffmpeg")
+            return False
+        except RuntimeError as e:
+            discard_partial(output_file)
+            print(f"    [!] Error: {str(e)[:200]}")
+            return False
+        except BaseException:
+            discard_partial(output_file)
+            raise
+        commit_partial(output_file)
+
+        size_mb = os.path.getsize(output_file) / (1024 * 1024)
+        print(f"    [OK] Output: {size_mb:.2f} MB")
+        return True
 
     # 构建ffmpeg滤波器
-    filter_complex = f"[1:a]aloop=loop=-1:size=2e+09[bgm_loop];"
-    filter_complex += f"[bgm_loop]atrim=0:{voice_duration}[bgm_trim];"
-    filter_complex += f"[bgm_trim]volume={bgm_volume}[bgm_vol];"
-    filter_complex += f"[bgm_vol]afade=t=out:st={voice_duration-fade_out_duration}:d={fade_out_duration}[bgm_out];"
-    filter_complex += "[0:a][bgm_out]amix=inputs=2:duration=first:dropout_transition=2[outa]"
-
-    # ffmpeg命令
+    voice_gain = f"volume={voice_gain_db}dB," if voice_gain_db else ""
+    filter_complex = f"[0:a]{voice_gain}aformat=sample_rates={DEFAULT_SAMPLE_RATE}:channel_layouts=stereo[voice];"
+    filter_complex += f"[1:a]atrim=0:{voice_duration}[bgm_trim];"
+    filter_complex += f"[bgm_trim]afade=t=out:st={voice_duration-fade_out_duration}:d={fade_out_duration}[bgm_out];"
+    # 响度归一化时关闭 amix 的自动衰减（默认两路各降一半，成品会比目标低约6dB）
+    filter_complex += amix_filter(normalize=not loudnorm)
+
+    # ffmpeg命令（-filter_complex_threads 是全局选项；-threads 放在输出位置才限制编码器，
+    # 放在 -i 前只作用于该输入的解码）
     cmd = [
         'ffmpeg', '-y',
+        *(['-filter_complex_threads', str(threads)] if threads else []),
         '-i', str(voice_file),
-        '-i', str(bgm_file),
+        *bed_input_args(bed_path, bed_meta),
         '-filter_complex', filter_complex,
         '-map', '[outa]',
-        '-c:a', 'libmp3lame',
-        '-b:a', '192k',
-        str(output_file)
+        *(['-threads', str(threads)] if threads else []),
+        *encode_args,
+        str(partial_path(output_file))
     ]
 
     print(f"    Mixing with BGM at {bgm_volume*100}% volume...")
     print(f"    Fade out: {fade_out_duration}s at the end")
 
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except BaseException:
+        discard_partial(output_file)
+        raise
 
     if result.returncode != 0:
+        discard_partial(output_file)
         print(f"    [!] Error: {result.stderr[:200]}")
         return False
+    commit_partial(output_file)
 
     # 获取输出文件大小
     size_mb = os.path.getsize(output_file) / (1024 * 1024)
@@ -79,8 +140,40 @@ def mix_voice_with_bgm(voice_file, bgm_file, output_file, bgm_volume=0.3, fade_o
 
     return True
 
-def batch_process():
-    """批量处理所有文章"""
+def load_manifest(output_folder):
+    """读取输出清单"""
+    try:
+        with open(output_folder / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(output_folder, manifest):
+    """原子写入输出清单"""
+    tmp_file = output_folder / f"{MANIFEST_NAME}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, output_folder / MANIFEST_NAME)
+
+def is_up_to_date(manifest, voice_name, key, output_folder):
+    """清单中的记录与当前输入一致，且输出文件存在"""
+    entry = manifest.get(voice_name)
+    if not entry or any(entry.get(k) != v for k, v in key.items()):
+        return False
+    return (output_folder / entry['output']).exists()
+
+def record_output(manifest, output_folder, voice_name, key, output_file):
+    """记录新输出；换了BGM的旧输出文件一并删除"""
+    old = manifest.get(voice_name)
+    if old and old['output'] != output_file.name:
+        old_file = output_folder / old['output']
+        if old_file.exists():
+            old_file.unlink()
+    manifest[voice_name] = dict(key, output=output_file.name)
+    save_manifest(output_folder, manifest)
+
+def batch_process(engine='ffmpeg', jobs=None, force=False, loudnorm=None, profile=DEFAULT_PROFILE):
+    """批量处理所有文章（jobs>1 时用进程池并行混音；force 忽略清单全部重混）"""
 
     print("="*70)
     print(" Batch Audio Mixer: Voice + BGM")
@@ -119,43 +212,155 @@ def batch_process():
     # 批量处理
     success_count = 0
     failed_count = 0
+    failures = []
+
+    # 对照清单，跳过配音、BGM、参数都没变的文章
+    manifest = load_manifest(output_folder)
+    encode = profile_encode_args(profile)
+    # 不含混音引擎：两种引擎的输出在容差内一致（见 --verify-engine），换引擎不必重新混音
+    params = {'bgm_volume': 0.3, 'fade_out_duration': 3, 'encode': encode, 'loudnorm': loudnorm}
+    bgm_hashes = {bgm_file.name: profile_call('hash', file_digest, bgm_file) for bgm_file in bgm_files}
 
-    for i, voice_file in enumerate(voice_files, 1):
-        # 随机选择BGM
-        bgm_file = random.choice(bgm_files)
+    tasks = []
+    keys = {}
+    for voice_file in voice_files:
+        # 按文章编号选择BGM，每次运行结果相同
+        bgm_file = pick_bgm(article_id_from_name(voice_file.name), bgm_files)
 
         # 输出文件
-        output_file = output_folder / f"{voice_file.stem}_with_bgm_{bgm_file.stem}.mp3"
+        output_file = output_folder / f"{voice_file.stem}_with_bgm_{bgm_file.stem}{output_suffix(profile)}"
 
-        print(f"[{i}/{len(voice_files)}] {voice_file.name}")
+        key = {'voice_hash': profile_call('hash', file_digest, voice_file), 'bgm_hash': bgm_hashes[bgm_file.name], 'params': params}
+        if not force and is_up_to_date(manifest, voice_file.name, key, output_folder):
+            continue
 
-        # 混合
-        success = mix_voice_with_bgm(
-            voice_file=voice_file,
-            bgm_file=bgm_file,
-            output_file=output_file,
-            bgm_volume=0.3,
-            fade_out_duration=3
-        )
+        keys[voice_file.name] = key
+        tasks.append((voice_file, bgm_file, output_file))
 
-        if success:
-            success_count += 1
-        else:
-            failed_count += 1
+    skipped_count = len(voice_files) - len(tasks)
+    print(f"[*] Up to date: {skipped_count}, to mix: {len(tasks)}")
+    print()
+    save_probe_cache()
 
+    if not tasks:
+        print("[OK] Nothing to do")
+        return
+
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(tasks)))
+    if PROFILE['enabled'] and jobs > 1:
+        # 剖析只能在本进程内进行
+        print("[*] Profiling: mixing sequentially in this process")
+        jobs = 1
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+
+    if jobs == 1:
+        for i, (voice_file, bgm_file, output_file) in enumerate(tasks, 1):
+            print(f"[{i}/{len(tasks)}] {voice_file.name}")
+
+            # 混合
+            success = profile_call(
+                'mix', mix_voice_with_bgm,
+                voice_file=voice_file,
+                bgm_file=bgm_file,
+                output_file=output_file,
+                bgm_volume=0.3,
+                fade_out_duration=3,
+                engine=engine,
+                encode_args=encode,
+                loudnorm=loudnorm
+            )
+
+            if success:
+                success_count += 1
+                record_output(manifest, output_folder, voice_file.name, keys[voice_file.name], output_file)
+            else:
+                failed_count += 1
+                failures.append((voice_file.name, 'see log above'))
+
+            print()
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        # 底乐和时长先在主进程准备好，子进程直接使用缓存
+        for bgm_file in bgm_files:
+            bgm_volume = 0.3
+            if loudnorm:
+                _, bgm_volume = normalized_levels(None, get_loudness(bgm_file), loudnorm, bgm_volume)
+            prepare_bgm_bed(bgm_file, bgm_volume, DEFAULT_SAMPLE_RATE, DEFAULT_CHANNELS)
+        for voice_file, _, _ in tasks:
+            get_audio_duration(voice_file)
+        save_probe_cache()
+
+        print(f"[*] Running {jobs} jobs x {threads} ffmpeg threads")
         print()
 
+        start = time.time()
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(mix_job, task, engine, threads, loudnorm, encode): task for task in tasks}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    name, success, elapsed, error = future.result()
+                except Exception as e:
+                    # 子进程异常退出（如被OOM杀掉）时进程池损坏，其余任务也会在这里报错，逐个记为失败
+                    name, success, elapsed, error = futures[future][0].name, False, 0.0, f"{type(e).__name__}: {e}"
+                if success:
+                    success_count += 1
+                    record_output(manifest, output_folder, name, keys[name], futures[future][2])
+                    print(f"[{done}/{len(tasks)}] OK     {name} ({elapsed:.1f}s)")
+                else:
+                    failed_count += 1
+                    failures.append((name, error))
+                    print(f"[{done}/{len(tasks)}] FAILED {name}: {error}")
+
+        print(f"\n[*] Wall time: {time.time() - start:.1f}s")
+
     # 总结
     print("="*70)
     print(f"SUMMARY")
     print("="*70)
     print(f"  Total:      {len(voice_files)}")
+    print(f"  Up to date: {skipped_count}")
     print(f"  Successful: {success_count}")
     print(f"  Failed:     {failed_count}")
     print(f"  Output:     {output_folder.absolute()}")
+    if failures:
+        print(f"  Failures:")
+        for name, error in failures:
+            print(f"    - {name}: {error}")
     print("="*70)
 
-def single_process(article_num="001"):
+def mix_job(task, engine, threads, loudnorm=None, encode=None):
+    """进程池任务：混合一篇，返回 (文件名, 是否成功, 耗时, 错误信息)"""
+
+    voice_file, bgm_file, output_file = task
+    start = time.time()
+    log = io.StringIO()
+
+    try:
+        with redirect_stdout(log):
+            success = mix_voice_with_bgm(
+                voice_file=voice_file,
+                bgm_file=bgm_file,
+                output_file=output_file,
+                bgm_volume=0.3,
+                fade_out_duration=3,
+                engine=engine,
+                encode_args=encode,
+                threads=threads,
+                loudnorm=loudnorm
+            )
+        errors = [line.strip() for line in log.getvalue().splitlines() if '[!]' in line]
+        error = errors[-1] if errors else ''
+    except Exception as e:
+        success = False
+        error = f"{type(e).__name__}: {e}"
+
+    # 子进程退出时不执行atexit，测得的响度在这里写回缓存
+    save_probe_cache()
+
+    return voice_file.name, success, time.time() - start, error
+
+def single_process(article_num="001", engine='ffmpeg', loudnorm=None, profile=DEFAULT_PROFILE):
     """单篇测试"""
 
     print("="*70)
@@ -191,8 +396,8 @@ def single_process(article_num="001"):
         print("[!] No BGM files found")
         return
 
-    # 随机选择
-    bgm_file = random.choice(bgm_files)
+    # 按文章编号选择
+    bgm_file = pick_bgm(article_id_from_name(voice_file.name), bgm_files)
 
     print(f"[*] Voice: {voice_file.name}")
     print(f"[*] BGM: {bgm_file.name}")
@@ -200,15 +405,19 @@ def single_process(article_num="001"):
     print()
 
     # 输出文件
-    output_file = output_folder / f"{voice_file.stem}_with_bgm_{bgm_file.stem}.mp3"
+    output_file = output_folder / f"{voice_file.stem}_with_bgm_{bgm_file.stem}{output_suffix(profile)}"
 
     # 混合
-    success = mix_voice_with_bgm(
+    success = profile_call(
+        'mix', mix_voice_with_bgm,
         voice_file=voice_file,
         bgm_file=bgm_file,
         output_file=output_file,
         bgm_volume=0.3,
-        fade_out_duration=3
+        fade_out_duration=3,
+        engine=engine,
+        encode_args=profile_encode_args(profile),
+        loudnorm=loudnorm
     )
 
     if success:
@@ -218,16 +427,70 @@ def single_process(article_num="001"):
         print(f"     {output_file.absolute()}")
         print("="*70)
 
+def verify_engines(article_num="001"):
+    """用同一篇配音分别跑ffmpeg和numpy引擎（无损输出），检查结果是否在容差内"""
+
+    import tempfile
+
+    voice_files = [vf for vf in Path("audio_output").glob(f"{article_num}_*.mp3") if "with_bgm" not in vf.name]
+    bgm_files = sorted(Path("素材").glob("*.mp3"))
+
+    if not voice_files or not bgm_files:
+        print("[!] Need a voice file and a BGM file to compare engines")
+        return False
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outputs = {}
+        for engine in ('ffmpeg', 'numpy'):
+            outputs[engine] = Path(tmp) / f"{engine}.wav"
+            if not mix_voice_with_bgm(voice_files[0], bgm_files[0], outputs[engine],
+                                      engine=engine, encode_args=['-c:a', 'pcm_s16le']):
+                return False
+
+        rms, peak, length_diff = compare_pcm(outputs['ffmpeg'], outputs['numpy'])
+
+    ok = mix_within_tolerance(rms, peak)
+    print("="*70)
+    print(f"  RMS difference:  {rms:.2e}")
+    print(f"  Peak difference: {peak:.2e}")
+    print(f"  Length mismatch: {length_diff} frames")
+    print(f"  Result:          {'OK' if ok else 'OUT OF TOLERANCE'}")
+    print("="*70)
+    return ok
+
 if __name__ == '__main__':
     import argparse
 
     parser = argparse.ArgumentParser(description='Audio mixer: voice + BGM')
     parser.add_argument('--batch', '-b', action='store_true', help='Batch process all articles')
     parser.add_argument('--article', '-a', type=str, default='001', help='Article number (default: 001)')
+    parser.add_argument('--engine', choices=['ffmpeg', 'numpy'], default='ffmpeg',
+                        help='Mixing engine (numpy streams in fixed-size chunks)')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(),
+                        help='Parallel mixing jobs for --batch (default: number of CPU cores)')
+    parser.add_argument('--force', action='store_true',
+                        help='Remix every file in --batch even if the manifest says it is up to date')
+    parser.add_argument('--output-profile', choices=list(ENCODE_PROFILES), default=DEFAULT_PROFILE,
+                        help=f'Output encode profile (default: {DEFAULT_PROFILE})')
+    parser.add_argument('--loudnorm', action='store_true',
+                        help='Normalize voice and BGM loudness (EBU R128) from cached measurements')
+    parser.add_argument('--profile', nargs='?', const='profile', metavar='DIR',
+                        help='Profile CPU, Python allocations and ffmpeg peak RSS per stage (default dir: profile)')
+    parser.add_argument('--verify-engine', action='store_true',
+                        help='Compare numpy and ffmpeg mixes of one article against the tolerance')
 
     args = parser.parse_args()
-
-    if args.batch:
-        batch_process()
+    loudnorm = DEFAULT_LOUDNESS_TARGETS if args.loudnorm else None
+    if args.profile:
+        profile_enable()
+
+    if args.verify_engine:
+        sys.exit(0 if verify_engines(args.article) else 1)
+    elif args.batch:
+        batch_process(args.engine, args.jobs, args.force, loudnorm, args.output_profile)
     else:
-        single_process(args.article)
+        single_process(args.article, args.engine, loudnorm, args.output_profile)
+
+    if args.profile:
+        print(profile_summary())
+        print(f"[OK] Profile report: {save_profile(args.profile)}")
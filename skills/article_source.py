@@ -0,0 +1,125 @@
+"""
+文章列表读取（逐行流式：不依赖pandas，也不把整张表读进内存）
+- Excel（.xlsx/.xlsm）：openpyxl 只读模式逐行读取
+- CSV：表头与Excel相同（UTF-8，兼容Excel导出时带的BOM）
+- JSONL：每行一个对象，键与表头相同（也接受 idx/title/url）
+- 只取 序号、图文名称、图文链接 三列，每篇文章产出一个 (序号, 标题, 链接) 元组；序号为空的行跳过，
+  序号不是数字的行记入 skipped 并跳过（不中断整批）
+- 不再支持旧版 .xls（openpyxl 不能读取），请另存为 .xlsx 或 CSV
+"""
+
+import csv
+import json
+from pathlib import Path
+
+COLUMNS = ('序号', '图文名称', '图文链接')
+
+# JSONL/CSV 中可用的英文键
+ALIASES = {'idx': '序号', 'title': '图文名称', 'url': '图文链接'}
+
+
+def is_blank(value):
+    """空单元格：None、空字符串或NaN"""
+    return value is None or value != value or str(value).strip() == ''
+
+
+def article_record(idx, title, url):
+    """一行 -> (序号, 标题, 链接)：序号转为整数，空标题用 Article_<序号>，空链接为''"""
+
+    idx = int(float(idx))
+    title = str(title).strip() if not is_blank(title) else f"Article_{idx}"
+    url = str(url).strip() if not is_blank(url) else ""
+    return idx, title, url
+
+
+def checked_record(values, row_no, path, skipped):
+    """article_record 的逐行版本：序号无效时打印警告、记入 skipped，返回None"""
+
+    try:
+        return article_record(*values)
+    except (TypeError, ValueError, OverflowError):
+        print(f"  [!] {path} row {row_no}: invalid 序号 {values[0]!r} - skipped")
+        if skipped is not None:
+            skipped.append((row_no, values[0]))
+        return None
+
+
+def column_positions(header, path):
+    """表头 -> 三个所需列的位置"""
+
+    names = [ALIASES.get(str(name).strip(), str(name).strip()) if name is not None else None for name in header or ()]
+    missing = [column for column in COLUMNS if column not in names]
+    if missing:
+        raise ValueError(f"{path}: missing column(s) {', '.join(missing)}")
+    return [names.index(column) for column in COLUMNS]
+
+
+def iter_excel(path, skipped=None):
+    """逐行读取Excel第一个工作表"""
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        positions = column_positions(next(rows, None), path)
+        for row_no, row in enumerate(rows, 2):
+            values = [row[i] if i < len(row) else None for i in positions]
+            if not is_blank(values[0]):
+                record = checked_record(values, row_no, path, skipped)
+                if record:
+                    yield record
+    finally:
+        workbook.close()
+
+
+def iter_csv(path, skipped=None):
+    """逐行读取CSV"""
+
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        rows = csv.reader(f)
+        positions = column_positions(next(rows, None), path)
+        for row_no, row in enumerate(rows, 2):
+            values = [row[i] if i < len(row) else None for i in positions]
+            if not is_blank(values[0]):
+                record = checked_record(values, row_no, path, skipped)
+                if record:
+                    yield record
+
+
+def iter_jsonl(path, skipped=None):
+    """逐行读取JSONL"""
+
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = {ALIASES.get(key, key): value for key, value in json.loads(line).items()}
+            except (ValueError, AttributeError) as e:
+                raise ValueError(f"{path}:{line_no}: not a JSON object") from e
+            if not is_blank(row.get('序号')):
+                record = checked_record([row.get(column) for column in COLUMNS], line_no, path, skipped)
+                if record:
+                    yield record
+
+
+READERS = {
+    '.xlsx': iter_excel,
+    '.xlsm': iter_excel,
+    '.csv': iter_csv,
+    '.jsonl': iter_jsonl,
+    '.ndjson': iter_jsonl,
+}
+
+
+def read_articles(path, skipped=None):
+    """按文件类型逐行读取文章列表，产出 (序号, 标题, 链接)；序号无效的行以 (行号, 序号) 记入 skipped"""
+
+    suffix = Path(path).suffix.lower()
+    if suffix == '.xls':
+        raise ValueError(f"{path}: legacy .xls is not supported - save it as .xlsx or CSV")
+    reader = READERS.get(suffix)
+    if reader is None:
+        raise ValueError(f"Unsupported article list: {path} (use {', '.join(READERS)})")
+    return reader(path, skipped)
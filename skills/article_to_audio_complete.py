@@ -3,27 +3,49 @@
 一站式解决：抓取文章 → 清理内容 → 生成配音 → 添加BGM
 
 功能：
-1. 从Excel读取文章列表
+1. 从Excel（或CSV/JSONL）逐行读取文章列表
 2. 抓取微信文章正文
 3. 彻底清理元数据
 4. 生成配音（Edge TTS）
 5. 添加背景音乐
 """
 
-import pandas as pd
 import asyncio
-import edge_tts
-import requests
-from bs4 import BeautifulSoup
 import re
 import os
 import sys
 import io
 import subprocess
-import random
+import hashlib
+import bisect
+import shutil
+import time
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
 from datetime import datetime
 
+from article_source import read_articles
+from audio_probe import (get_audio_duration, mp3_frame_offsets, parse_mp3_frame_header, save_probe_cache, store_probe,
+                         cached_probe, get_loudness, combine_loudness, normalized_levels, parse_loudnorm_output,
+                         LOUDNORM_ANALYZE_FILTER)
+from encode_profiles import ENCODE_PROFILES, get_profile, encode_args, output_suffix, profile_bitrate
+from audio_mix import (prepare_bgm_bed, bed_input_args, mix_with_bed_numpy, amix_filter, pick_bgm, article_id_from_name,
+                       open_bed, decode_pcm_array)
+from stage_pipeline import new_stage, run_pipeline, print_stage_metrics, start_loop_monitor, print_loop_report
+from run_state import (open_state, reset_state, save_run_args, load_run_args, mark_stage, completed_artifact,
+                       state_summary, atomic_write_text, partial_path, commit_partial, discard_partial)
+from stream_output import (start_hls_encoder, first_chunk_ready, new_stream, stream_feed, stream_finish,
+                           stream_abort, PLAYLIST_NAME)
+from telemetry import (counter_inc, timed, count_bytes, write_textfile, start_metrics_server, trace_enable, span,
+                       save_trace)
+from profiling import PROFILE, profile_enable, profile_call, profile_summary, save_profile, format_size
+from scheduling import (DEFAULT_COST_MODEL, COST_MODEL_FILE, predict_cost, lpt_order, simulate_makespan, audio_minutes,
+                        new_cost_samples, load_cost_model, save_cost_model, calibrate_cost_model)
+from work_queue import (open_queue, enqueue_jobs, claim_job, heartbeat, complete_job, queue_summary, queue_open,
+                        worker_name, QUEUE_FILE_NAME)
+
 # 设置UTF-8输出
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
@@ -33,6 +55,10 @@ sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 CONFIG = {
     # TTS语音
     'voice': 'zh-CN-XiaoxiaoNeural',
+    'rate': '+0%',                     # 语速，如 '+20%'
+
+    # 同时进行的TTS请求数（所有语音版本共享）
+    'tts_concurrency': 2,
 
     # 文章分段大小
     'segment_max_chars': 3000,
@@ -40,19 +66,88 @@ CONFIG = {
     # BGM设置
     'bgm_volume': 0.3,
     'fade_out_duration': 3,
+    'mix_sample_rate': 44100,          # 混音输出采样率（BGM底乐按此预处理）
+    'mix_channels': 2,
+    'mix_engine': 'ffmpeg',            # 'ffmpeg' 滤镜图，或 'numpy' 分块混音（内存固定）
+    'output_profile': 'mp3_192k',      # 成品编码方案，见 encode_profiles.py（语音可用 mp3_speech/opus_speech/aac_speech）
+
+    # 响度归一化：配音在合成时顺带测量，BGM测量一次，结果缓存；混音时一遍完成
+    'loudness_normalize': False,
+    'loudness_targets': {'voice_lufs': -16.0, 'bgm_lufs': -28.0, 'true_peak': -1.5},
 
-    # 延迟设置
+    # 延迟设置（只作用于抓取阶段的网络请求）
     'delay_between_articles': 5,
     'batch_size': 5,
     'delay_between_batches': 30,
 
+    # 流水线各阶段的并发数（抓取保持1个避免请求过快；TTS实际请求数另受 tts_concurrency 限制）
+    'stage_workers': {'fetch': 1, 'clean': 2, 'segment': 1, 'tts': 2, 'merge': 2, 'mix': 2},
+
+    # 处理顺序：'lpt' 按预测耗时从长到短（减少最后只剩一篇长文章在跑的长尾），'row' 按表格顺序
+    'schedule': 'lpt',
+    'cost_model': dict(DEFAULT_COST_MODEL),   # 耗时预测模型，见 scheduling.py
+
+    # 正文解析和清理是纯CPU操作（受GIL限制），放到常驻的进程池中多核并行；None=CPU核数，0=不用进程池（在线程中执行）
+    'clean_processes': None,
+
+    # 多worker模式（--worker）：多个进程/机器从同一个任务队列领取文章
+    'queue_lease_seconds': 120,        # 租约时长；worker每1/3租约时长续租一次，死掉后到期由别人接手
+    'queue_max_attempts': 3,           # 同一篇文章最多尝试次数
+    'queue_poll_seconds': 5,           # 队列暂时领不到任务（其他worker处理中）时的等待间隔
+    'queue_max_held': None,            # 同时持有的文章数上限；None=抓取并发+TTS并发（多余的留给其他worker）
+
+    # 运行指标（Prometheus格式，见 telemetry.py）：本地 /metrics 端口，或定时写入的textfile
+    'metrics_port': None,
+    'metrics_textfile': None,
+    'metrics_interval': 15,            # textfile 更新间隔（秒）
+    'trace_file': None,                # 时间线输出（Chrome trace JSON），见 --trace
+    'profile_folder': None,            # 性能剖析输出目录（各阶段CPU热点、内存峰值、ffmpeg峰值RSS），见 --profile
+    'loop_check_ms': None,             # 事件循环阻塞检查阈值（毫秒），见 --check-loop
+
     # 路径设置
     'bgm_folder': '素材',
     'output_voice_folder': 'audio_output',
     'output_text_folder': 'articles_for_review',
     'output_final_folder': 'audio_with_bgm',
+
+    # BGM方案（'default' 即上面的 bgm_folder/bgm_volume/fade_out_duration）
+    # 例：'soft': {'folder': '素材/soft', 'volume': 0.2, 'fade_out_duration': 5}
+    'bgm_profiles': {},
+
+    # 多版本渲染：抓取、清理、分段只做一次，每个版本单独合成和混音
+    # 例：[{'name': 'xiaoxiao', 'voice': 'zh-CN-XiaoxiaoNeural'},
+    #      {'name': 'yunxi_fast', 'voice': 'zh-CN-YunxiNeural', 'rate': '+20%', 'bgm': 'soft'}]
+    'render_variants': [],
+
+    # 流式输出：每段合成好就混音并切成HLS切片，长文章几秒内就能开始播放（需要numpy）
+    'stream_output': False,
+    'stream_chunk_seconds': 6,
+    'stream_first_segment_chars': 300,  # 第一段拆小，尽快产出第一个切片
+
+    # 一次编码：分段拼接和BGM混音在同一个ffmpeg进程中完成，不再生成中间文件
+    'one_shot_render': False,
+    'keep_voice_only': True,           # 一次编码时是否仍保存纯配音（流拷贝，不重新编码）
+
+    # 公共段落去重（多篇文章重复的开头、结尾、声明只合成一次）
+    'dedupe_boilerplate': False,
+    'boilerplate_min_chars': 20,       # 参与检测的最短段落
+    'boilerplate_min_articles': 2,     # 至少出现在几篇文章中
+    'tts_cache_folder': '.tts_cache',
+
+    # 短文章打包合成（多篇短文合成一次，再按语音边界切回单篇）
+    'pack_short_articles': False,
+    'pack_max_article_chars': 800,     # 不超过此长度的文章参与打包
+}
+
+# 本次运行的TTS字数统计
+TTS_STATS = {
+    'chars_synthesized': 0,
+    'chars_saved': 0,
 }
 
+# 本次运行的耗时/大小测量值（结束时用于校准预测模型）
+COST_SAMPLES = new_cost_samples()
+
 # ============================================
 # 文章清理功能
 # ============================================
@@ -158,95 +253,381 @@ def fix_text_formatting(text):
 # ============================================
 # 文章抓取
 # ============================================
-def fetch_wechat_article(url):
-    """抓取微信文章正文"""
+# 块级元素：提取时在前后加段落标记，最后变成空行（分段、公共段落检测都按空行切分）
+BLOCK_TAGS = ['p', 'section', 'div', 'blockquote', 'li', 'pre', 'table', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']
+PARAGRAPH_MARK = '\ue000'
+
+WECHAT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+}
 
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-    }
+
+def download_article_html(url):
+    """下载文章页面（GET取不到正文时再试POST），返回原始HTML字节，失败返回None"""
+
+    import requests
 
     try:
         import urllib3
         urllib3.disable_warnings()
+    except ImportError:
+        pass
 
-        for method in ['GET', 'POST']:
-            try:
-                if method == 'GET':
-                    response = requests.get(url, headers=headers, timeout=15, verify=False)
-                else:
-                    response = requests.post(url, headers=headers, timeout=15, verify=False)
+    html = None
+    for method in ['GET', 'POST']:
+        try:
+            if method == 'GET':
+                response = requests.get(url, headers=WECHAT_HEADERS, timeout=15, verify=False)
+            else:
+                counter_inc('retries_total', operation='fetch_post')
+                response = requests.post(url, headers=WECHAT_HEADERS, timeout=15, verify=False)
+        except Exception:
+            continue
 
-                if response.status_code != 200:
-                    continue
+        if response.status_code != 200:
+            continue
 
-                soup = BeautifulSoup(response.text, 'html.parser')
-                content_div = soup.find('div', class_='rich_media_content')
+        html = response.content
+        if b'rich_media_content' in html or b'js_content' in html:
+            return html
 
-                if not content_div:
-                    content_div = soup.find('div', id='js_content')
+    return html
 
-                if content_div:
-                    for tag in content_div.find_all(['script', 'style', 'iframe', 'noscript']):
-                        tag.decompose()
 
-                    text = content_div.get_text(separator='\n', strip=True)
-                    text = clean_article_content(text)
-                    text = fix_text_formatting(text)
+def extract_article_text(html):
+    """从页面HTML提取并清理正文，没有正文返回None"""
 
-                    return text.strip()
+    from bs4 import BeautifulSoup
 
-            except Exception:
-                continue
+    soup = BeautifulSoup(html, 'html.parser')
+    content_div = soup.find('div', class_='rich_media_content')
+
+    if not content_div:
+        content_div = soup.find('div', id='js_content')
 
+    if not content_div:
         return None
 
-    except Exception:
+    for tag in content_div.find_all(['script', 'style', 'iframe', 'noscript']):
+        tag.decompose()
+
+    for tag in content_div.find_all(BLOCK_TAGS):
+        tag.insert(0, PARAGRAPH_MARK)
+        tag.append(PARAGRAPH_MARK)
+
+    # 块之间为空行；块内（span、br）之间是单个换行，由 fix_text_formatting 合并
+    text = content_div.get_text(separator='\n', strip=True)
+    text = re.sub(f'\\s*{PARAGRAPH_MARK}[\\s{PARAGRAPH_MARK}]*', '\n\n', text).strip()
+    text = clean_article_content(text)
+    text = fix_text_formatting(text)
+
+    return text.strip()
+
+
+# ============================================
+# 正文提取进程池
+# ============================================
+_clean_pool = None
+
+
+def clean_pool_size():
+    """进程池大小（0表示不用进程池）"""
+    processes = CONFIG['clean_processes']
+    return (os.cpu_count() or 1) if processes is None else processes
+
+
+def warm_clean_worker():
+    """子进程启动时先解析一次，导入bs4和编译正则的开销不落在第一篇文章上"""
+    extract_article_text(b'<div id="js_content"><p>warm up</p></div>')
+
+
+def get_clean_pool():
+    """正文提取进程池（首次使用时创建，进程常驻复用）"""
+
+    global _clean_pool
+    if _clean_pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # spawn：父进程此时已有线程（事件循环的executor、数据库线程），fork可能带着被占用的锁
+        _clean_pool = ProcessPoolExecutor(max_workers=clean_pool_size(), mp_context=multiprocessing.get_context('spawn'),
+                                          initializer=warm_clean_worker)
+    return _clean_pool
+
+
+def shutdown_clean_pool():
+    """关闭进程池"""
+
+    global _clean_pool
+    if _clean_pool is not None:
+        _clean_pool.shutdown()
+        _clean_pool = None
+
+
+async def extract_text(html):
+    """页面HTML -> 清理后的正文：在进程池中执行；剖析模式或未启用进程池时在线程中执行"""
+
+    if clean_pool_size() <= 0 or PROFILE['enabled']:
+        return await run_blocking('clean', extract_article_text, html)
+    return await asyncio.get_running_loop().run_in_executor(get_clean_pool(), extract_article_text, html)
+
+
+# ============================================
+# 公共段落检测（跨文章去重）
+# ============================================
+def normalize_paragraph(para):
+    """归一化段落：去掉空白和标点，用于比较"""
+    return re.sub(r'[\s\W_]+', '', para)
+
+
+def detect_boilerplate(texts):
+    """找出在多篇文章中重复出现的段落
+
+    texts: {文章编号: 清理后的正文}
+    返回 {'keys': {段落指纹: 公共段落ID}, 'texts': {公共段落ID: 合成用文本},
+          'occurrences': {公共段落ID: 出现篇数}}
+    """
+
+    min_chars = CONFIG['boilerplate_min_chars']
+
+    # 归一化后完全相同的段落分组（只差标点和空白）；措辞不同的段落用别篇的音频会读错，不合并
+    groups = {}
+    for article_id, text in texts.items():
+        for para in text.split('\n\n'):
+            para = para.strip()
+            norm = normalize_paragraph(para)
+            if len(norm) < min_chars:
+                continue
+            digest = hashlib.sha1(norm.encode('utf-8')).hexdigest()
+            group = groups.setdefault(digest, {'texts': {}, 'articles': set()})
+            group['texts'][para] = group['texts'].get(para, 0) + 1
+            group['articles'].add(article_id)
+
+    boilerplate = {'keys': {}, 'texts': {}, 'occurrences': {}}
+    for digest, group in groups.items():
+        if len(group['articles']) < CONFIG['boilerplate_min_articles']:
+            continue
+        # 出现次数最多的写法作为合成文本
+        boilerplate['texts'][digest] = max(group['texts'], key=group['texts'].get)
+        boilerplate['occurrences'][digest] = len(group['articles'])
+        boilerplate['keys'][digest] = digest
+
+    return boilerplate
+
+
+def boilerplate_key(para, boilerplate):
+    """查询段落对应的公共段落ID，不是公共段落则返回None"""
+
+    if not boilerplate:
+        return None
+    norm = normalize_paragraph(para)
+    if len(norm) < CONFIG['boilerplate_min_chars']:
         return None
+    return boilerplate['keys'].get(hashlib.sha1(norm.encode('utf-8')).hexdigest())
+
+
+def plan_speech_pieces(text, boilerplate=None):
+    """把正文切成 [('text', 文本)] 和 [('cached', 公共段落ID)] 的序列"""
+
+    pieces = []
+    buffer = []
+
+    for para in text.split('\n\n'):
+        key = boilerplate_key(para, boilerplate)
+        if key is None:
+            buffer.append(para)
+            continue
+        if buffer and '\n\n'.join(buffer).strip():
+            pieces.append(('text', '\n\n'.join(buffer).strip()))
+        buffer = []
+        pieces.append(('cached', key))
+
+    if buffer and '\n\n'.join(buffer).strip():
+        pieces.append(('text', '\n\n'.join(buffer).strip()))
+
+    return pieces
+
+
+def boilerplate_cache_path(text, voice, rate):
+    """公共段落的缓存文件（按语音、语速、文本区分）"""
+    digest = hashlib.sha1(f"{voice}\n{rate}\n{text}".encode('utf-8')).hexdigest()[:16]
+    return Path(CONFIG['tts_cache_folder']) / f"boilerplate_{digest}.mp3"
+
+
+async def synthesize_cached_paragraph(text, voice, rate=None):
+    """合成公共段落（同一语音只合成一次，结果缓存到磁盘）"""
+
+    if rate is None:
+        rate = CONFIG['rate']
+
+    cache_path = boilerplate_cache_path(text, voice, rate)
+    cache_path.parent.mkdir(exist_ok=True)
+
+    # 同一段落可能被多个任务同时请求，只让一个去合成
+    lock = _cache_locks.setdefault(cache_path, asyncio.Lock())
+    async with lock:
+        if cache_path.exists():
+            TTS_STATS['chars_saved'] += len(text)
+            counter_inc('tts_chars_total', len(text), source='cache')
+            return cache_path
+
+        tmp_path = cache_path.with_suffix('.tmp.mp3')
+        loudness = await synthesize_to_file(text, tmp_path, voice, rate)
+        os.replace(tmp_path, cache_path)
+        if loudness:
+            store_probe(cache_path, 'loudness', loudness)
+
+    return cache_path
 
 
 # ============================================
 # 文本转音频
 # ============================================
-async def text_to_speech(text, output_path, voice=None):
-    """使用Edge TTS转换文本为语音"""
+_tts_semaphore = None
+_tts_busy_lanes = set()
+_cache_locks = {}
 
-    if voice is None:
-        voice = CONFIG['voice']
 
-    segments = split_text_into_segments(text, CONFIG['segment_max_chars'])
+def tts_slot():
+    """全局TTS并发限制（所有文章、所有语音版本共享）"""
+    global _tts_semaphore
+    if _tts_semaphore is None:
+        _tts_semaphore = asyncio.Semaphore(CONFIG['tts_concurrency'])
+    return _tts_semaphore
 
-    if len(segments) == 1:
-        try:
-            communicate = edge_tts.Communicate(text, voice)
-            await communicate.save(str(output_path))
-            return True
-        except Exception:
-            return False
-    else:
-        segment_files = []
-        temp_dir = output_path.parent / '.temp_segments'
-        temp_dir.mkdir(exist_ok=True)
 
+@asynccontextmanager
+async def tts_request(label, chars):
+    """占用一个TTS并发槽；时间线上每个槽一条泳道，排队等待的时长记在区间参数中"""
+
+    queued = time.perf_counter()
+    async with tts_slot():
+        lane = min(set(range(CONFIG['tts_concurrency'])) - _tts_busy_lanes)
+        _tts_busy_lanes.add(lane)
         try:
-            for i, segment in enumerate(segments):
-                seg_path = temp_dir / f"{output_path.stem}_part{i+1}.mp3"
-                communicate = edge_tts.Communicate(segment, voice)
-                await communicate.save(str(seg_path))
-                segment_files.append(seg_path)
+            started = time.perf_counter()
+            with span(label, f"tts slot {lane + 1}", chars=chars, queued_ms=round((started - queued) * 1000)):
+                yield
+            COST_SAMPLES['tts_seconds'] += time.perf_counter() - started
+            COST_SAMPLES['tts_chars'] += chars
+            COST_SAMPLES['tts_requests'] += 1
+        finally:
+            _tts_busy_lanes.discard(lane)
+
+
+async def synthesize_to_file(text, output_path, voice, rate=None):
+    """合成一段文本到文件（受全局并发限制），开启响度归一化时返回响度统计"""
+
+    if rate is None:
+        rate = CONFIG['rate']
+
+    import edge_tts
+
+    loudness = None
+    with timed('tts_segment_seconds'):
+        async with tts_request(Path(output_path).stem, len(text)):
+            communicate = edge_tts.Communicate(text, voice, rate=rate)
+            if CONFIG['loudness_normalize']:
+                loudness = await save_and_measure(communicate, output_path)
+            else:
+                await communicate.save(str(output_path))
 
-            merge_audio_files(segment_files, output_path)
+    TTS_STATS['chars_synthesized'] += len(text)
+    counter_inc('tts_chars_total', len(text), source='tts')
+    return loudness
 
-            for sf in segment_files:
-                sf.unlink()
 
-            return True
+async def save_and_measure(communicate, output_path):
+    """边接收TTS音频边写文件，同时送入ffmpeg测量响度（不用事后再解码一遍）"""
 
-        except Exception:
-            for sf in segment_files:
-                if sf.exists():
-                    sf.unlink()
-            return False
+    meter = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-hide_banner', '-nostats', '-f', 'mp3', '-i', 'pipe:0',
+        '-af', LOUDNORM_ANALYZE_FILTER, '-f', 'null', '-',
+        stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    try:
+        with open(output_path, 'wb') as f:
+            async for chunk in communicate.stream():
+                if chunk['type'] == 'audio':
+                    f.write(chunk['data'])
+                    meter.stdin.write(chunk['data'])
+                    await meter.stdin.drain()
+        meter.stdin.close()
+        stderr = await meter.stderr.read()
+        await meter.wait()
+    except BaseException:
+        if meter.returncode is None:
+            meter.kill()
+            await meter.wait()
+        raise
+
+    loudness = parse_loudnorm_output(stderr.decode('utf-8', 'replace'))
+    if loudness:
+        store_probe(output_path, 'loudness', loudness)
+    return loudness
+
+
+def segments_loudness(segment_files):
+    """由各分段缓存的响度近似出整段配音的响度"""
+    return combine_loudness([(get_loudness(f), get_audio_duration(f)) for f in segment_files])
+
+
+def plan_tts_jobs(text, boilerplate=None):
+    """分段：公共段落走缓存，其余文本按长度分段，返回 [(kind, 文本)]"""
+
+    jobs = []
+    for kind, piece in plan_speech_pieces(text, boilerplate):
+        if kind == 'cached':
+            jobs.append(('cached', boilerplate['texts'][piece]))
+        else:
+            for segment in split_text_into_segments(piece, CONFIG['segment_max_chars']):
+                jobs.append(('text', segment))
+    return jobs
+
+
+def start_segment_tasks(output_path, voice, rate, jobs):
+    """为每个分段创建合成任务（立即并发开始），返回 (按顺序排列的任务, 需要清理的临时文件)"""
+
+    temp_dir = output_path.parent / '.temp_segments'
+    temp_dir.mkdir(exist_ok=True)
+    temp_files = [
+        temp_dir / f"{output_path.stem}_part{i+1}.mp3"
+        for i, (kind, _) in enumerate(jobs) if kind == 'text'
+    ]
+
+    async def synthesize_job(i, kind, segment):
+        if kind == 'cached':
+            return await synthesize_cached_paragraph(segment, voice, rate)
+        seg_path = temp_dir / f"{output_path.stem}_part{i+1}.mp3"
+        await synthesize_to_file(segment, seg_path, voice, rate)
+        return seg_path
+
+    # 各段并发提交，实际并发数由 tts_slot() 控制
+    tasks = [asyncio.ensure_future(synthesize_job(i, kind, segment)) for i, (kind, segment) in enumerate(jobs)]
+    return tasks, temp_files
+
+
+async def synthesize_segments(output_path, voice, rate, jobs):
+    """合成全部分段，返回 (按顺序排列的音频文件, 需要清理的临时文件)"""
+
+    tasks, temp_files = start_segment_tasks(output_path, voice, rate, jobs)
+    try:
+        segment_files = await asyncio.gather(*tasks)
+    except Exception:
+        for task in tasks:
+            task.cancel()
+        remove_files(temp_files)
+        raise
+
+    return list(segment_files), temp_files
+
+
+def remove_files(files):
+    """删除临时文件（忽略不存在的）"""
+    for f in files:
+        if f.exists():
+            f.unlink()
 
 
 def split_text_into_segments(text, max_chars=3000):
@@ -294,11 +675,28 @@ def split_text_into_segments(text, max_chars=3000):
     return segments
 
 
+def assemble_voice(segment_files, output_path):
+    """把合成好的分段组装成完整配音（单段直接复制，多段流拷贝拼接）"""
+
+    if len(segment_files) == 1:
+        shutil.copyfile(segment_files[0], output_path)
+        success = True
+    else:
+        success = merge_audio_files(segment_files, output_path)
+
+    if success and CONFIG['loudness_normalize']:
+        loudness = segments_loudness(segment_files)
+        if loudness:
+            store_probe(output_path, 'loudness', loudness)
+    return success
+
+
 def merge_audio_files(input_files, output_path):
     """合并音频文件"""
 
     try:
-        list_file = output_path.parent / 'file_list.txt'
+        # 列表文件按输出命名，多篇同时合并时不会互相覆盖
+        list_file = output_path.parent / f"{output_path.stem}_list.txt"
         with open(list_file, 'w', encoding='utf-8') as f:
             for input_file in input_files:
                 f.write(f"file '{input_file.absolute()}'\n")
@@ -320,43 +718,217 @@ def merge_audio_files(input_files, output_path):
         return False
 
 
+# ============================================
+# 短文章打包合成
+# ============================================
+def group_short_articles(articles):
+    """把短文章分组，每组总长度不超过一个TTS分段
+
+    articles: [(文章编号, 正文)]，返回 [[(文章编号, 正文), ...], ...]
+    """
+
+    groups = []
+    current = []
+    current_len = 0
+
+    for article_id, text in articles:
+        if len(text) > CONFIG['pack_max_article_chars']:
+            continue
+        if current and current_len + len(text) + 3 > CONFIG['segment_max_chars']:
+            groups.append(current)
+            current = []
+            current_len = 0
+        current.append((article_id, text))
+        current_len += len(text) + 3
+
+    if current:
+        groups.append(current)
+
+    # 只有一篇的组没必要打包
+    return [g for g in groups if len(g) > 1]
+
+
+async def synthesize_packed_articles(group, output_paths, voice=None, rate=None):
+    """一次请求合成一组短文章，再按语音边界切成单篇文件
+
+    group: [(文章编号, 正文)]，output_paths: {文章编号: 输出路径}
+    """
+
+    if voice is None:
+        voice = CONFIG['voice']
+    if rate is None:
+        rate = CONFIG['rate']
+
+    # 每篇以句末标点结尾，保证一个句子不会跨两篇文章
+    texts = []
+    for _, text in group:
+        text = text.strip()
+        if not text.endswith(('。', '！', '？')):
+            text += '。'
+        texts.append(text)
+
+    combined = ''
+    starts = []
+    for text in texts:
+        if combined:
+            combined += '\n\n'
+        starts.append(len(combined))
+        combined += text
+
+    import edge_tts
+
+    audio = bytearray()
+    boundaries = []
+    async with tts_request(f"packed {len(texts)} articles", len(combined)):
+        communicate = edge_tts.Communicate(combined, voice, rate=rate)
+        async for chunk in communicate.stream():
+            if chunk['type'] == 'audio':
+                audio.extend(chunk['data'])
+            elif chunk['type'] in ('WordBoundary', 'SentenceBoundary'):
+                boundaries.append((chunk['offset'], chunk['duration'], chunk['text']))
+
+    # 边界文本映射回字符位置，确定所属文章（offset单位为100纳秒）
+    spans = [[None, None] for _ in texts]
+    cursor = 0
+    for offset, duration, word in boundaries:
+        pos = combined.find(word, cursor)
+        if pos == -1:
+            continue
+        cursor = pos + len(word)
+        k = bisect.bisect_right(starts, pos) - 1
+        begin = offset / 1e7
+        end = (offset + duration) / 1e7
+        if spans[k][0] is None:
+            spans[k][0] = begin
+        spans[k][1] = end
+
+    if any(span[0] is None for span in spans):
+        raise RuntimeError('missing boundary events for packed articles')
+
+    # 逐帧解析整段音频是CPU操作，放到线程中
+    await run_blocking('pack', cut_packed_audio, audio, spans, group, output_paths)
+
+    TTS_STATS['chars_synthesized'] += len(combined)
+    counter_inc('tts_chars_total', len(combined), source='tts')
+    return True
+
+
+def cut_packed_audio(audio, spans, group, output_paths):
+    """按各篇的语音区间切分打包合成的音频，与逐篇合成一样先写 .part 再改名
+
+    整段只解码一次，按采样切开后逐篇重新编码：直接在帧边界切字节时，后一篇开头的帧可能引用
+    前一篇帧里的位存储（bit reservoir），解码出杂音。编码时顺带用loudnorm分析该篇的响度。
+    """
+
+    # 码率、声道与TTS输出相同
+    audio = bytes(audio)
+    frames = mp3_frame_offsets(audio)
+    if len(frames) < 2:
+        raise RuntimeError('packed audio has no MP3 frames')
+    header = audio[frames[0][0]:frames[0][0] + 4]
+    sample_rate = parse_mp3_frame_header(header)[2]
+    channels = 1 if header[3] >> 6 == 3 else 2
+    bitrate = max(8, round((frames[-1][0] - frames[0][0]) * 8 / frames[-1][1] / 8000) * 8)
+
+    decoded = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-f', 'mp3', '-i', 'pipe:0',
+         '-f', 's16le', '-ac', str(channels), '-ar', str(sample_rate), 'pipe:1'],
+        input=audio, capture_output=True
+    )
+    if decoded.returncode != 0:
+        raise RuntimeError(f"decoding packed audio failed: {decoded.stderr.decode('utf-8', 'replace')[-200:]}")
+    pcm = decoded.stdout
+    frame_bytes = 2 * channels
+
+    # 切点取相邻两篇之间静音的中点
+    cuts = [0]
+    for k in range(1, len(group)):
+        cuts.append(max(cuts[-1], round((spans[k - 1][1] + spans[k][0]) / 2 * sample_rate)))
+    cuts.append(len(pcm) // frame_bytes)
+
+    if CONFIG['loudness_normalize']:
+        filter_args = ['-filter_complex', f"[0:a]asplit[out][meter];[meter]{LOUDNORM_ANALYZE_FILTER},anullsink",
+                       '-map', '[out]']
+    else:
+        filter_args = []
+
+    for k, (article_id, text) in enumerate(group):
+        part_path = partial_path(output_paths[article_id])
+        result = subprocess.run(
+            ['ffmpeg', '-hide_banner', '-nostats', '-y',
+             '-f', 's16le', '-ac', str(channels), '-ar', str(sample_rate), '-i', 'pipe:0',
+             *filter_args, '-c:a', 'libmp3lame', '-b:a', f"{bitrate}k", '-f', 'mp3', str(part_path)],
+            input=pcm[cuts[k] * frame_bytes:cuts[k + 1] * frame_bytes], capture_output=True
+        )
+        stderr = result.stderr.decode('utf-8', 'replace')
+        if result.returncode != 0:
+            discard_partial(output_paths[article_id])
+            raise RuntimeError(f"encoding packed article {article_id} failed: {stderr[-200:]}")
+        # 响度随 .part 一起缓存，改名时转到正式文件（与逐篇合成相同，混音时直接用缓存）
+        if filter_args:
+            loudness = parse_loudnorm_output(stderr)
+            if loudness:
+                store_probe(part_path, 'loudness', loudness)
+        commit_artifact(output_paths[article_id])
+
+
 # ============================================
 # BGM混合
 # ============================================
-def get_audio_duration(file_path):
-    """获取音频时长"""
+def loudness_levels(voice_stats, bgm_file, bgm_volume):
+    """响度归一化后的 (配音增益dB, BGM音量)：BGM方案相对默认音量的差值叠加到BGM目标响度上
 
-    cmd = [
-        'ffprobe', '-v', 'error',
-        '-show_entries', 'format=duration',
-        '-of', 'default=noprint_wrappers=1:nokey=1',
-        str(file_path)
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    return float(result.stdout.strip())
+    混音时不再按输入数缩放（amix normalize=0），配音和BGM在成品中即为目标响度
+    """
+    return normalized_levels(voice_stats, get_loudness(bgm_file), CONFIG['loudness_targets'], bgm_volume,
+                             CONFIG['bgm_volume'])
 
 
-def mix_voice_with_bgm(voice_file, bgm_file, output_file):
+def mix_voice_with_bgm(voice_file, bgm_file, output_file, bgm_volume=None, fade_out_duration=None):
     """混合配音和背景音乐"""
 
+    if bgm_volume is None:
+        bgm_volume = CONFIG['bgm_volume']
+    if fade_out_duration is None:
+        fade_out_duration = CONFIG['fade_out_duration']
+
     voice_duration = get_audio_duration(voice_file)
-    bgm_duration = get_audio_duration(bgm_file)
-    loop_count = int(voice_duration / bgm_duration) + 1
 
-    filter_complex = f"[1:a]aloop=loop=-1:size=2e+09[bgm_loop];"
-    filter_complex += f"[bgm_loop]atrim=0:{voice_duration}[bgm_trim];"
-    filter_complex += f"[bgm_trim]volume={CONFIG['bgm_volume']}[bgm_vol];"
-    filter_complex += f"[bgm_vol]afade=t=out:st={voice_duration-CONFIG['fade_out_duration']}:d={CONFIG['fade_out_duration']}[bgm_out];"
-    filter_complex += "[0:a][bgm_out]amix=inputs=2:duration=first:dropout_transition=2[outa]"
+    # 响度归一化：使用缓存的测量结果，一遍混音完成
+    voice_gain_db = 0.0
+    if CONFIG['loudness_normalize']:
+        voice_gain_db, bgm_volume = loudness_levels(get_loudness(voice_file), bgm_file, bgm_volume)
+
+    # BGM底乐已按音量、采样率预处理，直接读取PCM
+    try:
+        bed_path, bed_meta = prepare_bgm_bed(bgm_file, bgm_volume, CONFIG['mix_sample_rate'], CONFIG['mix_channels'])
+    except RuntimeError as e:
+        print(f"    [!] Mixing warning: {e}")
+        return False
+
+    if CONFIG['mix_engine'] == 'numpy':
+        try:
+            return mix_with_bed_numpy(voice_file, bed_path, bed_meta, output_file, voice_duration,
+                                      fade_out_duration, encode_args(CONFIG['output_profile']),
+                                      voice_gain_db=voice_gain_db, normalize=not CONFIG['loudness_normalize'])
+        except ImportError:
+            print(f"    [!] numpy not installed - falling back to ffmpeg mixing")
+        except RuntimeError as e:
+            print(f"    [!] Mixing warning: {str(e)[:100]}")
+            return False
+
+    filter_complex = voice_format_filter('[0:a]', '[voice]', voice_gain_db)
+    filter_complex += f"[1:a]atrim=0:{voice_duration}[bgm_trim];"
+    filter_complex += f"[bgm_trim]afade=t=out:st={voice_duration-fade_out_duration}:d={fade_out_duration}[bgm_out];"
+    filter_complex += amix_filter(normalize=not CONFIG['loudness_normalize'])
 
     cmd = [
         'ffmpeg', '-y',
         '-i', str(voice_file),
-        '-i', str(bgm_file),
+        *bed_input_args(bed_path, bed_meta),
         '-filter_complex', filter_complex,
         '-map', '[outa]',
-        '-c:a', 'libmp3lame',
-        '-b:a', '192k',
+        *encode_args(CONFIG['output_profile']),
         str(output_file)
     ]
 
@@ -369,82 +941,871 @@ def mix_voice_with_bgm(voice_file, bgm_file, output_file):
     return True
 
 
+def voice_format_filter(source, label, gain_db=0.0):
+    """把配音转换到混音采样率/声道，与BGM底乐一致（可附加响度增益）"""
+    layout = 'mono' if CONFIG['mix_channels'] == 1 else 'stereo'
+    gain = f"volume={gain_db}dB," if gain_db else ""
+    return f"{source}{gain}aformat=sample_rates={CONFIG['mix_sample_rate']}:channel_layouts={layout}{label};"
+
+
+def render_final_mix(segment_files, bgm_file, output_file, voice_file=None, bgm_volume=None, fade_out_duration=None):
+    """一次编码：拼接分段 → 与循环BGM混音 → 渐出
+
+    分段由concat demuxer直接送入滤镜图，BGM底乐用 -stream_loop 循环；
+    voice_file 不为空时，同一进程内把拼接后的配音流拷贝保存一份（不重新编码）。
+    """
+
+    if bgm_volume is None:
+        bgm_volume = CONFIG['bgm_volume']
+    if fade_out_duration is None:
+        fade_out_duration = CONFIG['fade_out_duration']
+
+    voice_duration = sum(get_audio_duration(f) for f in segment_files)
+
+    # 配音还没生成，用各分段合成时测得的响度合成整段统计
+    voice_gain_db = 0.0
+    voice_loudness = None
+    if CONFIG['loudness_normalize']:
+        voice_loudness = segments_loudness(segment_files)
+        voice_gain_db, bgm_volume = loudness_levels(voice_loudness, bgm_file, bgm_volume)
+
+    try:
+        bed_path, bed_meta = prepare_bgm_bed(bgm_file, bgm_volume, CONFIG['mix_sample_rate'], CONFIG['mix_channels'])
+    except RuntimeError as e:
+        print(f"    [!] Render warning: {e}")
+        return False
+
+    list_file = output_file.parent / f"{output_file.stem}_segments.txt"
+    with open(list_file, 'w', encoding='utf-8') as f:
+        for segment_file in segment_files:
+            f.write(f"file '{Path(segment_file).absolute()}'\n")
+
+    filter_complex = voice_format_filter('[0:a]', '[voice]', voice_gain_db)
+    filter_complex += f"[1:a]atrim=0:{voice_duration},"
+    filter_complex += f"afade=t=out:st={voice_duration-fade_out_duration}:d={fade_out_duration}[bgm_out];"
+    filter_complex += amix_filter(normalize=not CONFIG['loudness_normalize'])
+
+    cmd = [
+        'ffmpeg', '-y',
+        '-f', 'concat', '-safe', '0', '-i', str(list_file),
+        *bed_input_args(bed_path, bed_meta),
+        '-filter_complex', filter_complex,
+        '-map', '[outa]',
+        *encode_args(CONFIG['output_profile']),
+        str(output_file)
+    ]
+    if voice_file is not None:
+        cmd += ['-map', '0:a', '-c:a', 'copy', str(voice_file)]
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    finally:
+        list_file.unlink()
+
+    if result.returncode != 0:
+        print(f"    [!] Render warning: {result.stderr[:100] if result.stderr else 'Unknown'}")
+        return False
+
+    if voice_file is not None and voice_loudness:
+        store_probe(voice_file, 'loudness', voice_loudness)
+
+    return True
+
+
 # ============================================
 # 主处理函数
 # ============================================
-async def process_article(row, voice_folder, output_folder, index, total):
-    """处理单篇文章"""
+def resolve_bgm_profile(name):
+    """BGM方案名 → {'folder', 'volume', 'fade_out_duration'}，不加BGM返回None"""
+
+    if not name or name == 'none' or not CONFIG['bgm_folder']:
+        return None
 
-    idx = int(row['序号'])
-    title = str(row['图文名称']) if pd.notna(row['图文名称']) else f"Article_{idx}"
-    url = str(row['图文链接']) if pd.notna(row['图文链接']) else ""
+    profile = {
+        'folder': CONFIG['bgm_folder'],
+        'volume': CONFIG['bgm_volume'],
+        'fade_out_duration': CONFIG['fade_out_duration'],
+    }
+    if name != 'default':
+        if name not in CONFIG['bgm_profiles']:
+            raise ValueError(f"Unknown BGM profile: {name}")
+        profile.update(CONFIG['bgm_profiles'][name])
+    return profile
 
-    print(f"\n[{index}/{total}] Article {idx}: {title[:50]}...")
 
-    if not url or 'http' not in url:
-        print(f"  [!] No valid URL - SKIPPED")
-        return False
+def parse_variant_spec(spec):
+    """解析命令行版本参数 NAME=VOICE[:RATE[:BGM]]"""
 
-    # 1. 抓取文章
-    print(f"  [1/4] Fetching article...")
-    content = fetch_wechat_article(url)
+    name, _, rest = spec.partition('=')
+    parts = rest.split(':')
+    variant = {'name': name, 'voice': parts[0]}
+    if len(parts) > 1 and parts[1]:
+        variant['rate'] = parts[1]
+    if len(parts) > 2 and parts[2]:
+        variant['bgm'] = parts[2]
+    return variant
 
-    if not content:
-        print(f"  [!] Failed to fetch - SKIPPED")
-        return False
 
-    print(f"      Length: {len(content)} chars")
+def resolve_variants():
+    """展开渲染矩阵；未配置时只有一个默认版本（name为None，输出到原目录）"""
+
+    specs = CONFIG['render_variants'] or [{'name': None}]
+    variants = []
+    for spec in specs:
+        variants.append({
+            'name': spec.get('name'),
+            'voice': spec.get('voice') or CONFIG['voice'],
+            'rate': spec.get('rate') or CONFIG['rate'],
+            'bgm': resolve_bgm_profile(spec.get('bgm', 'default')),
+        })
+    return variants
+
+
+def variant_folder(folder, variant):
+    """版本的输出目录：命名版本放在子目录中"""
+
+    if variant['name']:
+        folder = folder / variant['name']
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder
+
+
+def new_item(index, idx, title, url):
+    """流水线中的一篇文章（index为本次处理中的顺序号）"""
+    return {'index': index, 'idx': idx, 'title': title, 'url': url, 'base_name': article_base_name(idx, title)}
+
+
+def article_base_name(idx, title):
+    """输出文件名前缀：序号_标题"""
+    safe_title = re.sub(r'[<>:"/\\|?*]', '_', title)[:50]
+    return f"{idx:03d}_{safe_title}"
+
+
+# ============================================
+# 流水线各阶段：fetch → clean → segment → tts → merge → mix
+# ============================================
+async def db_call(ctx, func, *args):
+    """数据库操作放到专用的单线程中执行：不阻塞事件循环，同一连接也不会被并发使用"""
+    return await asyncio.get_running_loop().run_in_executor(ctx['db'], func, *args)
+
+
+async def state_done(ctx, item, stage):
+    """续跑：该阶段已完成且产物仍在则返回产物路径（无产物的阶段返回''），否则None"""
+    if not ctx['resume']:
+        return None
+    variant = item.get('variant')
+    return await db_call(ctx, completed_artifact, ctx['state'], item['base_name'], variant and variant['name'], stage)
+
+
+async def state_mark(ctx, item, stage, status, artifact=None, error=None):
+    """记录阶段状态"""
+    variant = item.get('variant')
+    await db_call(ctx, mark_stage, ctx['state'], item['base_name'], variant and variant['name'], stage, status,
+                  artifact, error)
+
+
+def commit_artifact(path):
+    """.part 临时文件改为正式文件，已测得的响度随文件一起保留"""
+    loudness = cached_probe(partial_path(path), 'loudness')
+    commit_partial(path)
+    if loudness:
+        store_probe(path, 'loudness', loudness)
+
+
+async def record_voice_duration(item):
+    """校准预测模型：记录配音时长和对应的字数"""
+
+    seconds = await run_blocking('merge', get_audio_duration, item['voice_file'])
+    if seconds:
+        item['audio_seconds'] = seconds
+        COST_SAMPLES['audio_seconds'] += seconds
+        COST_SAMPLES['audio_chars'] += len(item['content'])
+        COST_SAMPLES['voice_bytes'] += item['voice_file'].stat().st_size
+
+
+def item_tag(item):
+    """文章编号（和版本名）"""
+    variant = item.get('variant')
+    return f"{item['idx']}/{variant['name']}" if variant and variant['name'] else f"{item['idx']}"
+
+
+def log(item, message):
+    """带文章编号（和版本名）的日志，各阶段并发时便于区分"""
+    print(f"  [{item_tag(item)}] {message}")
+
+
+async def run_blocking(stage, func, *args):
+    """阻塞操作放到线程中执行；剖析模式下记入该阶段的CPU热点和内存"""
+    return await asyncio.to_thread(profile_call, stage, func, *args)
+
+
+def item_span(item, name, **args):
+    """时间线：记在该文章（版本）的泳道上"""
+    return span(name, f"article {item_tag(item)}", **args)
+
 
-    # 2. 保存文本
-    text_folder = Path(CONFIG['output_text_folder'])
-    text_folder.mkdir(exist_ok=True)
-    text_file = text_folder / f"{idx:03d}_{re.sub(r'[<>:"/\\|?*]', '_', title)[:50]}.txt"
+async def pace_fetch(ctx):
+    """抓取限速：文章之间、每批之间等待，避免请求过快"""
 
-    with open(text_file, 'w', encoding='utf-8') as f:
-        f.write(content)
+    async with ctx['fetch_lock']:
+        fetched = ctx['fetched']
+        if fetched and fetched % CONFIG['batch_size'] == 0 and CONFIG['delay_between_batches'] > 0:
+            print(f"\n>>> Waiting {CONFIG['delay_between_batches']}s before next batch...")
+            await asyncio.sleep(CONFIG['delay_between_batches'])
+        elif fetched and CONFIG['delay_between_articles'] > 0:
+            await asyncio.sleep(CONFIG['delay_between_articles'])
+        ctx['fetched'] = fetched + 1
+
+
+def build_stages(ctx):
+    """构建各阶段（并发数见 CONFIG['stage_workers']）
+
+    ctx: voice_folder, output_folder, contents（预抓取正文）, boilerplate, variants, packed, fetch_lock, fetched,
+         state（运行状态数据库）, resume, resumed（续跑跳过的阶段数）
+    """
+
+    async def fetch(item):
+        # 续跑：正文已保存过就不再抓取
+        text_file = await state_done(ctx, item, 'clean')
+        if text_file:
+            item['content'] = text_file.read_text(encoding='utf-8')
+            item['text_saved'] = True
+            ctx['resumed'] += 1
+            return item
+
+        # 预抓取过的直接使用
+        content = ctx['contents'].get(item['idx'])
+        if content:
+            item['content'] = content
+            return item
+
+        if not item['url'] or 'http' not in item['url']:
+            raise RuntimeError('No valid URL')
+
+        with item_span(item, 'fetch wait'):
+            await pace_fetch(ctx)
+        with timed('fetch_seconds'), item_span(item, 'download'):
+            item['html'] = await run_blocking('fetch', download_article_html, item['url'])
+        if not item['html']:
+            raise RuntimeError('Failed to fetch')
+        return item
+
+    async def clean(item):
+        if 'content' not in item:
+            with timed('clean_seconds'):
+                item['content'] = await extract_text(item.pop('html'))
+        if not item['content']:
+            raise RuntimeError('No article content')
+
+        log(item, f"{item['title'][:40]} - {len(item['content'])} chars")
+        if item.get('text_saved'):
+            return item
+
+        text_folder = Path(CONFIG['output_text_folder'])
+        text_folder.mkdir(exist_ok=True)
+        text_file = text_folder / f"{item['base_name']}.txt"
+        await run_blocking('clean', atomic_write_text, text_file, item['content'])
+        count_bytes(text_file, 'text')
+        await state_mark(ctx, item, 'clean', 'done', text_file)
+        return item
+
+    async def segment(item):
+        # 分段只做一次，展开为每个版本一个任务
+        jobs = await run_blocking('segment', plan_tts_jobs, item['content'], ctx['boilerplate'])
+        packed = ctx['packed'].get(item['idx'], frozenset())
+        cost = predict_jobs_cost(jobs)
+        return [
+            dict(item, variant=variant, jobs=jobs, cost=cost, voice_ready=variant['name'] in packed,
+                 voice_file=variant_folder(ctx['voice_folder'], variant) / f"{item['base_name']}.mp3")
+            for variant in ctx['variants']
+        ]
+
+    async def tts(item):
+        variant = item['variant']
+        profile = variant['bgm']
+        item['bgm_files'] = list(Path(profile['folder']).glob("*.mp3")) if profile else []
+
+        # 续跑：成品或配音已完成的跳过合成
+        if await state_done(ctx, item, 'mix') is not None:
+            log(item, "Already finished in the previous run")
+            ctx['resumed'] += 1
+            item['done'] = True
+            return item
+        if await state_done(ctx, item, 'merge'):
+            log(item, "Voice already synthesized in the previous run")
+            ctx['resumed'] += 1
+            return item
+
+        if item['voice_ready'] and item['voice_file'].exists():
+            log(item, "Voice already synthesized in a packed request")
+            await record_voice_duration(item)
+            await state_mark(ctx, item, 'merge', 'done', item['voice_file'])
+            return item
+
+        # 流式输出：合成、混音、切片在同一阶段内交替进行
+        if CONFIG['stream_output']:
+            await state_mark(ctx, item, 'mix', 'running')
+            if not await render_variant_stream(variant, item['jobs'], item['base_name'], item['voice_file'],
+                                               ctx['output_folder'], item['bgm_files']):
+                raise RuntimeError('Streaming failed')
+            await state_mark(ctx, item, 'mix', 'done')
+            item['done'] = True
+            return item
+
+        await state_mark(ctx, item, 'tts', 'running')
+        log(item, f"Synthesizing {len(item['jobs'])} segments...")
+        try:
+            item['segment_files'], item['temp_files'] = await synthesize_segments(
+                item['voice_file'], variant['voice'], variant['rate'], item['jobs'])
+        except Exception as e:
+            raise RuntimeError(f"TTS failed: {str(e)[:100]}") from e
+        await state_mark(ctx, item, 'tts', 'done')
+        return item
+
+    async def merge(item):
+        if item.get('done') or 'segment_files' not in item:
+            return item
+        # 一次编码：拼接留到混音阶段，与BGM在同一个ffmpeg进程中完成
+        if CONFIG['one_shot_render'] and item['bgm_files']:
+            return item
+
+        # 先写 .part 再改名：中途崩溃不会留下半个配音文件；失败时删掉 .part
+        success = False
+        try:
+            with timed('merge_seconds'), item_span(item, 'ffmpeg merge', segments=len(item['segment_files'])):
+                success = await run_blocking('merge', assemble_voice, item.pop('segment_files'),
+                                             partial_path(item['voice_file']))
+        finally:
+            remove_files(item.pop('temp_files'))
+            if not success:
+                discard_partial(item['voice_file'])
+        if not success:
+            raise RuntimeError('Merge failed')
+        await run_blocking('merge', commit_artifact, item['voice_file'])
+        count_bytes(item['voice_file'], 'voice')
+        await record_voice_duration(item)
+        await state_mark(ctx, item, 'merge', 'done', item['voice_file'])
+
+        log(item, f"Voice: {item['voice_file'].stat().st_size / 1024 / 1024:.2f} MB")
+        return item
+
+    async def mix(item):
+        if item.get('done'):
+            return item
+
+        variant = item['variant']
+        profile = variant['bgm']
+        if profile is None:
+            log(item, "Done! (no BGM)")
+            await state_mark(ctx, item, 'mix', 'done')
+            return item
+        if not item['bgm_files']:
+            log(item, "No BGM found - skipping BGM")
+            await state_mark(ctx, item, 'mix', 'done')
+            return item
+
+        bgm_file = pick_bgm(article_id_from_name(item['base_name']), item['bgm_files'])
+        final_file = (variant_folder(ctx['output_folder'], variant) /
+                      f"{item['base_name']}_with_bgm_{bgm_file.stem}{output_suffix(CONFIG['output_profile'])}")
+
+        await state_mark(ctx, item, 'mix', 'running')
+        started = time.perf_counter()
+        if 'segment_files' in item:
+            # 一次编码路径：分段 + BGM 在一个ffmpeg进程里完成
+            keep_voice = partial_path(item['voice_file']) if CONFIG['keep_voice_only'] else None
+            success = False
+            try:
+                with timed('mix_seconds', mode='one_shot'), item_span(item, 'ffmpeg render'):
+                    success = await run_blocking('mix', render_final_mix, item['segment_files'], bgm_file,
+                                                 partial_path(final_file), keep_voice,
+                                                 profile['volume'], profile['fade_out_duration'])
+            finally:
+                remove_files(item.pop('temp_files'))
+                if not success:
+                    discard_partial(final_file)
+                    discard_partial(item['voice_file'])
+            if not success:
+                raise RuntimeError('Render failed')
+            if keep_voice:
+                await run_blocking('mix', commit_artifact, item['voice_file'])
+                count_bytes(item['voice_file'], 'voice')
+                await record_voice_duration(item)
+                await state_mark(ctx, item, 'merge', 'done', item['voice_file'])
+        else:
+            success = False
+            try:
+                with timed('mix_seconds', mode='mix'), item_span(item, 'ffmpeg mix'):
+                    success = await run_blocking('mix', mix_voice_with_bgm, item['voice_file'], bgm_file,
+                                                 partial_path(final_file), profile['volume'],
+                                                 profile['fade_out_duration'])
+            finally:
+                if not success:
+                    discard_partial(final_file)
+            if not success:
+                log(item, "[!] BGM mixing failed - voice saved without BGM")
+                await state_mark(ctx, item, 'mix', 'failed', error='BGM mixing failed')
+                return item
+
+        mix_seconds = time.perf_counter() - started
+        await run_blocking('mix', commit_artifact, final_file)
+        count_bytes(final_file, 'final')
+        if item.get('audio_seconds'):
+            COST_SAMPLES['mix_seconds'] += mix_seconds
+            COST_SAMPLES['mix_audio_seconds'] += item['audio_seconds']
+            COST_SAMPLES['final_bytes'] += final_file.stat().st_size
+        await state_mark(ctx, item, 'mix', 'done', final_file)
+        log(item, f"Done! Final: {final_file.stat().st_size / 1024 / 1024:.2f} MB")
+        return item
+
+    def traced(name, func):
+        # 时间线：每个阶段一个区间，同一文章相邻区间之间的空白即排队等待
+        async def run(item):
+            with item_span(item, name, title=item['title'][:40]):
+                return await func(item)
+        return run
+
+    workers = dict(CONFIG['stage_workers'])
+    # 进程池的每个进程都要有任务可做
+    workers['clean'] = max(workers.get('clean', 1), clean_pool_size())
+    # TTS阶段排队的任务中，预测耗时长的先开始
+    priorities = {'tts': lambda item: item['cost']} if CONFIG['schedule'] == 'lpt' else {}
+    return [
+        new_stage(name, traced(name, func), workers.get(name, 1), priority=priorities.get(name))
+        for name, func in [('fetch', fetch), ('clean', clean), ('segment', segment),
+                           ('tts', tts), ('merge', merge), ('mix', mix)]
+    ]
+
+
+def split_first_job(jobs, max_chars):
+    """把第一段文本拆出一个短段，让第一个切片尽快产出"""
 
-    # 3. 生成配音
-    print(f"  [2/4] Generating voice...")
-    voice_file = voice_folder / f"{idx:03d}_{re.sub(r'[<>:"/\\|?*]', '_', title)[:50]}.mp3"
+    if not jobs or jobs[0][0] != 'text' or len(jobs[0][1]) <= max_chars:
+        return jobs
 
-    success = await text_to_speech(content, voice_file)
+    pieces = split_text_into_segments(jobs[0][1], max_chars)
+    if len(pieces) == 1:
+        return jobs
+    rest = '\n\n'.join(pieces[1:])
+    return [('text', pieces[0])] + [('text', seg) for seg in split_text_into_segments(rest, CONFIG['segment_max_chars'])] + jobs[1:]
+
+
+def open_stream_bed(bgm_file, volume, sample_rate, channels):
+    """流式混音用的底乐（需要时解码BGM；已缓存则直接打开）
+
+    流式输出不做响度归一化：整段配音的响度要合成完才知道，按BGM方案的音量混音
+    """
+
+    bed_path, bed_meta = prepare_bgm_bed(bgm_file, volume, sample_rate, channels)
+    return open_bed(bed_path, bed_meta)
+
+
+async def render_variant_stream(variant, jobs, base_name, voice_file, output_folder, bgm_files):
+    """流式路径：分段按顺序完成一段就混音一段，HLS切片和播放列表随之更新"""
+
+    tag = f"[{variant['name']}] " if variant['name'] else ""
+    profile = variant['bgm']
+    sample_rate, channels = CONFIG['mix_sample_rate'], CONFIG['mix_channels']
+
+    bed = None
+    fade_out_duration = 0
+    suffix = '_hls'
+    if profile and bgm_files:
+        bgm_file = pick_bgm(article_id_from_name(base_name), bgm_files)
+        try:
+            bed = await run_blocking('stream', open_stream_bed, bgm_file, profile['volume'], sample_rate, channels)
+        except RuntimeError as e:
+            print(f"  [!] {tag}BGM unavailable ({e}) - streaming voice only")
+        else:
+            fade_out_duration = profile['fade_out_duration']
+            suffix = f"_with_bgm_{bgm_file.stem}_hls"
 
-    if not success:
-        print(f"  [!] TTS failed - SKIPPED")
+    stream_dir = variant_folder(output_folder, variant) / f"{base_name}{suffix}"
+    jobs = split_first_job(jobs, CONFIG['stream_first_segment_chars'])
+
+    print(f"  [2/4] {tag}Streaming {len(jobs)} segments to {stream_dir.name}/...")
+    start = time.time()
+    tasks, temp_files = start_segment_tasks(voice_file, variant['voice'], variant['rate'], jobs)
+    encoder = start_hls_encoder(stream_dir, sample_rate, channels,
+                                encode_args(CONFIG['output_profile']), CONFIG['stream_chunk_seconds'])
+    stream = new_stream(encoder, bed, int(fade_out_duration * sample_rate))
+
+    segment_files = []
+    first_chunk = None
+    try:
+        # 按顺序等待各段；后面的段在此期间继续并发合成
+        for task in tasks:
+            segment_file = await task
+            segment_files.append(segment_file)
+            voice = await run_blocking('stream', decode_pcm_array, segment_file, sample_rate, channels)
+            await run_blocking('stream', stream_feed, stream, voice)
+            if first_chunk is None and first_chunk_ready(stream_dir):
+                first_chunk = time.time() - start
+                print(f"      {tag}First chunk playable after {first_chunk:.1f}s")
+
+        print(f"  [3/4] {tag}Finishing stream...")
+        await run_blocking('stream', stream_finish, stream)
+    except Exception as e:
+        for task in tasks:
+            task.cancel()
+        stream_abort(stream)
+        remove_files(temp_files)
+        print(f"  [!] {tag}Streaming failed: {str(e)[:100]} - SKIPPED")
         return False
 
-    file_size = voice_file.stat().st_size / 1024
-    print(f"      Voice: {file_size/1024:.2f} MB")
+    # 纯配音仍然保存一份（流拷贝拼接，不重新编码）
+    if CONFIG['keep_voice_only']:
+        await run_blocking('stream', assemble_voice, segment_files, voice_file)
+    remove_files(temp_files)
 
-    # 4. 添加BGM
-    print(f"  [3/4] Mixing with BGM...")
-    bgm_folder = Path(CONFIG['bgm_folder'])
-    bgm_files = list(bgm_folder.glob("*.mp3"))
+    print(f"      {tag}Stream: {stream['pos'] / sample_rate:.1f}s audio in {time.time() - start:.1f}s")
+    print(f"  [4/4] {tag}Done! Playlist: {stream_dir / PLAYLIST_NAME}")
+    return True
 
-    if not bgm_files:
-        print(f"      No BGM found - skipping BGM")
-        return True
 
-    bgm_file = random.choice(bgm_files)
-    final_file = output_folder / f"{idx:03d}_{re.sub(r'[<>:"/\\|?*]', '_', title)[:50]}_with_bgm_{bgm_file.stem}.mp3"
+def prepare_bgm_beds(variants):
+    """BGM预处理：每个BGM按各版本的音量解码一次，生成底乐缓存"""
 
-    mix_success = mix_voice_with_bgm(voice_file, bgm_file, final_file)
+    prepared = 0
+    for profile in {id(v['bgm']): v['bgm'] for v in variants if v['bgm']}.values():
+        for bgm_file in sorted(Path(profile['folder']).glob("*.mp3")):
+            volume = profile['volume']
+            if CONFIG['loudness_normalize'] and not CONFIG['stream_output']:
+                _, volume = loudness_levels(None, bgm_file, volume)
+            try:
+                prepare_bgm_bed(bgm_file, volume, CONFIG['mix_sample_rate'], CONFIG['mix_channels'])
+                prepared += 1
+            except RuntimeError as e:
+                print(f"      [!] {bgm_file.name}: {e}")
+    return prepared
 
-    if mix_success:
-        final_size = final_file.stat().st_size / 1024
-        print(f"      Final: {final_size/1024:.2f} MB")
-        print(f"  [4/4] Done!")
-        return True
-    else:
-        print(f"  [!] BGM mixing failed - voice saved without BGM")
-        return True
+
+async def prefetch_articles(items):
+    """预先抓取全部文章正文（跨文章分析需要）"""
+
+    contents = {}
+    total = len(items)
+
+    for i, item in enumerate(items):
+        idx, url = item['idx'], item['url']
+        if not url or 'http' not in url:
+            continue
+
+        try:
+            html = await asyncio.to_thread(download_article_html, url)
+            content = await extract_text(html) if html else None
+        except Exception:
+            content = None
+        print(f"  [{i + 1}/{total}] Article {idx}: {len(content) if content else 'FAILED'} chars")
+        if content:
+            contents[idx] = content
+
+        if i < total - 1 and CONFIG['delay_between_articles'] > 0:
+            await asyncio.sleep(CONFIG['delay_between_articles'])
+
+    return contents
+
+
+# ============================================
+# 排程（按预测耗时）
+# ============================================
+def predict_jobs_cost(jobs):
+    """按分段结果预测一个版本的处理耗时（秒），走缓存的段落不计TTS"""
+
+    chars = sum(len(text) for _, text in jobs)
+    cached = sum(len(text) for kind, text in jobs if kind == 'cached')
+    segments = sum(1 for kind, _ in jobs if kind == 'text')
+    return predict_cost(chars, segments, cached, CONFIG['cost_model'], CONFIG['tts_concurrency'])
+
+
+def saved_article_text(item):
+    """之前运行保存的正文，没有返回None"""
+    text_file = Path(CONFIG['output_text_folder']) / f"{item['base_name']}.txt"
+    return text_file.read_text(encoding='utf-8') if text_file.exists() else None
+
+
+def fetch_release_times(needs_fetch):
+    """按抓取顺序和限速估算每篇文章最早可开始处理的时刻（不需抓取的为0）"""
+
+    releases = []
+    clock = 0.0
+    fetched = 0
+    for needed in needs_fetch:
+        if not needed:
+            releases.append(0.0)
+            continue
+        if fetched and fetched % CONFIG['batch_size'] == 0:
+            clock += CONFIG['delay_between_batches']
+        elif fetched:
+            clock += CONFIG['delay_between_articles']
+        clock += CONFIG['cost_model']['fetch_seconds']
+        fetched += 1
+        releases.append(clock)
+    return releases
+
+
+def schedule_items(ctx, items, texts=None):
+    """排定处理顺序，返回 (排序后的文章, 排程信息)
+
+    正文已知（预抓取的、之前运行保存的、texts 中给出的）的按分段结果预测耗时，未知的按已知文章的中位耗时估计；
+    续跑时已完成的版本不计
+    """
+
+    costs, needs_fetch, known = [], [], 0
+    for item in items:
+        content = (texts or {}).get(item['idx']) or ctx['contents'].get(item['idx']) or saved_article_text(item)
+        pending = len(ctx['variants'])
+        text_done = False
+        if ctx['resume']:
+            pending = sum(1 for variant in ctx['variants']
+                          if completed_artifact(ctx['state'], item['base_name'], variant['name'], 'mix') is None)
+            text_done = completed_artifact(ctx['state'], item['base_name'], None, 'clean') is not None
+        needs_fetch.append(item['idx'] not in ctx['contents'] and not text_done and pending > 0)
+        if content:
+            known += 1
+            costs.append(predict_jobs_cost(plan_tts_jobs(content, ctx['boilerplate'])) * pending)
+        else:
+            costs.append(None)
+
+    known_costs = sorted(cost for cost in costs if cost is not None)
+    guess = known_costs[len(known_costs) // 2] if known_costs else 0.0
+    costs = [guess if cost is None else cost for cost in costs]
+
+    order = lpt_order(costs) if CONFIG['schedule'] == 'lpt' else list(range(len(items)))
+    workers = CONFIG['stage_workers']['tts']
+
+    def makespan(indices):
+        releases = fetch_release_times([needs_fetch[i] for i in indices])
+        return simulate_makespan([(releases[k], costs[i]) for k, i in enumerate(indices)], workers)
+
+    schedule = {'known': known, 'total': len(items), 'predicted': makespan(order),
+                'row_order': makespan(range(len(items)))}
+    return [items[i] for i in order], schedule
+
+
+def format_duration(seconds):
+    """秒数 -> 如 2h05m / 5m30s"""
+    seconds = round(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+async def plan_articles(items, variants, voice_folder, output_folder, state, resume):
+    """预估（不合成任何内容）：正文用之前保存的或现抓取的，按预测模型估算耗时、TTS字数和磁盘占用"""
+
+    model = CONFIG['cost_model']
+    texts = {}
+    saved, fetched, failed = 0, 0, 0
+    new_text_bytes = 0
+
+    print(f"\n[4/5] Reading article text (nothing will be synthesized)...")
+    for item in items:
+        content = saved_article_text(item)
+        source = 'saved'
+        if content is None and item['url'] and 'http' in item['url']:
+            if fetched or failed:
+                await asyncio.sleep(CONFIG['delay_between_articles'])
+            source = 'fetched'
+            try:
+                html = await asyncio.to_thread(download_article_html, item['url'])
+                content = await extract_text(html) if html else None
+            except Exception:
+                content = None
+        if not content:
+            failed += 1
+            log(item, "no text - not counted")
+            continue
+        texts[item['idx']] = content
+        if source == 'saved':
+            saved += 1
+        else:
+            fetched += 1
+            new_text_bytes += len(content.encode('utf-8'))
+        log(item, f"{len(content)} chars ({source})")
+
+    boilerplate = detect_boilerplate(texts) if CONFIG['dedupe_boilerplate'] else None
+    prefetch = CONFIG['dedupe_boilerplate'] or CONFIG['pack_short_articles']
+    ctx = new_context(voice_folder, output_folder, variants, state, resume, texts if prefetch else None, boilerplate)
+    _, schedule = schedule_items(ctx, items, texts)
+    # 跨文章处理先抓取全部正文，再开始流水线
+    prefetch_seconds = fetch_release_times([True] * len(items))[-1] if prefetch and items else 0.0
+
+    # TTS字数：公共段落已在缓存中的、同一语音重复出现的不用再合成；续跑时已完成的单独统计，不计入命中率
+    total_chars, synth_chars, requests, already_done = 0, 0, 0, 0
+    minutes, voice_bytes, final_bytes = 0.0, 0.0, 0.0
+    final_per_minute = (model['final_bytes_per_minute'].get(CONFIG['output_profile'])
+                        or profile_bitrate(CONFIG['output_profile']) * 60 / 8)
+    seen = set()
+    for item in items:
+        content = texts.get(item['idx'])
+        if not content:
+            continue
+        jobs = plan_tts_jobs(content, boilerplate)
+        for variant in variants:
+            if resume and completed_artifact(state, item['base_name'], variant['name'], 'mix') is not None:
+                already_done += 1
+                continue
+            total_chars += sum(len(text) for _, text in jobs)
+            for kind, text in jobs:
+                key = (variant['voice'], variant['rate'], text)
+                if kind == 'cached' and (key in seen or boilerplate_cache_path(text, variant['voice'],
+                                                                                variant['rate']).exists()):
+                    continue
+                seen.add(key)
+                synth_chars += len(text)
+                requests += 1
+
+            article_minutes = audio_minutes(len(content), model)
+            minutes += article_minutes
+            if variant['bgm']:
+                final_bytes += article_minutes * final_per_minute
+            if not (CONFIG['one_shot_render'] and variant['bgm'] and not CONFIG['keep_voice_only']):
+                voice_bytes += article_minutes * model['voice_bytes_per_minute']
+
+    needed = new_text_bytes + voice_bytes + final_bytes
+    free = shutil.disk_usage(output_folder).free
+    hit_rate = (total_chars - synth_chars) / total_chars if total_chars else 0.0
+    order = 'longest first' if CONFIG['schedule'] == 'lpt' else 'row order'
+
+    print("\n" + "="*70)
+    print(f"[5/5] PLAN: {len(items)} articles x {len(variants)} variant(s)")
+    print("="*70)
+    print(f"  Article text:    {saved} saved, {fetched} fetched, {failed} unavailable")
+    print(f"  TTS:             {requests} requests, {synth_chars} of {total_chars} chars to synthesize "
+          f"(cache hit rate {hit_rate:.0%})")
+    if resume:
+        print(f"  Already done:    {already_done} article variant(s) finished in the previous run - skipped")
+    print(f"  Audio:           {minutes:.0f} minutes")
+    print(f"  Expected time:   {format_duration(prefetch_seconds + schedule['predicted'])} "
+          f"({order}, {CONFIG['stage_workers']['tts']} TTS workers, TTS concurrency {CONFIG['tts_concurrency']}; "
+          f"row order {format_duration(prefetch_seconds + schedule['row_order'])})")
+    print(f"  Disk needed:     {format_size(needed)} (text {format_size(new_text_bytes)}, voice {format_size(voice_bytes)}, "
+          f"final {format_size(final_bytes)}); free {format_size(free)}")
+    if needed > free:
+        print(f"  [!] Not enough free disk space for this run")
+    calibrated = model.get('calibrated_runs', 0)
+    print(f"  Model:           {f'calibrated over {calibrated} run(s)' if calibrated else 'defaults (not calibrated yet)'}"
+          f" - {COST_MODEL_FILE}")
+    print("="*70)
+
+
+# ============================================
+# 多worker任务队列
+# ============================================
+def queue_max_held():
+    """同时持有的文章数上限：够抓取和TTS都有活干即可，阶段队列里不囤积"""
+
+    if CONFIG['queue_max_held']:
+        return CONFIG['queue_max_held']
+    return CONFIG['stage_workers'].get('fetch', 1) + CONFIG['tts_concurrency']
+
+
+async def claim_articles(ctx):
+    """从任务队列逐篇领取文章（手里的文章数达到上限时先等一篇结束，不会多占）"""
+
+    conn, worker = ctx['queue'], ctx['worker']
+    while True:
+        await ctx['claim_slots'].acquire()
+        claimed = await db_call(ctx, claim_job, conn, worker, CONFIG['queue_lease_seconds'],
+                                CONFIG['queue_max_attempts'])
+        if claimed is None:
+            ctx['claim_slots'].release()
+            # 其他worker手里还有任务：等待，它们若死掉，租约到期后由这里接手
+            if not await db_call(ctx, queue_open, conn):
+                return
+            await asyncio.sleep(CONFIG['queue_poll_seconds'])
+            continue
+
+        job_key, item = claimed
+        ctx['held'][job_key] = []
+        ctx['claimed'] += 1
+        log(item, f"Claimed {item['title'][:40]}")
+        yield item
+
+
+async def keep_leases(ctx):
+    """定时为手里的文章续租；失去租约的文章由其他worker处理，这里的结果不再提交"""
+
+    while True:
+        await asyncio.sleep(CONFIG['queue_lease_seconds'] / 3)
+        if ctx['held']:
+            lost = await db_call(ctx, heartbeat, ctx['queue'], list(ctx['held']), ctx['worker'],
+                                 CONFIG['queue_lease_seconds'])
+            for job_key in lost:
+                print(f"  [!] Lease lost: {job_key}")
+                # 仍在流水线中，结束时才让出领取名额
+                ctx['lost'][job_key] = ctx['held'].pop(job_key)
+
+
+async def finish_claimed(ctx, item, ok, error=None):
+    """记录一个版本的结果；所有版本都结束（或分段前就失败）时让出领取名额并提交整篇文章"""
+
+    job_key = item['base_name']
+    held = ctx['held'] if job_key in ctx['held'] else ctx['lost']
+    results = held.get(job_key)
+    if results is None:
+        return
+    results.append(ok)
+    if 'variant' in item and len(results) < len(ctx['variants']):
+        return
+    del held[job_key]
+    ctx['claim_slots'].release()
+    if held is ctx['lost']:
+        return
+    await db_call(ctx, complete_job, ctx['queue'], item['base_name'], ctx['worker'], all(results), error,
+                  CONFIG['queue_max_attempts'])
+
+
+async def write_metrics_periodically(path):
+    """定时把运行指标写入textfile"""
+
+    while True:
+        await asyncio.to_thread(write_textfile, path)
+        await asyncio.sleep(CONFIG['metrics_interval'])
+
+
+def new_context(voice_folder, output_folder, variants, state, resume=False, contents=None, boilerplate=None,
+                packed=None):
+    """流水线各阶段共用的运行上下文"""
+
+    return {
+        'voice_folder': voice_folder,
+        'output_folder': output_folder,
+        'contents': contents or {},
+        'boilerplate': boilerplate,
+        'variants': variants,
+        'packed': packed or {},
+        'fetch_lock': asyncio.Lock(),
+        'fetched': 0,
+        'state': state,
+        # 状态库/队列库的读写都在这一个线程中进行
+        'db': ThreadPoolExecutor(max_workers=1, thread_name_prefix='state-db'),
+        'resume': resume,
+        'resumed': 0,
+    }
+
+
+def new_error_handler(ctx, outcomes, worker=False):
+    """阶段出错时的处理：记录日志、指标和失败状态"""
+
+    async def on_error(stage, item, error):
+        log(item, f"[!] {stage}: {error} - SKIPPED")
+        counter_inc('items_total', result='failed')
+        counter_inc('failures_total', stage=stage, error=type(error.__cause__ or error).__name__)
+        await state_mark(ctx, item, stage, 'failed', error=str(error)[:200])
+        outcomes.setdefault(item['index'], []).append(False)
+        if worker:
+            await finish_claimed(ctx, item, False, f"{stage}: {str(error)[:200]}")
+
+    return on_error
 
 
 # ============================================
 # 主函数
 # ============================================
-async def main(excel_path, test_mode=False, start_index=1, end_index=None, no_bgm=False):
-    """主函数"""
+async def main(excel_path, test_mode=False, start_index=1, end_index=None, no_bgm=False, resume=False,
+               worker=False, queue_path=None, plan=False):
+    """主函数（resume=True 时从上次中断处继续；worker=True 时从共享任务队列领取文章；plan=True 时只做预估）"""
 
     print("="*70)
     print(" Article to Audio Converter v1.0")
@@ -458,24 +1819,51 @@ async def main(excel_path, test_mode=False, start_index=1, end_index=None, no_bg
     output_folder = Path(CONFIG['output_final_folder'])
     output_folder.mkdir(exist_ok=True)
 
-    # 读取Excel
-    print(f"\n[1/5] Reading Excel: {excel_path}")
-    df = pd.read_excel(excel_path)
-
-    total = len(df)
+    # 运行状态：续跑时沿用上次的文章范围，已完成的阶段直接跳过
+    # 多worker共用状态库且不清空：接手别人的文章时，已完成的阶段同样跳过
+    state = open_state(output_folder, shared=worker)
+    if worker:
+        resume = True
+    elif resume:
+        previous = load_run_args(state)
+        if previous and start_index == 1 and end_index is None and not test_mode:
+            test_mode = previous['test_mode']
+            start_index = previous['start_index']
+            end_index = previous['end_index']
+        print(f"\n>>> Resuming previous run: {state_summary(state) or 'no saved state'}")
+    elif not plan:
+        reset_state(state)
+        save_run_args(state, {'excel': str(excel_path), 'test_mode': test_mode,
+                              'start_index': start_index, 'end_index': end_index})
+
+    # 逐行读取文章列表（Excel/CSV/JSONL）
+    print(f"\n[1/5] Reading articles: {excel_path}")
+    skipped = []
+    records = read_articles(excel_path, skipped)
 
     if test_mode:
-        df = df.head(3)
-        total = 3
+        records = itertools.islice(records, 3)
         print(f"  TEST MODE: Processing first 3 articles only")
     elif start_index > 1 or end_index is not None:
-        if end_index is None:
-            end_index = total
-        df = df.iloc[start_index-1:end_index]
-        total = len(df)
-        print(f"  RANGE MODE: Processing articles {start_index}-{end_index}")
+        records = itertools.islice(records, start_index - 1, end_index)
+        print(f"  RANGE MODE: Processing articles {start_index}-{end_index or 'end'}")
+
+    # 按表格顺序逐篇处理时边读边处理；排序、预估、预抓取、任务队列需要先读完全部行
+    streaming = (CONFIG['schedule'] == 'row' and not worker and not plan
+                 and not CONFIG['dedupe_boilerplate'] and not CONFIG['pack_short_articles'])
+    read_count = [0]
+
+    def stream_items():
+        for index, record in enumerate(records, 1):
+            read_count[0] = index
+            yield new_item(index, *record)
+
+    items = stream_items()
+    if streaming:
+        print(f"  Streaming rows in order")
     else:
-        print(f"  Total articles: {total}")
+        items = list(items)
+        print(f"  Total articles: {len(items)}")
 
     print(f"\n[2/5] Configuration:")
     print(f"      Voice: {CONFIG['voice']}")
@@ -485,6 +1873,48 @@ async def main(excel_path, test_mode=False, start_index=1, end_index=None, no_bg
         print(f"      BGM: DISABLED")
         CONFIG['bgm_folder'] = None
 
+    variants = resolve_variants()
+    if CONFIG['render_variants']:
+        print(f"      Variants: {len(variants)} (TTS concurrency {CONFIG['tts_concurrency']})")
+        for variant in variants:
+            bgm = 'no BGM' if variant['bgm'] is None else f"BGM {variant['bgm']['folder']} @ {variant['bgm']['volume']*100:.0f}%"
+            print(f"        - {variant['name']}: {variant['voice']} rate {variant['rate']}, {bgm}")
+
+    if worker and (CONFIG['dedupe_boilerplate'] or CONFIG['pack_short_articles']):
+        # 跨文章处理要先拿到全部正文，与逐篇领取冲突
+        print(f"      [!] Boilerplate dedupe / short-article packing are disabled in worker mode")
+        CONFIG['dedupe_boilerplate'] = False
+        CONFIG['pack_short_articles'] = False
+    if CONFIG['dedupe_boilerplate']:
+        print(f"      Boilerplate dedupe: ON")
+    if CONFIG['pack_short_articles']:
+        print(f"      Pack short articles: <= {CONFIG['pack_max_article_chars']} chars")
+    if CONFIG['mix_engine'] != 'ffmpeg':
+        print(f"      Mix engine: {CONFIG['mix_engine']}")
+    if CONFIG['one_shot_render']:
+        print(f"      One-shot render: ON (keep voice-only: {CONFIG['keep_voice_only']})")
+    if CONFIG['stream_output']:
+        print(f"      Stream output: HLS, {CONFIG['stream_chunk_seconds']}s chunks")
+    if CONFIG['output_profile'] != 'mp3_192k':
+        print(f"      Output profile: {CONFIG['output_profile']}")
+    if CONFIG['loudness_normalize']:
+        targets = CONFIG['loudness_targets']
+        print(f"      Loudness: voice {targets['voice_lufs']} LUFS, BGM {targets['bgm_lufs']} LUFS")
+        if CONFIG['stream_output']:
+            print(f"      [!] Loudness normalization is not applied to stream output (HLS uses the profile BGM volume)")
+
+    # 预测模型：之前的运行校准过就用校准后的
+    CONFIG['cost_model'] = load_cost_model(COST_MODEL_FILE, CONFIG['cost_model'])
+
+    if plan:
+        await plan_articles(items, variants, voice_folder, output_folder, state, resume)
+        return True
+
+    # 解码BGM、写底乐缓存是阻塞操作，放到线程中
+    bed_count = await asyncio.to_thread(prepare_bgm_beds, variants)
+    if bed_count:
+        print(f"      BGM beds ready: {bed_count}")
+
     print(f"\n[3/5] Output folders:")
     print(f"      Text:   {Path(CONFIG['output_text_folder']).absolute()}")
     print(f"      Voice:  {voice_folder.absolute()}")
@@ -498,37 +1928,130 @@ async def main(excel_path, test_mode=False, start_index=1, end_index=None, no_bg
     failed_count = 0
     start_time = datetime.now()
 
-    for batch_num in range(0, total, CONFIG['batch_size']):
-        batch_start = batch_num
-        batch_end = min(batch_num + CONFIG['batch_size'], total)
-
-        print(f"\n>>> Batch {batch_num // CONFIG['batch_size'] + 1}: Articles {batch_start + 1}-{batch_end}")
+    # 跨文章处理（公共段落、短文打包）需要先抓取全部正文
+    contents = {}
+    boilerplate = None
+    if CONFIG['dedupe_boilerplate'] or CONFIG['pack_short_articles']:
+        print(f"\n>>> Prefetching articles...")
+        contents = await prefetch_articles(items)
 
-        for i in range(batch_start, batch_end):
-            index = i + 1
-            row = df.iloc[i]
+    if CONFIG['dedupe_boilerplate']:
+        boilerplate = detect_boilerplate(contents)
 
-            try:
-                success = await process_article(row, voice_folder, output_folder, index, start_index + total - 1)
+        repeated_chars = sum(
+            len(text) * (boilerplate['occurrences'][key] - 1)
+            for key, text in boilerplate['texts'].items()
+        )
+        print(f"    Boilerplate paragraphs: {len(boilerplate['texts'])}")
+        print(f"    Repeated chars across articles: {repeated_chars}")
+
+    packed = {}
+    if CONFIG['pack_short_articles']:
+        short_articles = []
+        titles = {}
+        for item in items:
+            idx, title = item['idx'], item['title']
+            content = contents.get(idx)
+            if not content:
+                continue
+            # 含公共段落的文章走缓存，不参与打包
+            if any(kind == 'cached' for kind, _ in plan_speech_pieces(content, boilerplate)):
+                continue
+            titles[idx] = title
+            short_articles.append((idx, content))
 
-                if success:
-                    success_count += 1
-                else:
-                    failed_count += 1
+        groups = group_short_articles(short_articles)
 
+        async def pack_group(group, variant):
+            output_paths = {
+                idx: variant_folder(voice_folder, variant) / f"{article_base_name(idx, titles[idx])}.mp3"
+                for idx, _ in group
+            }
+            try:
+                await synthesize_packed_articles(group, output_paths, variant['voice'], variant['rate'])
+                for idx, _ in group:
+                    packed.setdefault(idx, set()).add(variant['name'])
             except Exception as e:
-                print(f"  [!] Exception: {e}")
-                failed_count += 1
-
-            # 延迟
-            if i < batch_end - 1:
-                if CONFIG['delay_between_articles'] > 0:
-                    await asyncio.sleep(CONFIG['delay_between_articles'])
-
-        # 批次延迟
-        if batch_end < total:
-            print(f"\n>>> Waiting {CONFIG['delay_between_batches']}s before next batch...")
-            await asyncio.sleep(CONFIG['delay_between_batches'])
+                # 打包失败的文章回到逐篇合成
+                print(f"    [!] Packed synthesis failed: {e}")
+
+        await asyncio.gather(*(pack_group(group, variant) for group in groups for variant in variants))
+        print(f"    Packed {len(packed)} short articles into {len(groups)} TTS requests per variant")
+
+    # 流水线：各阶段独立并发，队列有界，整体速度取决于最慢的阶段
+    ctx = new_context(voice_folder, output_folder, variants, state, resume, contents, boilerplate, packed)
+
+    schedule = None
+    if not streaming:
+        items, schedule = schedule_items(ctx, items)
+        order = 'LPT by predicted cost' if CONFIG['schedule'] == 'lpt' else 'row order'
+        print(f"\n>>> Schedule: {order}, {schedule['known']}/{schedule['total']} articles with known text; "
+              f"predicted makespan {schedule['predicted']:.0f}s (row order {schedule['row_order']:.0f}s)")
+
+    # 多worker：文章先全部加入共享队列（已在队列中的保持原状态），再逐篇领取
+    heartbeat_task = None
+    if worker:
+        queue_path = Path(queue_path) if queue_path else output_folder / QUEUE_FILE_NAME
+        # 队列库和状态库一样，只在 ctx['db'] 线程中读写
+        ctx['queue'] = await db_call(ctx, open_queue, queue_path)
+        ctx['worker'] = worker_name()
+        ctx['held'] = {}
+        ctx['lost'] = {}
+        ctx['claimed'] = 0
+        ctx['claim_slots'] = asyncio.Semaphore(queue_max_held())
+        await db_call(ctx, enqueue_jobs, ctx['queue'], [(item['base_name'], item) for item in items])
+        summary = await db_call(ctx, queue_summary, ctx['queue'])
+        print(f"\n>>> Worker {ctx['worker']} on queue {queue_path}: {summary}, "
+              f"holding up to {queue_max_held()} article(s)")
+        heartbeat_task = asyncio.create_task(keep_leases(ctx))
+
+    if CONFIG['trace_file']:
+        trace_enable()
+    if CONFIG['profile_folder']:
+        profile_enable()
+
+    # 运行指标：HTTP端点随进程存在；textfile 定时刷新，结束时再写一次
+    metrics_task = None
+    if CONFIG['metrics_port']:
+        start_metrics_server(CONFIG['metrics_port'])
+        print(f"\n>>> Metrics: http://127.0.0.1:{CONFIG['metrics_port']}/metrics")
+    if CONFIG['metrics_textfile']:
+        metrics_task = asyncio.create_task(write_metrics_periodically(CONFIG['metrics_textfile']))
+
+    # 每篇文章的各版本结果（任一版本失败即算失败）
+    outcomes = {}
+
+    async def on_done(item):
+        counter_inc('items_total', result='ok')
+        outcomes.setdefault(item['index'], []).append(True)
+        if worker:
+            await finish_claimed(ctx, item, True)
+
+    # 事件循环阻塞检查：有回调占用事件循环超过阈值即判为失败
+    loop_monitor = None
+    if CONFIG['loop_check_ms']:
+        loop_monitor, stop_loop_monitor = start_loop_monitor(CONFIG['loop_check_ms'] / 1000)
+
+    stages = build_stages(ctx)
+    print(f"\n>>> Pipeline: " + " → ".join(f"{stage['name']}×{stage['workers']}" for stage in stages))
+    try:
+        _, metrics, wall_time = await run_pipeline(claim_articles(ctx) if worker else items, stages,
+                                                   on_done, new_error_handler(ctx, outcomes, worker))
+    finally:
+        if loop_monitor:
+            stop_loop_monitor()
+        if heartbeat_task:
+            heartbeat_task.cancel()
+        if metrics_task:
+            metrics_task.cancel()
+            await asyncio.to_thread(write_textfile, CONFIG['metrics_textfile'])
+        if CONFIG['trace_file']:
+            events = await asyncio.to_thread(save_trace, CONFIG['trace_file'])
+            print(f"\n>>> Trace: {events} spans written to {CONFIG['trace_file']}")
+
+    total = ctx['claimed'] if worker else read_count[0]
+    success_count = sum(1 for results in outcomes.values() if results and all(results))
+    failed_count = total - success_count
 
     # 总结
     elapsed = (datetime.now() - start_time).total_seconds()
@@ -539,10 +2062,40 @@ async def main(excel_path, test_mode=False, start_index=1, end_index=None, no_bg
     print(f"  Total processed: {total}")
     print(f"  Successful:      {success_count}")
     print(f"  Failed:          {failed_count}")
-    print(f"  Success rate:    {success_count/total*100:.1f}%")
+    if skipped:
+        rows = ', '.join(str(row_no) for row_no, _ in skipped[:10]) + (' ...' if len(skipped) > 10 else '')
+        print(f"  Skipped rows:    {len(skipped)} with an invalid 序号 (row {rows})")
+    if total:
+        print(f"  Success rate:    {success_count/total*100:.1f}%")
     print(f"  Time elapsed:    {elapsed/60:.1f} minutes")
+    print(f"  TTS chars:       {TTS_STATS['chars_synthesized']} synthesized, {TTS_STATS['chars_saved']} saved by cache")
+    if resume:
+        print(f"  Resumed:         {ctx['resumed']} finished stages skipped")
+    if worker:
+        print(f"  Queue:           {await db_call(ctx, queue_summary, ctx['queue'])}")
+    if schedule and not worker:
+        print(f"  Schedule:        predicted {schedule['predicted']:.0f}s, actual {wall_time:.0f}s "
+              f"(row order predicted {schedule['row_order']:.0f}s)")
+    print(f"  Stages:")
+    print_stage_metrics(stages, metrics, wall_time)
+    if CONFIG['profile_folder']:
+        print(f"  Profile:")
+        for line in profile_summary().splitlines():
+            print(f"  {line}")
+        print(f"  Profile report:  {save_profile(CONFIG['profile_folder'])}")
+    loop_ok = True
+    if loop_monitor:
+        loop_ok = print_loop_report(loop_monitor)
+    if COST_SAMPLES['tts_chars'] or COST_SAMPLES['audio_seconds']:
+        CONFIG['cost_model'] = calibrate_cost_model(CONFIG['cost_model'], COST_SAMPLES, CONFIG['output_profile'])
+        save_cost_model(CONFIG['cost_model'])
+        print(f"  Cost model:      calibrated over {CONFIG['cost_model']['calibrated_runs']} run(s) ({COST_MODEL_FILE})")
+    save_probe_cache()
+    shutdown_clean_pool()
+    ctx['db'].shutdown()
     print(f"  Output folder:   {output_folder.absolute()}")
     print("="*70)
+    return loop_ok
 
 
 # ============================================
@@ -560,15 +2113,69 @@ Examples:
   python article_to_audio_complete.py articles.xlsx --test       # Test first 3
   python article_to_audio_complete.py articles.xlsx --range 1-10 # Process 1-10
   python article_to_audio_complete.py articles.xlsx --no-bgm      # Skip BGM
+  python article_to_audio_complete.py articles.xlsx --dedupe-boilerplate  # Synthesize shared paragraphs once
+  python article_to_audio_complete.py articles.xlsx --pack-short  # One TTS request for several short articles
+  python article_to_audio_complete.py articles.xlsx --one-shot --no-voice-only  # Concat+mix in one encode
+  python article_to_audio_complete.py articles.xlsx --loudnorm    # Consistent voice/BGM loudness
+  python article_to_audio_complete.py articles.xlsx --output-profile opus_speech  # Small mono speech output
+  python article_to_audio_complete.py articles.xlsx --stream --output-profile aac_speech  # HLS chunks as they are ready
+  python article_to_audio_complete.py articles.xlsx --workers tts=4 --workers mix=3  # Scale slow stages
+  python article_to_audio_complete.py articles.xlsx --resume      # Continue an interrupted run
+  python article_to_audio_complete.py articles.xlsx --plan        # Estimate time, TTS chars and disk; synthesize nothing
+  python article_to_audio_complete.py articles.xlsx --schedule row  # Keep Excel row order (default: longest first)
+  python article_to_audio_complete.py articles.xlsx --worker      # Run on several processes/hosts sharing the folders
+  python article_to_audio_complete.py articles.xlsx --metrics-port 9108  # Prometheus /metrics while running
+  python article_to_audio_complete.py articles.xlsx --trace trace.json     # Stage timeline for chrome://tracing / Perfetto
+  python article_to_audio_complete.py articles.xlsx --test --profile       # Per-stage CPU/memory hot spots in profile/
+  python article_to_audio_complete.py articles.xlsx --test --check-loop    # Fail if anything blocks the event loop
+  python article_to_audio_complete.py articles.xlsx --variant xiaoxiao=zh-CN-XiaoxiaoNeural --variant yunxi_fast=zh-CN-YunxiNeural:+20%
         """
     )
 
-    parser.add_argument('excel', help='Excel file path')
+    parser.add_argument('excel', help='Article list: Excel (.xlsx), CSV or JSONL with columns 序号/图文名称/图文链接')
     parser.add_argument('--test', '-t', action='store_true', help='Test mode (first 3 articles)')
     parser.add_argument('--range', '-r', type=str, help='Process range (e.g., "1-10")')
     parser.add_argument('--start', '-s', type=int, help='Start index')
     parser.add_argument('--end', '-e', type=int, help='End index')
     parser.add_argument('--no-bgm', action='store_true', help='Skip background music mixing')
+    parser.add_argument('--dedupe-boilerplate', action='store_true',
+                        help='Detect paragraphs repeated across articles and synthesize them once')
+    parser.add_argument('--pack-short', action='store_true',
+                        help='Synthesize several short articles in one TTS request and split by boundaries')
+    parser.add_argument('--one-shot', action='store_true',
+                        help='Concatenate segments and mix BGM in a single ffmpeg encode')
+    parser.add_argument('--no-voice-only', action='store_true',
+                        help='With --one-shot, do not keep the voice-only file')
+    parser.add_argument('--mix-engine', choices=['ffmpeg', 'numpy'],
+                        help='BGM mixing engine (numpy streams in fixed-size chunks)')
+    parser.add_argument('--variant', action='append', default=[], metavar='NAME=VOICE[:RATE[:BGM]]',
+                        help='Render variant (repeatable); fetch/clean/segment are shared across variants')
+    parser.add_argument('--stream', action='store_true',
+                        help='Write HLS chunks + playlist as segments finish (first audio within seconds)')
+    parser.add_argument('--output-profile', choices=list(ENCODE_PROFILES),
+                        help='Final encode profile (e.g. mp3_speech, opus_speech, aac_speech)')
+    parser.add_argument('--loudnorm', action='store_true',
+                        help='Normalize voice/BGM loudness from measurements cached during synthesis')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue the previous run from its saved state, skipping finished stages')
+    parser.add_argument('--worker', action='store_true',
+                        help='Pull articles from a shared lease-based queue (start several processes or hosts)')
+    parser.add_argument('--queue', help='Queue database for --worker (default: <final folder>/.work_queue.sqlite)')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics on http://127.0.0.1:PORT/metrics')
+    parser.add_argument('--metrics-textfile', help='Write Prometheus metrics to this file (node-exporter textfile)')
+    parser.add_argument('--trace', metavar='OUT.json',
+                        help='Write a Chrome trace of every article/segment stage span (open in Perfetto)')
+    parser.add_argument('--profile', nargs='?', const='profile', metavar='DIR',
+                        help='Profile CPU (cProfile), Python allocations and ffmpeg peak RSS per stage (default dir: profile)')
+    parser.add_argument('--check-loop', type=int, nargs='?', const=100, metavar='MS',
+                        help='Report callbacks that block the event loop longer than MS (default 100); exit 1 if any')
+    parser.add_argument('--plan', action='store_true',
+                        help='Dry run: estimate run time, TTS characters and disk space without synthesizing')
+    parser.add_argument('--schedule', choices=['lpt', 'row'],
+                        help='Article order: lpt = longest predicted first (default), row = Excel order')
+    parser.add_argument('--workers', action='append', default=[], metavar='STAGE=N',
+                        help='Workers for a pipeline stage (fetch/clean/segment/tts/merge/mix), repeatable')
+    parser.add_argument('--tts-concurrency', type=int, help='Concurrent TTS requests shared by all variants')
 
     args = parser.parse_args()
 
@@ -590,4 +2197,49 @@ Examples:
     if args.no_bgm:
         print("BGM mixing disabled")
 
-    asyncio.run(main(args.excel, args.test, start_index, end_index))
+    if args.dedupe_boilerplate:
+        CONFIG['dedupe_boilerplate'] = True
+    if args.pack_short:
+        CONFIG['pack_short_articles'] = True
+    if args.one_shot:
+        CONFIG['one_shot_render'] = True
+    if args.no_voice_only:
+        CONFIG['keep_voice_only'] = False
+    if args.mix_engine:
+        CONFIG['mix_engine'] = args.mix_engine
+    if args.variant:
+        CONFIG['render_variants'] = [parse_variant_spec(spec) for spec in args.variant]
+    if args.tts_concurrency:
+        CONFIG['tts_concurrency'] = args.tts_concurrency
+    for spec in args.workers:
+        stage, _, count = spec.partition('=')
+        if stage not in CONFIG['stage_workers'] or not count.isdigit():
+            print(f"Invalid --workers value: {spec} (use STAGE=N, stages: {', '.join(CONFIG['stage_workers'])})")
+            exit(1)
+        CONFIG['stage_workers'][stage] = int(count)
+    if args.loudnorm:
+        CONFIG['loudness_normalize'] = True
+    if args.metrics_port:
+        CONFIG['metrics_port'] = args.metrics_port
+    if args.metrics_textfile:
+        CONFIG['metrics_textfile'] = args.metrics_textfile
+    if args.trace:
+        CONFIG['trace_file'] = args.trace
+    if args.profile:
+        CONFIG['profile_folder'] = args.profile
+    if args.check_loop:
+        CONFIG['loop_check_ms'] = args.check_loop
+    if args.schedule:
+        CONFIG['schedule'] = args.schedule
+    if args.stream:
+        CONFIG['stream_output'] = True
+    if args.output_profile:
+        # 混音直接在成品的采样率/声道下进行，省去编码前的重采样
+        CONFIG['output_profile'] = args.output_profile
+        CONFIG['mix_sample_rate'] = get_profile(args.output_profile)['sample_rate']
+        CONFIG['mix_channels'] = get_profile(args.output_profile)['channels']
+
+    ok = asyncio.run(main(args.excel, args.test, start_index, end_index, args.no_bgm, args.resume,
+                          args.worker, args.queue, args.plan))
+    if not ok:
+        exit(1)
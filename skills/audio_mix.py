@@ -0,0 +1,317 @@
+"""
+BGM混音工具
+- BGM预处理：每个BGM只解码一次，生成已调好音量和采样率的PCM底乐
+- 底乐是裸PCM文件（可内存映射），混音时直接读取需要的片段，不再解码BGM
+- BGM文件或混音参数变化时自动重新生成
+- 分块NumPy混音引擎：内存占用固定，不随音频长度增长（需要numpy）
+- 按文章编号确定性地选择BGM
+"""
+
+import hashlib
+import json
+import os
+import re
+import subprocess
+from pathlib import Path
+
+# 底乐缓存目录（相对于运行目录）
+BED_FOLDER = Path('.audio_cache') / 'bgm_beds'
+
+# 底乐格式：16位小端整数，交错声道
+BED_FORMAT = 's16le'
+BED_SAMPLE_BYTES = 2
+BED_VERSION = 1
+
+DEFAULT_SAMPLE_RATE = 44100
+DEFAULT_CHANNELS = 2
+
+
+# ============================================
+# BGM底乐缓存
+# ============================================
+def bed_paths(bgm_file, volume, sample_rate, channels):
+    """底乐文件和元数据文件路径（不同音量/采样率各自缓存）"""
+
+    key = f"{Path(bgm_file).absolute()}|{volume}|{sample_rate}|{channels}|{BED_VERSION}"
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+    stem = f"{Path(bgm_file).stem}_{digest}"
+    return BED_FOLDER / f"{stem}.pcm", BED_FOLDER / f"{stem}.json"
+
+
+def prepare_bgm_bed(bgm_file, volume, sample_rate=DEFAULT_SAMPLE_RATE, channels=DEFAULT_CHANNELS):
+    """准备BGM底乐，返回 (pcm路径, 元数据)
+
+    元数据记录源文件大小、修改时间和混音参数，任一变化即重新解码。
+    """
+
+    pcm_path, meta_path = bed_paths(bgm_file, volume, sample_rate, channels)
+    stat = os.stat(bgm_file)
+    expected = {
+        'version': BED_VERSION,
+        'source': str(Path(bgm_file).absolute()),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'volume': volume,
+        'sample_rate': sample_rate,
+        'channels': channels,
+        'format': BED_FORMAT,
+    }
+
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if all(meta.get(k) == v for k, v in expected.items()) and pcm_path.exists():
+            return pcm_path, meta
+    except (OSError, ValueError):
+        pass
+
+    BED_FOLDER.mkdir(parents=True, exist_ok=True)
+    tmp_path = pcm_path.with_name(f"{pcm_path.stem}.{os.getpid()}.tmp")
+
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-i', str(bgm_file),
+        '-af', f"volume={volume}",
+        '-ar', str(sample_rate),
+        '-ac', str(channels),
+        '-f', BED_FORMAT,
+        str(tmp_path)
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise RuntimeError(f"BGM decode failed: {result.stderr[:200]}")
+
+    os.replace(tmp_path, pcm_path)
+
+    meta = dict(expected)
+    meta['frames'] = pcm_path.stat().st_size // (BED_SAMPLE_BYTES * channels)
+    meta['duration'] = meta['frames'] / sample_rate
+
+    tmp_meta = meta_path.with_name(f"{meta_path.stem}.{os.getpid()}.tmp")
+    with open(tmp_meta, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_meta, meta_path)
+
+    return pcm_path, meta
+
+
+def bed_input_args(pcm_path, meta, loop=True):
+    """把底乐作为ffmpeg输入的参数（裸PCM，无需解码）"""
+
+    args = ['-f', meta['format'], '-ar', str(meta['sample_rate']), '-ac', str(meta['channels'])]
+    if loop:
+        args += ['-stream_loop', '-1']
+    return args + ['-i', str(pcm_path)]
+
+
+def article_id_from_name(name):
+    """从文件名取文章编号（开头的数字），没有则用文件名本身"""
+    match = re.match(r'(\d+)', Path(name).stem)
+    return str(int(match.group(1))) if match else Path(name).stem
+
+
+def pick_bgm(article_id, bgm_files):
+    """按文章编号确定性地选择BGM：同一篇文章每次都选到同一个
+
+    最高随机权重（rendezvous）哈希：每个BGM按 (文章编号, 文件名) 打分，取分数最高的。
+    增删一个BGM只影响约 1/N 的文章，其余文章的混音结果不变，不必重混
+    """
+
+    def score(bgm_file):
+        name = Path(bgm_file).name
+        digest = hashlib.sha1(f"{article_id}\n{name}".encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big'), name
+
+    return max(bgm_files, key=score)
+
+
+# ============================================
+# 分块NumPy混音
+# ============================================
+# 与ffmpeg amix结果比较的容差（满幅=1.0）
+MIX_TOLERANCE_RMS = 1e-3
+MIX_TOLERANCE_PEAK = 1e-2
+
+# 每块处理的秒数（内存占用只与块大小有关，与音频长度无关）
+CHUNK_SECONDS = 1.0
+
+
+def read_exact(stream, size):
+    """从管道读取size字节（不足说明已到结尾）"""
+
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        data = stream.read(remaining)
+        if not data:
+            break
+        chunks.append(data)
+        remaining -= len(data)
+    return b''.join(chunks)
+
+
+def decode_pcm_process(input_args, sample_rate, channels):
+    """启动ffmpeg解码进程，输出f32le PCM到stdout"""
+
+    cmd = [
+        'ffmpeg', '-v', 'error', *input_args, '-vn',
+        '-f', 'f32le', '-ar', str(sample_rate), '-ac', str(channels), '-'
+    ]
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def open_bed(bed_path, bed_meta):
+    """内存映射底乐，返回 (帧数, 声道) 的int16数组"""
+
+    import numpy as np
+
+    bed = np.memmap(bed_path, dtype='<i2', mode='r').reshape(-1, bed_meta['channels'])
+    if len(bed) == 0:
+        raise RuntimeError('empty BGM bed')
+    return bed
+
+
+def amix_filter(normalize=True):
+    """配音和BGM混合的amix滤镜；normalize=False 时不按输入数缩放（响度归一化时增益已按最终输出计算）"""
+    return f"[voice][bgm_out]amix=inputs=2:duration=first:dropout_transition=2{'' if normalize else ':normalize=0'}[outa]"
+
+
+def mix_chunk(voice, bed, pos, fade_end, fade_frames, normalize=True):
+    """混合一块：voice 为 (帧数, 声道) float32，pos 为该块在整段中的起始帧
+
+    BGM从底乐循环取样，在 fade_end 前 fade_frames 帧内线性渐出，再按amix默认归一化各取1/2
+    （normalize=False 时直接相加，与 amix normalize=0 一致）。
+    """
+
+    import numpy as np
+
+    t = np.arange(pos, pos + len(voice))
+    bgm = bed[t % len(bed)].astype(np.float32) / 32768.0
+    if fade_frames > 0:
+        gain = np.clip((fade_end - t) / fade_frames, 0.0, 1.0)
+    else:
+        gain = (t < fade_end).astype(np.float32)
+    bgm *= gain[:, None]
+
+    return (voice + bgm) * 0.5 if normalize else voice + bgm
+
+
+def decode_pcm_array(file_path, sample_rate, channels):
+    """把整个音频解码为 (帧数, 声道) 的float32数组"""
+
+    import numpy as np
+
+    cmd = [
+        'ffmpeg', '-v', 'error', '-i', str(file_path), '-vn',
+        '-f', 'f32le', '-ar', str(sample_rate), '-ac', str(channels), '-'
+    ]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"decode failed: {result.stderr[:200]}")
+    return np.frombuffer(result.stdout, dtype='<f4').reshape(-1, channels)
+
+
+def mix_with_bed_numpy(voice_file, bed_path, bed_meta, output_file, voice_duration, fade_out_duration,
+                       encode_args, chunk_seconds=CHUNK_SECONDS, voice_gain_db=0.0, normalize=True):
+    """分块混音：配音逐块解码，BGM底乐内存映射后循环取样，结果直接送入编码器
+
+    计算与原滤镜图一致：配音乘增益，BGM截到配音长度、线性渐出，再按amix默认归一化各取1/2
+    （normalize=False 对应 amix normalize=0，响度归一化时使用）。
+    """
+
+    import numpy as np
+
+    sample_rate = bed_meta['sample_rate']
+    channels = bed_meta['channels']
+    bed = open_bed(bed_path, bed_meta)
+
+    fade_frames = int(fade_out_duration * sample_rate)
+    fade_end = int(voice_duration * sample_rate)
+    chunk_frames = max(int(chunk_seconds * sample_rate), 1)
+    voice_gain = 10 ** (voice_gain_db / 20)
+
+    decoder = decode_pcm_process(['-i', str(voice_file)], sample_rate, channels)
+    encoder = subprocess.Popen(
+        ['ffmpeg', '-y', '-v', 'error',
+         '-f', 'f32le', '-ar', str(sample_rate), '-ac', str(channels), '-i', '-',
+         *encode_args, str(output_file)],
+        stdin=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+
+    try:
+        pos = 0
+        while True:
+            raw = read_exact(decoder.stdout, chunk_frames * channels * 4)
+            frames = len(raw) // (channels * 4)
+            if frames == 0:
+                break
+
+            voice = np.frombuffer(raw[:frames * channels * 4], dtype='<f4').reshape(frames, channels)
+            if voice_gain != 1.0:
+                voice = voice * np.float32(voice_gain)
+
+            mixed = mix_chunk(voice, bed, pos, fade_end, fade_frames, normalize)
+            encoder.stdin.write(mixed.astype('<f4').tobytes())
+            pos += frames
+
+        encoder.stdin.close()
+        encoder_error = encoder.stderr.read()
+        decoder_error = decoder.stderr.read()
+        if decoder.wait() != 0:
+            raise RuntimeError(f"voice decode failed: {decoder_error[:200]}")
+        if encoder.wait() != 0:
+            raise RuntimeError(f"encode failed: {encoder_error[:200]}")
+    except BaseException:
+        for proc in (decoder, encoder):
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+        raise
+
+    return True
+
+
+def compare_pcm(file_a, file_b, sample_rate=DEFAULT_SAMPLE_RATE, channels=DEFAULT_CHANNELS,
+                chunk_seconds=10.0):
+    """流式解码两个音频并逐块比较，返回 (RMS误差, 最大误差, 长度差帧数)"""
+
+    import numpy as np
+
+    a = decode_pcm_process(['-i', str(file_a)], sample_rate, channels)
+    b = decode_pcm_process(['-i', str(file_b)], sample_rate, channels)
+    chunk_bytes = int(chunk_seconds * sample_rate) * channels * 4
+
+    squared = 0.0
+    peak = 0.0
+    compared = 0
+    length_diff = 0
+    try:
+        while True:
+            raw_a = read_exact(a.stdout, chunk_bytes)
+            raw_b = read_exact(b.stdout, chunk_bytes)
+            if not raw_a and not raw_b:
+                break
+            x = np.frombuffer(raw_a[:len(raw_a) // 4 * 4], dtype='<f4')
+            y = np.frombuffer(raw_b[:len(raw_b) // 4 * 4], dtype='<f4')
+            n = min(len(x), len(y))
+            length_diff += abs(len(x) - len(y)) // channels
+            if n:
+                diff = x[:n].astype(np.float64) - y[:n]
+                squared += float(np.dot(diff, diff))
+                peak = max(peak, float(np.abs(diff).max()))
+                compared += n
+    finally:
+        for proc in (a, b):
+            proc.stdout.close()
+            proc.kill()
+            proc.wait()
+
+    rms = (squared / compared) ** 0.5 if compared else 0.0
+    return rms, peak, length_diff
+
+
+def mix_within_tolerance(rms, peak):
+    """判断两个混音结果是否在容差内"""
+    return rms <= MIX_TOLERANCE_RMS and peak <= MIX_TOLERANCE_PEAK
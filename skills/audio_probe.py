@@ -0,0 +1,382 @@
+"""
+音频信息读取工具
+- 进程内读取MP3时长（Xing/Info、VBRI头，或逐帧扫描），不启动ffprobe
+- 结果按 (路径, 大小, 修改时间) 持久缓存，BGM素材只需读取一次
+- 同一缓存也保存文件内容哈希，用于判断输出是否需要重新生成
+- 响度测量（EBU R128）结果同样缓存：BGM只测一次，配音在合成时顺带测量
+- 未知格式才回退到ffprobe
+"""
+
+import atexit
+import hashlib
+import json
+import math
+import os
+import subprocess
+import wave
+from pathlib import Path
+
+# 缓存文件（相对于运行目录）
+CACHE_FILE = Path('.audio_cache') / 'probe_cache.json'
+
+# 临时文件（TTS分段目录、.part 未完成文件）：只在进程内缓存，不写入磁盘
+TEMP_DIR_NAMES = {'.temp_segments'}
+
+# ============================================
+# MP3帧解析
+# ============================================
+MP3_BITRATES = {
+    # (MPEG1?, layer): kbps 表
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def parse_mp3_frame_header(header):
+    """解析4字节MP3帧头，返回 (帧长度, 采样数, 采样率)，无效返回None"""
+
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+
+    version = (header[1] >> 3) & 0x03
+    layer = 4 - ((header[1] >> 1) & 0x03)
+    bitrate_index = (header[2] >> 4) & 0x0F
+    rate_index = (header[2] >> 2) & 0x03
+    padding = (header[2] >> 1) & 0x01
+
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = MP3_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    if layer == 3 and not mpeg1:
+        return 72 * bitrate // sample_rate + padding, 576, sample_rate
+    return 144 * bitrate // sample_rate + padding, 1152, sample_rate
+
+
+def id3v2_size(data):
+    """开头ID3v2标签的总长度（没有则为0）"""
+
+    if data[:3] != b'ID3' or len(data) < 10:
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def mp3_frame_offsets(data):
+    """扫描MP3数据，返回每一帧的 (字节偏移, 起始时间秒)，最后追加结尾位置"""
+
+    pos = id3v2_size(data)
+    frames = []
+    elapsed = 0.0
+    while pos + 4 <= len(data):
+        parsed = parse_mp3_frame_header(data[pos:pos + 4])
+        if parsed is None or parsed[0] <= 0:
+            pos += 1
+            continue
+        frame_length, samples, sample_rate = parsed
+        frames.append((pos, elapsed))
+        elapsed += samples / sample_rate
+        pos += frame_length
+
+    frames.append((min(pos, len(data)), elapsed))
+    return frames
+
+
+def read_mp3_duration(file_path):
+    """读取MP3时长：优先Xing/Info、VBRI头中的总帧数，否则逐帧扫描"""
+
+    with open(file_path, 'rb') as f:
+        head = f.read(10)
+        start = id3v2_size(head)
+        f.seek(start)
+        data = f.read(64 * 1024)
+
+    # 找到第一个有效帧（要求下一帧也有效，避免误判）
+    pos = 0
+    parsed = None
+    while pos + 4 <= len(data):
+        parsed = parse_mp3_frame_header(data[pos:pos + 4])
+        if parsed and parsed[0] > 0:
+            following = data[pos + parsed[0]:pos + parsed[0] + 4]
+            if len(following) < 4 or parse_mp3_frame_header(following):
+                break
+        parsed = None
+        pos += 1
+
+    if parsed is None:
+        return None
+
+    frame_length, samples, sample_rate = parsed
+    header = data[pos:pos + 4]
+    mpeg1 = ((header[1] >> 3) & 0x03) == 3
+    mono = (header[3] >> 6) == 3
+
+    # Xing/Info 头位于side info之后
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    xing = pos + 4 + side_info
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        flags = int.from_bytes(data[xing + 4:xing + 8], 'big')
+        if flags & 0x01:
+            frames = int.from_bytes(data[xing + 8:xing + 12], 'big')
+            return frames * samples / sample_rate
+
+    # VBRI 头固定在帧头后32字节
+    vbri = pos + 4 + 32
+    if data[vbri:vbri + 4] == b'VBRI':
+        frames = int.from_bytes(data[vbri + 14:vbri + 18], 'big')
+        return frames * samples / sample_rate
+
+    # 没有头信息：逐帧扫描
+    with open(file_path, 'rb') as f:
+        f.seek(start + pos)
+        return mp3_frame_offsets(f.read())[-1][1]
+
+
+def read_wav_duration(file_path):
+    """读取WAV时长"""
+    with wave.open(str(file_path), 'rb') as w:
+        return w.getnframes() / w.getframerate()
+
+
+def ffprobe_duration(file_path):
+    """用ffprobe获取时长（未知格式时使用）"""
+
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        str(file_path)
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    return float(result.stdout.strip())
+
+
+# ============================================
+# 持久缓存
+# ============================================
+_cache = None
+_dirty = False
+
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        _cache = {}
+        try:
+            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            pass
+        atexit.register(save_probe_cache)
+    return _cache
+
+
+def is_transient(path):
+    """临时文件：在分段临时目录中，或是 .part 未完成文件"""
+    path = Path(path)
+    return '.part.' in path.name or any(part in TEMP_DIR_NAMES for part in path.parts)
+
+
+def save_probe_cache():
+    """把缓存写回磁盘（先合并磁盘上其他进程写入的条目，再原子替换）；
+    临时文件和已不存在的文件的条目不写回，缓存不会随运行次数无限增长"""
+
+    global _dirty
+    if not _dirty:
+        return
+
+    merged = {}
+    try:
+        with open(CACHE_FILE, 'r', encoding='utf-8') as f:
+            merged = json.load(f)
+    except (OSError, ValueError):
+        pass
+    merged.update(_cache)
+    merged = {path: entry for path, entry in merged.items() if not is_transient(path) and os.path.exists(path)}
+
+    CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = CACHE_FILE.with_name(f"{CACHE_FILE.name}.{os.getpid()}.tmp")
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(merged, f, ensure_ascii=False)
+    os.replace(tmp_file, CACHE_FILE)
+    _dirty = False
+
+
+def cached_probe(file_path, field):
+    """读取缓存字段；文件大小或修改时间变化则视为失效"""
+
+    path = str(Path(file_path).absolute())
+    stat = os.stat(path)
+    entry = _load_cache().get(path)
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry.get(field)
+    return None
+
+
+def store_probe(file_path, field, value):
+    """写入缓存字段"""
+
+    global _dirty
+    path = str(Path(file_path).absolute())
+    stat = os.stat(path)
+    cache = _load_cache()
+    entry = cache.get(path)
+    if not entry or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        cache[path] = entry
+    entry[field] = value
+    if not is_transient(path):
+        _dirty = True
+
+
+def get_audio_duration(file_path):
+    """获取音频时长（秒），带持久缓存"""
+
+    duration = cached_probe(file_path, 'duration')
+    if duration is not None:
+        return duration
+
+    suffix = Path(file_path).suffix.lower()
+    duration = None
+    try:
+        if suffix == '.mp3':
+            duration = read_mp3_duration(file_path)
+        elif suffix == '.wav':
+            duration = read_wav_duration(file_path)
+    except (OSError, wave.Error, EOFError):
+        duration = None
+
+    if duration is None:
+        duration = ffprobe_duration(file_path)
+
+    store_probe(file_path, 'duration', duration)
+    return duration
+
+
+def file_digest(file_path):
+    """文件内容的SHA-1（带缓存，文件未变化时不重新读取）"""
+
+    digest = cached_probe(file_path, 'sha1')
+    if digest is not None:
+        return digest
+
+    h = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    digest = h.hexdigest()
+
+    store_probe(file_path, 'sha1', digest)
+    return digest
+
+
+# ============================================
+# 响度测量（EBU R128）
+# ============================================
+# loudnorm 只做分析时的滤镜参数
+LOUDNORM_ANALYZE_FILTER = 'loudnorm=print_format=json'
+
+# 默认目标：配音响度、BGM响度（混音前）、真峰值上限
+DEFAULT_LOUDNESS_TARGETS = {'voice_lufs': -16.0, 'bgm_lufs': -28.0, 'true_peak': -1.5}
+
+
+def parse_loudnorm_output(stderr):
+    """从loudnorm输出的JSON中取测量结果 {'i', 'tp', 'lra', 'thresh'}，静音或解析失败返回None"""
+
+    start = stderr.rfind('{')
+    end = stderr.rfind('}')
+    if start < 0 or end < start:
+        return None
+    try:
+        data = json.loads(stderr[start:end + 1])
+        stats = {
+            'i': float(data['input_i']),
+            'tp': float(data['input_tp']),
+            'lra': float(data['input_lra']),
+            'thresh': float(data['input_thresh']),
+        }
+    except (ValueError, KeyError):
+        return None
+    if not all(math.isfinite(v) for v in stats.values()):
+        return None
+    return stats
+
+
+def measure_loudness(file_path):
+    """用ffmpeg loudnorm测量整段响度（需要完整解码一遍）"""
+
+    cmd = [
+        'ffmpeg', '-hide_banner', '-nostats',
+        '-i', str(file_path),
+        '-af', LOUDNORM_ANALYZE_FILTER,
+        '-f', 'null', '-'
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, errors='replace')
+    if result.returncode != 0:
+        return None
+    return parse_loudnorm_output(result.stderr)
+
+
+def get_loudness(file_path):
+    """获取响度统计，带持久缓存（文件不变就不再解码）"""
+
+    stats = cached_probe(file_path, 'loudness')
+    if stats is not None:
+        return stats
+
+    stats = measure_loudness(file_path)
+    if stats is not None:
+        store_probe(file_path, 'loudness', stats)
+    return stats
+
+
+def combine_loudness(parts):
+    """由各分段的 (响度统计, 时长) 近似合成整段的响度（按能量加权，不重新解码）"""
+
+    parts = [(stats, duration) for stats, duration in parts if duration > 0]
+    if not parts or any(stats is None for stats, _ in parts):
+        return None
+
+    total = sum(duration for _, duration in parts)
+    energy = sum(duration * 10 ** (stats['i'] / 10) for stats, duration in parts) / total
+    return {
+        'i': round(10 * math.log10(energy), 2),
+        'tp': max(stats['tp'] for stats, _ in parts),
+        'lra': max(stats['lra'] for stats, _ in parts),
+        'thresh': min(stats['thresh'] for stats, _ in parts),
+    }
+
+
+def loudness_gain_db(stats, target_lufs, true_peak):
+    """达到目标响度所需的线性增益(dB)，同时保证真峰值不超过上限"""
+    return round(min(target_lufs - stats['i'], true_peak - stats['tp']), 2)
+
+
+def normalized_levels(voice_stats, bgm_stats, targets, bgm_volume, reference_volume=None):
+    """根据缓存的响度统计返回 (配音增益dB, BGM线性音量)；缺少统计的一方保持原值
+
+    reference_volume：默认BGM音量。给出时，bgm_volume 与它的差值（dB）叠加到BGM目标响度上，
+    各BGM方案的相对音量在响度归一化后仍然有效
+    """
+
+    voice_gain_db = 0.0
+    if voice_stats:
+        voice_gain_db = loudness_gain_db(voice_stats, targets['voice_lufs'], targets['true_peak'])
+    if bgm_stats:
+        bgm_target = targets['bgm_lufs']
+        if reference_volume and bgm_volume > 0:
+            bgm_target += 20 * math.log10(bgm_volume / reference_volume)
+        bgm_gain_db = loudness_gain_db(bgm_stats, bgm_target, targets['true_peak'])
+        bgm_volume = round(10 ** (bgm_gain_db / 20), 4)
+    return voice_gain_db, bgm_volume
@@ -0,0 +1,654 @@
+"""
+离线基准测试（不访问网络）
+- 合成语料：按指定长度和"标记密度"生成类似微信文章的HTML和文本，生成类似Edge TTS输出的配音分段和BGM
+- 基准项：正文提取（单进程 / 进程池）、clean_article_content、fix_text_formatting、分段、拼接、时长探测、混音
+- 启动耗时（startup）：各入口 --help 和空目录批量混音的墙钟时间，另用 python -X importtime 统计导入耗时最多的模块
+- 结果写成JSON（含运行环境），compare 命令对照基准结果标出变慢的项目
+- loopcheck：用合成语料跑完整流水线（下载和TTS换成本地模拟），事件循环被阻塞超过阈值即失败
+- dedupecheck：合成页面经 extract_article_text 提取后做公共段落检测，检查共同的开场段、排版不同的结尾段被识别，
+  措辞不同的不被共用
+- workercheck：两个worker进程（离线流水线）共用一个任务队列，检查文章被两边分担而不是被先启动的一个全部领走
+
+标记密度：正文段落中出现"来源""编辑"等近似标记词的比例，以及文末署名行的多少（影响清理的查找和正则耗时）
+
+用法：
+    python skills/benchmarks.py run --json bench_baseline.json
+    python skills/benchmarks.py run --sizes 2000 50000 --density 0.3 --repeat 5 --json bench_new.json
+    python skills/benchmarks.py run --only extract clean fix
+    python skills/benchmarks.py run --only startup --repeat 10 --json startup.json
+    python skills/benchmarks.py compare bench_baseline.json bench_new.json --threshold 0.15
+    python skills/benchmarks.py loopcheck --articles 6 --threshold-ms 100
+    python skills/benchmarks.py dedupecheck
+    python skills/benchmarks.py workercheck --articles 6
+"""
+
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+
+import article_to_audio_complete as pipeline
+from audio_probe import read_mp3_duration, ffprobe_duration
+from article_to_audio_complete import (CONFIG, extract_article_text, clean_article_content, fix_text_formatting,
+                                       split_text_into_segments, merge_audio_files, mix_voice_with_bgm,
+                                       clean_pool_size, get_clean_pool, shutdown_clean_pool, detect_boilerplate,
+                                       plan_speech_pieces, normalize_paragraph)
+from run_state import open_state
+from work_queue import QUEUE_FILE_NAME, open_queue, queue_summary
+from stage_pipeline import LOOP_BLOCK_THRESHOLD, run_pipeline, start_loop_monitor, print_loop_report
+
+# 默认规模
+DEFAULT_TEXT_SIZES = (2000, 20000, 100000)     # 字数
+DEFAULT_AUDIO_SECONDS = (60, 600)              # 配音总时长（秒）
+DEFAULT_DENSITY = 0.1
+DEFAULT_REPEAT = 3
+
+# compare 默认阈值：中位耗时增加超过15%视为变慢；短于1毫秒的差异忽略（计时噪声）
+DEFAULT_THRESHOLD = 0.15
+NOISE_FLOOR_SECONDS = 0.001
+
+# 配音分段时长（与Edge TTS 3000字一段的时长相近）
+SEGMENT_SECONDS = 30
+
+BENCHMARKS = ('extract', 'extract_pool', 'clean', 'fix', 'split', 'concat', 'probe_header', 'probe_ffprobe', 'mix',
+              'startup')
+
+# 进程池基准：每个进程分到的页面数（吞吐量与 extract 对比即多核加速比）
+POOL_PAGES_PER_PROCESS = 4
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# 启动耗时的入口（脚本路径相对仓库根目录，在空的临时目录中运行）；python 为解释器本身的启动耗时，作为下限参考
+STARTUP_COMMANDS = {
+    'python': ['-c', 'pass'],
+    'skill_help': ['skills/article_to_audio_complete.py', '--help'],
+    'mixer_help': ['mix_audio_with_bgm_v2.py', '--help'],
+    'mixer_batch': ['mix_audio_with_bgm_v2.py', '--batch'],
+    'excel_help': ['excel_to_audio_v2.py', '--help'],
+    'bench_help': ['skills/benchmarks.py', '--help'],
+}
+STARTUP_TOP_IMPORTS = 5
+
+
+# ============================================
+# 合成语料
+# ============================================
+# 常用汉字（生成句子用，不追求语义）
+HANZI = ('的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面'
+         '而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开'
+         '它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处府')
+
+# 近似标记词：含有清理规则中的字词，但不构成署名行
+NEAR_MARKERS = ('来源于', '编辑部', '审核通过', '出品方', '执行力', '监制度', '策划案', '微信群')
+
+# 文末署名行（清理规则要删除的部分）
+CREDIT_LINES = ('策划：{name}', '责编：{name}', '审核：{name}', '来源：{name}', '编辑：{name}  责编：{name}',
+                '值班编委：{name}', '出品：{name}', '监制：{name}', '转载请注明出处', '投稿邮箱：{name}@example.com')
+
+
+def make_sentence(rng):
+    """一句话：若干短语，逗号分隔，句号/问号/叹号结尾"""
+
+    phrases = [''.join(rng.choice(HANZI) for _ in range(rng.randint(4, 12))) for _ in range(rng.randint(1, 4))]
+    return '，'.join(phrases) + rng.choice('。。。！？')
+
+
+def generate_text(chars, density=DEFAULT_DENSITY, seed=0):
+    """生成抽取后、清理前的文章文本：段落内有网页换行和空格，文末有署名行"""
+
+    rng = random.Random(seed)
+    paragraphs = []
+    total = 0
+    while total < chars:
+        sentences = [make_sentence(rng) for _ in range(rng.randint(2, 6))]
+        if rng.random() < density:
+            sentences.insert(rng.randint(0, len(sentences)), f"{rng.choice(NEAR_MARKERS)}{make_sentence(rng)}")
+        # 网页中一个段落常被拆成多个span：段内单个换行和多余空格，由 fix_text_formatting 处理
+        para = ''
+        for sentence in sentences:
+            para += sentence + rng.choice(['', '', '\n', ' '])
+        paragraphs.append(para.strip())
+        total += len(para)
+
+    credits = [
+        rng.choice(CREDIT_LINES).format(name=''.join(rng.choice(HANZI) for _ in range(3)))
+        for _ in range(max(1, round(density * 10)))
+    ]
+    return '\n\n'.join(paragraphs + credits)
+
+
+def generate_html(text, seed=0):
+    """把文本包装成类似微信文章的页面：大量脚本样式、嵌套的section/span、图片和页面外框"""
+
+    rng = random.Random(seed)
+    scripts = ''.join(
+        f"<script>var cfg{i} = {{a: {i}, b: '{'x' * rng.randint(200, 2000)}'}};</script>" for i in range(20))
+    styles = ''.join(f"<style>.c{i} {{ margin: {i}px; color: #{i:06x}; }}</style>" for i in range(10))
+
+    body = []
+    for para in text.split('\n\n'):
+        spans = ''.join(
+            f'<span style="font-size: 15px; letter-spacing: 1px;">{line}</span>' + ('<br>' if rng.random() < 0.2 else '')
+            for line in para.split('\n')
+        )
+        block = f'<p style="text-indent: 2em; line-height: 1.75em;">{spans}</p>'
+        if rng.random() < 0.3:
+            block = f'<section style="margin: 10px 0;"><section>{block}</section></section>'
+        if rng.random() < 0.1:
+            block += f'<p><img data-src="https://mmbiz.qpic.cn/{rng.getrandbits(64):x}/640" class="rich_pages"></p>'
+        body.append(block)
+
+    return (
+        f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Article</title>{scripts}{styles}</head><body>"
+        f"<div id=\"js_article\" class=\"rich_media\"><h1 class=\"rich_media_title\">标题</h1>"
+        f"<div class=\"rich_media_content \" id=\"js_content\" style=\"visibility: hidden;\">"
+        f"{''.join(body)}<script>var inner = 1;</script><style>.inner {{}}</style></div>"
+        f"<div class=\"rich_media_tool\">阅读 10万+ 在看 分享</div></div>{scripts}</body></html>"
+    ).encode('utf-8')
+
+
+def generate_voice(path, seconds, seed=0):
+    """生成类似Edge TTS输出的配音：24kHz单声道 48k MP3，没有Xing头（时长需逐帧扫描）"""
+    subprocess.run(voice_command(path, seconds, seed), check=True)
+
+
+def voice_command(path, seconds, seed=0):
+    """生成配音的ffmpeg命令"""
+
+    # 粉红噪声按音节节奏起伏，频谱和包络接近语音
+    return [
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f"anoisesrc=color=pink:sample_rate=24000:amplitude=0.4:seed={seed}:duration={seconds}",
+        '-af', 'tremolo=f=4:d=0.9,lowpass=f=4000',
+        '-ac', '1', '-c:a', 'libmp3lame', '-b:a', '48k', '-write_xing', '0', str(path)
+    ]
+
+
+def generate_bgm(path, seconds=60):
+    """生成BGM：44.1kHz立体声 192k MP3（和弦 + 少量噪声）"""
+
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f"sine=frequency=220:sample_rate=44100:duration={seconds}",
+        '-f', 'lavfi', '-i', f"sine=frequency=277:sample_rate=44100:duration={seconds}",
+        '-f', 'lavfi', '-i', f"anoisesrc=color=brown:sample_rate=44100:amplitude=0.05:duration={seconds}",
+        '-filter_complex', 'amix=inputs=3', '-ac', '2', '-c:a', 'libmp3lame', '-b:a', '192k', str(path)
+    ]
+    subprocess.run(cmd, check=True)
+
+
+# ============================================
+# 计时
+# ============================================
+def measure(func, repeat):
+    """执行 repeat 次，返回每次耗时（秒）；被测函数的输出不打印"""
+
+    times = []
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        for _ in range(repeat):
+            with redirect_stdout(devnull):
+                start = time.perf_counter()
+                func()
+                times.append(time.perf_counter() - start)
+    return times
+
+
+def run_case(name, size, func, repeat, units, unit):
+    """运行一项并打印；出错时记录错误继续后面的项目（如缺少ffprobe）"""
+
+    try:
+        row = result_row(name, size, measure(func, repeat), units, unit)
+    except Exception as e:
+        print(f"  {name:<14} {size:>8}  FAILED: {type(e).__name__}: {str(e)[:60]}")
+        return {'name': name, 'size': size, 'error': f"{type(e).__name__}: {e}"}
+
+    label = {'chars': 'chars', 'audio_seconds': 's    '}.get(unit, '     ')
+    print(f"  {name:<14} {size:>8} {label}  {row['median'] * 1000:>9.2f} ms")
+    return row
+
+
+def result_row(name, size, times, units, unit):
+    """一项结果：耗时统计 + 吞吐量（每秒处理的字数或音频秒数）"""
+
+    median = statistics.median(times)
+    return {
+        'name': name, 'size': size, 'repeat': len(times),
+        'min': round(min(times), 6), 'median': round(median, 6), 'mean': round(statistics.mean(times), 6),
+        'unit': unit, 'throughput': round(units / median, 1) if median > 0 else None,
+    }
+
+
+def bench_text(selected, sizes, density, repeat):
+    """文本类基准：提取、清理、格式修复、分段"""
+
+    rows = []
+    pages = max(1, clean_pool_size()) * POOL_PAGES_PER_PROCESS
+    for size in sizes:
+        text = generate_text(size, density, seed=size)
+        html = generate_html(text, seed=size)
+        cleaned = fix_text_formatting(clean_article_content(text))
+
+        cases = {
+            'extract': (lambda: extract_article_text(html), len(text)),
+            'extract_pool': (lambda: list(get_clean_pool().map(extract_article_text, [html] * pages)),
+                             len(text) * pages),
+            'clean': (lambda: clean_article_content(text), len(text)),
+            'fix': (lambda: fix_text_formatting(text), len(text)),
+            'split': (lambda: split_text_into_segments(cleaned, CONFIG['segment_max_chars']), len(cleaned)),
+        }
+        for name, (func, units) in cases.items():
+            if name in selected:
+                rows.append(run_case(name, size, func, repeat, units, 'chars'))
+    return rows
+
+
+def bench_audio(selected, durations, repeat, work_dir):
+    """音频类基准：拼接、时长探测（帧头解析 / ffprobe）、BGM混音"""
+
+    rows = []
+    bgm_file = work_dir / 'bgm.mp3'
+    generate_bgm(bgm_file)
+
+    for seconds in durations:
+        count = max(1, round(seconds / SEGMENT_SECONDS))
+        segments = []
+        for i in range(count):
+            segments.append(work_dir / f"seg_{seconds}_{i}.mp3")
+            generate_voice(segments[-1], seconds / count, seed=i)
+        voice_file = work_dir / f"voice_{seconds}.mp3"
+        generate_voice(voice_file, seconds, seed=seconds)
+
+        cases = {
+            'concat': lambda: merge_audio_files(segments, work_dir / 'concat_out.mp3'),
+            'probe_header': lambda: read_mp3_duration(voice_file),
+            'probe_ffprobe': lambda: ffprobe_duration(voice_file),
+            'mix': lambda: mix_voice_with_bgm(voice_file, bgm_file, work_dir / 'mix_out.mp3'),
+        }
+        for name, func in cases.items():
+            if name in selected:
+                rows.append(run_case(name, seconds, func, repeat, seconds, 'audio_seconds'))
+    return rows
+
+
+def import_times(stderr):
+    """解析 -X importtime 的输出，返回顶层导入 [(模块, 累计毫秒)]，耗时多的在前"""
+
+    times = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        # 表头行不是数字；嵌套导入的模块名缩进更多，其耗时已计入顶层模块
+        if cumulative.strip().isdigit() and not name.startswith('  '):
+            times.append((name.strip(), int(cumulative) / 1000))
+    return sorted(times, key=lambda item: -item[1])
+
+
+def bench_startup(repeat, work_dir):
+    """启动耗时：每个入口运行 repeat 次取墙钟时间，再加 -X importtime 运行一次统计导入耗时"""
+
+    rows = []
+    for label, args in STARTUP_COMMANDS.items():
+        command = [sys.executable] + [str(ROOT_DIR / arg) if arg.endswith('.py') else arg for arg in args]
+        row = run_case('startup', label, lambda: subprocess.run(command, cwd=work_dir, capture_output=True, check=True),
+                       repeat, 1, 'runs')
+        if 'error' in row:
+            rows.append(row)
+            continue
+
+        result = subprocess.run([command[0], '-X', 'importtime'] + command[1:], cwd=work_dir, capture_output=True,
+                                text=True, encoding='utf-8', errors='replace')
+        imports = import_times(result.stderr)
+        row['import_ms'] = round(sum(ms for _, ms in imports), 1)
+        row['top_imports'] = [[name, round(ms, 1)] for name, ms in imports[:STARTUP_TOP_IMPORTS]]
+        top = ', '.join(f"{name} {ms:.0f}" for name, ms in row['top_imports'])
+        print(f"  {'':<14} {'':>8}        imports {row['import_ms']:>6.1f} ms ({top})")
+        rows.append(row)
+    return rows
+
+
+def ffmpeg_version():
+    """ffmpeg版本（结果随ffmpeg版本变化，一并记录）"""
+
+    try:
+        result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
+        return result.stdout.split('\n')[0]
+    except OSError:
+        return None
+
+
+def run_benchmarks(selected=BENCHMARKS, sizes=DEFAULT_TEXT_SIZES, durations=DEFAULT_AUDIO_SECONDS,
+                   density=DEFAULT_DENSITY, repeat=DEFAULT_REPEAT):
+    """运行所选基准，返回结果（含运行环境信息）"""
+
+    print("="*70)
+    print(f" Offline benchmarks (repeat {repeat}, marker density {density})")
+    print("="*70)
+
+    if 'extract_pool' in selected:
+        # 进程启动和导入不计入：先让每个进程都处理过一次
+        for future in [get_clean_pool().submit(os.getpid) for _ in range(max(1, clean_pool_size()) * 2)]:
+            future.result()
+    rows = bench_text(selected, sizes, density, repeat)
+    shutdown_clean_pool()
+    if any(name in selected for name in ('concat', 'probe_header', 'probe_ffprobe', 'mix')):
+        with tempfile.TemporaryDirectory() as tmp:
+            rows += bench_audio(selected, durations, repeat, Path(tmp))
+    if 'startup' in selected:
+        with tempfile.TemporaryDirectory() as tmp:
+            rows += bench_startup(repeat, Path(tmp))
+
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'clean_processes': clean_pool_size(),
+            'ffmpeg': ffmpeg_version(),
+            'density': density,
+            'repeat': repeat,
+        },
+        'results': rows,
+    }
+
+
+# ============================================
+# 对照基准
+# ============================================
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """逐项比较中位耗时，返回 [(名称, 规模, 基准, 当前, 比值, 是否变慢)]"""
+
+    base_rows = {(row['name'], row['size']): row for row in baseline['results'] if 'error' not in row}
+    compared = []
+    for row in current['results']:
+        base = base_rows.get((row['name'], row['size']))
+        if base is None or 'error' in row:
+            continue
+        ratio = row['median'] / base['median'] if base['median'] > 0 else float('inf')
+        slower = ratio > 1 + threshold and row['median'] - base['median'] > NOISE_FLOOR_SECONDS
+        compared.append((row['name'], row['size'], base['median'], row['median'], ratio, slower))
+    return compared
+
+
+def meta_differences(baseline, current):
+    """运行环境或参数不同的字段（此时比较结果仅供参考）"""
+
+    fields = ('python', 'cpu_count', 'ffmpeg', 'density', 'repeat')
+    return [
+        (field, baseline['meta'].get(field), current['meta'].get(field))
+        for field in fields if baseline['meta'].get(field) != current['meta'].get(field)
+    ]
+
+
+def print_comparison(compared, threshold):
+    """打印对照表，返回变慢的项数"""
+
+    print("="*70)
+    print(f" {'Benchmark':<14} {'Size':>8} {'Base ms':>10} {'Now ms':>10} {'Ratio':>7}")
+    print("="*70)
+    for name, size, base, now, ratio, slower in compared:
+        flag = '  REGRESSION' if slower else ''
+        print(f" {name:<14} {size:>8} {base * 1000:>10.2f} {now * 1000:>10.2f} {ratio:>6.2f}x{flag}")
+    print("="*70)
+    regressions = sum(1 for *_, slower in compared if slower)
+    print(f"  {regressions} regression(s) over {threshold:.0%} (of {len(compared)} compared)")
+    return regressions
+
+
+# ============================================
+# 事件循环阻塞检查
+# ============================================
+# 模拟TTS：每次请求的网络延迟，以及每秒配音对应的字数
+LOOPCHECK_TTS_LATENCY = 0.3
+LOOPCHECK_CHARS_PER_SECOND = 100
+
+
+async def offline_tts(text, output_path, voice, rate=None):
+    """代替Edge TTS：等待模拟的网络延迟，再异步生成与文本长度相称的配音"""
+
+    await asyncio.sleep(LOOPCHECK_TTS_LATENCY)
+    seconds = max(1.0, len(text) / LOOPCHECK_CHARS_PER_SECOND)
+    proc = await asyncio.create_subprocess_exec(*voice_command(output_path, seconds, seed=len(text)))
+    if await proc.wait() != 0:
+        raise RuntimeError('voice generation failed')
+
+
+def synthetic_pages(articles, chars, density):
+    """合成文章页面：{链接: HTML}（同样的参数每次生成的内容相同）"""
+
+    return {f"https://example.com/article/{i + 1}": generate_html(generate_text(chars, density, seed=i), seed=i)
+            for i in range(articles)}
+
+
+def use_offline_pipeline(pages, bgm_folder, work_dir):
+    """流水线只替换访问网络的两处（下载、TTS），其余都是正式代码；输出都写到 work_dir 下"""
+
+    pipeline.download_article_html = pages.get
+    pipeline.synthesize_to_file = offline_tts
+    CONFIG.update(
+        bgm_folder=str(bgm_folder), output_text_folder=str(work_dir / 'text'),
+        output_voice_folder=str(work_dir / 'voice'), output_final_folder=str(work_dir / 'final'),
+        tts_cache_folder=str(work_dir / 'cache'), delay_between_articles=0, delay_between_batches=0,
+    )
+    voice_folder, output_folder = Path(CONFIG['output_voice_folder']), Path(CONFIG['output_final_folder'])
+    voice_folder.mkdir(parents=True, exist_ok=True)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    return voice_folder, output_folder
+
+
+async def run_loop_check(articles, chars, density, threshold):
+    """合成语料走一遍完整流水线（抓取→清理→分段→TTS→拼接→混音），返回阻塞检查是否通过"""
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        (work_dir / 'bgm').mkdir()
+        generate_bgm(work_dir / 'bgm' / 'bgm.mp3')
+
+        pages = synthetic_pages(articles, chars, density)
+        items = [{'index': i + 1, 'idx': i + 1, 'title': f"Article {i + 1}", 'url': url,
+                  'base_name': pipeline.article_base_name(i + 1, f"Article {i + 1}")}
+                 for i, url in enumerate(pages)]
+        voice_folder, output_folder = use_offline_pipeline(pages, work_dir / 'bgm', work_dir)
+
+        variants = pipeline.resolve_variants()
+        pipeline.prepare_bgm_beds(variants)
+        ctx = pipeline.new_context(voice_folder, output_folder, variants, open_state(output_folder))
+        outcomes = {}
+        monitor, stop = start_loop_monitor(threshold)
+        try:
+            _, _, wall_time = await run_pipeline(items, pipeline.build_stages(ctx), None,
+                                                 pipeline.new_error_handler(ctx, outcomes))
+        finally:
+            stop()
+            shutdown_clean_pool()
+            ctx['db'].shutdown()
+
+        finished = len(list(output_folder.glob('*.mp3')))
+        print("="*70)
+        print(f"  Articles:        {articles} x {chars} chars -> {finished} finished in {wall_time:.1f}s")
+        ok = print_loop_report(monitor)
+        print("="*70)
+        return ok and finished == articles
+
+
+# ============================================
+# 多worker分担检查
+# ============================================
+# 第二个worker晚启动的秒数（先启动的worker若不限制持有数，会在这段时间里把任务全部领走）
+WORKERCHECK_STAGGER = 1.0
+
+
+def worker_check_child(work_dir, name, articles, chars, density):
+    """一个worker进程：离线流水线以 --worker 模式从共享队列领取文章，输出写到 work_dir/name"""
+
+    pages = synthetic_pages(articles, chars, density)
+    use_offline_pipeline(pages, work_dir / 'bgm', work_dir / name)
+    CONFIG.update(queue_poll_seconds=0.5, clean_processes=0)
+    with open(work_dir / f"{name}.log", 'w', encoding='utf-8') as log_file, redirect_stdout(log_file):
+        asyncio.run(pipeline.main(str(work_dir / 'articles.jsonl'), worker=True,
+                                  queue_path=str(work_dir / QUEUE_FILE_NAME)))
+
+
+def run_worker_check(articles=6, chars=3000, density=DEFAULT_DENSITY):
+    """两个worker进程（第二个晚启动）处理同一个队列，检查两边都分到文章且每篇只完成一次"""
+
+    import multiprocessing
+
+    spawn = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        (work_dir / 'bgm').mkdir()
+        generate_bgm(work_dir / 'bgm' / 'bgm.mp3')
+        with open(work_dir / 'articles.jsonl', 'w', encoding='utf-8') as f:
+            for i, url in enumerate(synthetic_pages(articles, chars, density)):
+                f.write(json.dumps({'idx': i + 1, 'title': f"Article {i + 1}", 'url': url}) + '\n')
+
+        start = time.perf_counter()
+        names = ('worker1', 'worker2')
+        procs = []
+        for name in names:
+            proc = spawn.Process(target=worker_check_child, args=(work_dir, name, articles, chars, density))
+            proc.start()
+            procs.append(proc)
+            time.sleep(WORKERCHECK_STAGGER)
+        for proc in procs:
+            proc.join()
+        wall_time = time.perf_counter() - start
+
+        finished = {name: len(list((work_dir / name / 'final').glob('*.mp3'))) for name in names}
+        summary = queue_summary(open_queue(work_dir / QUEUE_FILE_NAME))
+
+        ok = (all(finished.values()) and sum(finished.values()) == articles
+              and summary.get('done', 0) == articles and all(proc.exitcode == 0 for proc in procs))
+        print("="*70)
+        print(f"  Articles:        {articles} x {chars} chars, 2 workers "
+              f"(second started {WORKERCHECK_STAGGER:.0f}s later), {wall_time:.1f}s")
+        print(f"  Finished:        " + ", ".join(f"{name} {count}" for name, count in finished.items()))
+        print(f"  Queue:           {summary}")
+        print(f"  Result:          {'OK' if ok else 'FAILED'}")
+        print("="*70)
+        return ok
+
+
+# ============================================
+# 公共段落检测检查
+# ============================================
+DEDUPE_INTRO = '欢迎收听科协之声，这里是科学家的故事，每周为你讲述一位科技工作者的成长经历。'
+DEDUPE_REWORDED = '欢迎收听科协之声，这里是科学家的故事，每周为你讲述两位科技工作者的成长经历。'
+# 同一段结尾，各篇排版不同（只差标点、空格），应识别为同一段
+DEDUPE_FOOTERS = ('感谢阅读！欢迎转发分享给身边的朋友，关注我们，获取更多科学家的故事。',
+                  '感谢阅读!  欢迎转发、分享给身边的朋友——关注我们 获取更多科学家的故事')
+
+
+def run_dedupe_check(articles=4, chars=3000):
+    """合成页面（共同的开场段和结尾段，另有一篇开场段措辞略有不同）经真实的提取流程，检查公共段落的识别和共用"""
+
+    contents = {}
+    for i in range(articles + 1):
+        intro = DEDUPE_REWORDED if i == articles else DEDUPE_INTRO
+        footer = DEDUPE_FOOTERS[i % len(DEDUPE_FOOTERS)]
+        # 结尾段放在署名行之前（署名行及其后的内容会被清理掉）
+        body, credits = generate_text(chars, density=0, seed=i).rsplit('\n\n', 1)
+        html = generate_html(f"{intro}\n\n{body}\n\n{footer}\n\n{credits}", seed=i)
+        contents[i] = extract_article_text(html)
+
+    boilerplate = detect_boilerplate(contents)
+
+    def shared_keys(paragraph):
+        norm = normalize_paragraph(paragraph)
+        return {key for key, text in boilerplate['texts'].items() if normalize_paragraph(text) == norm}
+
+    intro_keys, footer_keys = shared_keys(DEDUPE_INTRO), shared_keys(DEDUPE_FOOTERS[0])
+
+    def cached_pieces(content):
+        return set(piece for kind, piece in plan_speech_pieces(content, boilerplate) if kind == 'cached')
+
+    intro_found = [i for i in range(articles) if cached_pieces(contents[i]) & intro_keys]
+    footer_found = [i for i in contents if cached_pieces(contents[i]) & footer_keys]
+    reworded = cached_pieces(contents[articles]) - footer_keys
+
+    ok = (len(intro_keys) == 1 and len(footer_keys) == 1 and len(intro_found) == articles
+          and len(footer_found) == len(contents) and not reworded)
+    print("="*70)
+    print(f"  Articles:        {articles} with the same intro + 1 reworded, footers in "
+          f"{len(DEDUPE_FOOTERS)} layouts (extracted from HTML)")
+    print(f"  Paragraphs:      {sum(len(text.split(chr(10) * 2)) for text in contents.values())} after extraction")
+    print(f"  Shared intro:    detected in {len(intro_found)}/{articles} articles")
+    print(f"  Shared footer:   detected in {len(footer_found)}/{len(contents)} articles "
+          f"({len(footer_keys)} group(s), expected 1)")
+    print(f"  Reworded intro:  {len(reworded)} shared piece(s) (expected 0)")
+    print(f"  Result:          {'OK' if ok else 'FAILED'}")
+    print("="*70)
+    return ok
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Offline benchmarks with a synthetic article corpus')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='Run benchmarks')
+    run.add_argument('--only', nargs='+', choices=BENCHMARKS, help='Benchmarks to run (default: all)')
+    run.add_argument('--sizes', nargs='+', type=int, default=list(DEFAULT_TEXT_SIZES),
+                     help='Text sizes in characters')
+    run.add_argument('--audio-seconds', nargs='+', type=int, default=list(DEFAULT_AUDIO_SECONDS),
+                     help='Voice durations in seconds for audio benchmarks')
+    run.add_argument('--density', type=float, default=DEFAULT_DENSITY, help='Marker density (0-1)')
+    run.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    run.add_argument('--json', help='Write results to this JSON file')
+
+    cmp = sub.add_parser('compare', help='Flag regressions against a baseline result file')
+    cmp.add_argument('baseline')
+    cmp.add_argument('current')
+    cmp.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                     help='Allowed slowdown of the median time (default: 0.15 = 15%%)')
+
+    loop = sub.add_parser('loopcheck', help='Run the pipeline offline and fail if the event loop gets blocked')
+    loop.add_argument('--articles', type=int, default=6)
+    loop.add_argument('--chars', type=int, default=5000, help='Characters per article')
+    loop.add_argument('--density', type=float, default=DEFAULT_DENSITY, help='Marker density (0-1)')
+    loop.add_argument('--threshold-ms', type=int, default=round(LOOP_BLOCK_THRESHOLD * 1000),
+                      help='Longest allowed event loop stall in milliseconds')
+
+    dedupe = sub.add_parser('dedupecheck', help='Check boilerplate detection on extracted synthetic pages')
+    dedupe.add_argument('--articles', type=int, default=4)
+    dedupe.add_argument('--chars', type=int, default=3000, help='Characters per article')
+
+    workers = sub.add_parser('workercheck', help='Check that two workers on one queue split the articles')
+    workers.add_argument('--articles', type=int, default=6)
+    workers.add_argument('--chars', type=int, default=3000, help='Characters per article')
+
+    args = parser.parse_args()
+
+    if args.command == 'workercheck':
+        sys.exit(0 if run_worker_check(args.articles, args.chars) else 1)
+    elif args.command == 'dedupecheck':
+        sys.exit(0 if run_dedupe_check(args.articles, args.chars) else 1)
+    elif args.command == 'loopcheck':
+        sys.exit(0 if asyncio.run(run_loop_check(args.articles, args.chars, args.density,
+                                                 args.threshold_ms / 1000)) else 1)
+    elif args.command == 'run':
+        results = run_benchmarks(args.only or BENCHMARKS, args.sizes, args.audio_seconds, args.density, args.repeat)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            print(f"[OK] Results saved: {args.json}")
+    else:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.current, 'r', encoding='utf-8') as f:
+            current = json.load(f)
+        for field, before, after in meta_differences(baseline, current):
+            print(f"[!] {field} differs: {before} -> {after}")
+        sys.exit(1 if print_comparison(compare_results(baseline, current, args.threshold), args.threshold) else 0)
@@ -0,0 +1,225 @@
+"""
+输出编码方案
+- 预设多种成品编码：原来的立体声MP3 192k，以及针对语音的低码率单声道MP3、Opus、AAC
+- 每个方案包含编码器参数、采样率、声道数和文件后缀
+- 直接运行本文件可对样本音频做编码基准测试：编码耗时、文件大小、质量（对齐后的幅度谱信噪比）
+
+用法：
+    python skills/encode_profiles.py audio_output/001_xxx.mp3 audio_output/002_xxx.mp3
+    python skills/encode_profiles.py sample.mp3 --profiles mp3_speech opus_speech --json bench.json
+"""
+
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 默认方案（与原来的输出一致）
+DEFAULT_PROFILE = 'mp3_192k'
+
+ENCODE_PROFILES = {
+    # 原输出：立体声 44.1kHz MP3 192k
+    'mp3_192k': {
+        'args': ['-c:a', 'libmp3lame', '-b:a', '192k'],
+        'sample_rate': 44100, 'channels': 2, 'suffix': '.mp3',
+    },
+    # 语音单声道MP3：兼容性最好，体积约为原来的1/4
+    'mp3_speech': {
+        'args': ['-c:a', 'libmp3lame', '-b:a', '48k'],
+        'sample_rate': 24000, 'channels': 1, 'suffix': '.mp3',
+    },
+    # Opus：同等音质下码率最低，适合网页/App播放
+    'opus_speech': {
+        'args': ['-c:a', 'libopus', '-b:a', '32k', '-application', 'voip'],
+        'sample_rate': 24000, 'channels': 1, 'suffix': '.opus',
+    },
+    # AAC：苹果设备和播客平台通用
+    'aac_speech': {
+        'args': ['-c:a', 'aac', '-b:a', '48k'],
+        'sample_rate': 24000, 'channels': 1, 'suffix': '.m4a',
+    },
+}
+
+
+def get_profile(name):
+    """按名称取编码方案"""
+
+    if name not in ENCODE_PROFILES:
+        raise ValueError(f"Unknown output profile: {name} (available: {', '.join(ENCODE_PROFILES)})")
+    return ENCODE_PROFILES[name]
+
+
+def encode_args(name):
+    """方案对应的ffmpeg输出参数（编码器 + 采样率 + 声道数）"""
+
+    profile = get_profile(name)
+    return [*profile['args'], '-ar', str(profile['sample_rate']), '-ac', str(profile['channels'])]
+
+
+def output_suffix(name):
+    """方案对应的文件后缀"""
+    return get_profile(name)['suffix']
+
+
+def profile_bitrate(name):
+    """方案的目标码率（bit/s），取自 -b:a 参数"""
+
+    args = get_profile(name)['args']
+    value = args[args.index('-b:a') + 1]
+    return int(value[:-1]) * 1000 if value.endswith('k') else int(value)
+
+
+# ============================================
+# 编码基准测试
+# ============================================
+# 质量比较统一在此采样率下进行（覆盖语音频带）
+QUALITY_SAMPLE_RATE = 16000
+
+# 对齐时搜索的最大延迟（编码器会在开头补齐若干采样）
+MAX_ALIGN_SECONDS = 0.1
+
+
+def decode_mono(file_path, sample_rate=QUALITY_SAMPLE_RATE):
+    """解码为单声道float32数组"""
+
+    import numpy as np
+
+    cmd = [
+        'ffmpeg', '-v', 'error', '-i', str(file_path),
+        '-f', 'f32le', '-ar', str(sample_rate), '-ac', '1', '-'
+    ]
+    result = subprocess.run(cmd, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"decode failed: {result.stderr[:200]}")
+    return np.frombuffer(result.stdout, dtype='<f4')
+
+
+def align_delay(reference, encoded, sample_rate=QUALITY_SAMPLE_RATE):
+    """估计编码器延迟（采样数）：在开头10秒内找使误差最小的偏移"""
+
+    import numpy as np
+
+    window = reference[:sample_rate * 10]
+    best_lag, best_error = 0, None
+    for lag in range(int(MAX_ALIGN_SECONDS * sample_rate) + 1):
+        candidate = encoded[lag:lag + len(window)]
+        if len(candidate) < len(window):
+            break
+        diff = window - candidate
+        error = float(np.dot(diff, diff))
+        if best_error is None or error < best_error:
+            best_lag, best_error = lag, error
+    return best_lag
+
+
+def spectral_snr(reference, encoded, sample_rate=QUALITY_SAMPLE_RATE, frame=512):
+    """对齐后比较短时幅度谱的信噪比(dB)，越高越接近原音
+
+    只比较幅度谱，不受Opus等编码器相位变化的影响。
+    """
+
+    import numpy as np
+
+    lag = align_delay(reference, encoded, sample_rate)
+    n = min(len(reference), len(encoded) - lag)
+    frames = (n - frame) // (frame // 2) + 1 if n >= frame else 0
+    if frames <= 0:
+        return float('-inf')
+
+    window = np.hanning(frame).astype(np.float32)
+    index = np.arange(frame)[None, :] + (frame // 2) * np.arange(frames)[:, None]
+    ref_mag = np.abs(np.fft.rfft(reference[index] * window, axis=1))
+    enc_mag = np.abs(np.fft.rfft(encoded[lag:][index] * window, axis=1))
+
+    signal_power = float(np.sum(ref_mag.astype(np.float64) ** 2))
+    noise_power = float(np.sum((ref_mag.astype(np.float64) - enc_mag) ** 2))
+    if noise_power == 0:
+        return float('inf')
+    return float(10 * np.log10(signal_power / noise_power))
+
+
+def benchmark_profile(source_wav, reference, duration, name, work_dir):
+    """用一个方案编码样本，返回 耗时、大小、码率、信噪比"""
+
+    output_file = Path(work_dir) / f"{Path(source_wav).stem}_{name}{output_suffix(name)}"
+    cmd = ['ffmpeg', '-y', '-v', 'error', '-i', str(source_wav), *encode_args(name), str(output_file)]
+
+    start = time.perf_counter()
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+
+    if result.returncode != 0:
+        return {'profile': name, 'error': result.stderr[:200]}
+
+    size = output_file.stat().st_size
+    return {
+        'profile': name,
+        'encode_seconds': round(elapsed, 3),
+        'realtime_factor': round(duration / elapsed, 1) if elapsed > 0 else None,
+        'size_bytes': size,
+        'kbps': round(size * 8 / duration / 1000, 1) if duration > 0 else None,
+        'snr_db': round(spectral_snr(reference, decode_mono(output_file)), 2),
+    }
+
+
+def run_benchmark(samples, profiles=None):
+    """对每个样本、每个方案做编码测试，返回结果列表"""
+
+    profiles = profiles or list(ENCODE_PROFILES)
+    for name in profiles:
+        get_profile(name)
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for sample in samples:
+            # 先解码成WAV（不计时），各方案从同一份PCM开始编码
+            source_wav = Path(work_dir) / f"{Path(sample).stem}.wav"
+            subprocess.run(['ffmpeg', '-y', '-v', 'error', '-i', str(sample), str(source_wav)], check=True)
+            reference = decode_mono(source_wav)
+            duration = len(reference) / QUALITY_SAMPLE_RATE
+
+            for name in profiles:
+                row = benchmark_profile(source_wav, reference, duration, name, work_dir)
+                row['sample'] = Path(sample).name
+                row['duration'] = round(duration, 2)
+                results.append(row)
+    return results
+
+
+def print_results(results):
+    """打印基准测试表格"""
+
+    print("="*78)
+    print(f" {'Sample':<22} {'Profile':<12} {'Encode':>8} {'xRT':>7} {'Size KB':>9} {'kbps':>7} {'SNR dB':>8}")
+    print("="*78)
+    for row in results:
+        if 'error' in row:
+            print(f" {row['sample'][:22]:<22} {row['profile']:<12} FAILED: {row['error'][:40]}")
+            continue
+        print(f" {row['sample'][:22]:<22} {row['profile']:<12} {row['encode_seconds']:>7.2f}s "
+              f"{row['realtime_factor']:>7} {row['size_bytes']/1024:>9.1f} {row['kbps']:>7} {row['snr_db']:>8}")
+    print("="*78)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark output encode profiles on sample audio')
+    parser.add_argument('samples', nargs='+', help='Sample audio files (e.g. synthesized articles)')
+    parser.add_argument('--profiles', nargs='+', choices=list(ENCODE_PROFILES),
+                        help='Profiles to test (default: all)')
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+
+    args = parser.parse_args()
+
+    results = run_benchmark(args.samples, args.profiles)
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"[OK] Results saved: {args.json}")
+
+    sys.exit(1 if any('error' in row for row in results) else 0)
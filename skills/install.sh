@@ -21,8 +21,8 @@ echo ""
 
 # 安装Python包
 echo "[2/5] 安装Python依赖包..."
-echo "  正在安装: pandas, openpyxl, edge-tts, requests, beautifulsoup4, lxml"
-pip install pandas openpyxl edge-tts requests beautifulsoup4 lxml -q
+echo "  正在安装: openpyxl, edge-tts, requests, beautifulsoup4, lxml"
+pip install openpyxl edge-tts requests beautifulsoup4 lxml -q
 echo "  [OK] Python包安装完成"
 echo ""
 
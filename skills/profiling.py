@@ -0,0 +1,141 @@
+"""
+性能剖析模式（--profile）
+- 按阶段统计：cProfile 热点函数、tracemalloc Python内存分配峰值、ffmpeg子进程的峰值内存(RSS)
+- 同一时刻只能有一个cProfile在运行（Python 3.12起为进程级），各阶段的阻塞操作在剖析模式下依次执行，
+  所以剖析时的总耗时会变长，数据用于定位热点而不是衡量吞吐
+- 子进程峰值内存通过 wait4 的资源统计取得（Linux/macOS；Windows不支持，只统计Python部分）
+- 结果写入目录：report.txt（各阶段汇总和热点）以及每个阶段的 .prof（可用 snakeviz 等工具查看）
+"""
+
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+PROFILE = {
+    'enabled': False,
+    'stages': {},        # 阶段名 -> 统计
+    'children': [],      # [(阶段名, 命令, 峰值RSS字节)]
+    'lock': threading.Lock(),
+    'local': threading.local(),
+}
+
+
+class RusagePopen(subprocess.Popen):
+    """回收子进程时顺带取得资源统计（峰值RSS）"""
+
+    def _try_wait(self, wait_flags):
+        try:
+            pid, sts, usage = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            return self.pid, 0
+        if pid == self.pid:
+            # Linux 的 ru_maxrss 单位是KB，macOS 是字节
+            peak = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+            command = self.args[0] if isinstance(self.args, (list, tuple)) else str(self.args).split()[0]
+            PROFILE['children'].append((getattr(PROFILE['local'], 'stage', None) or 'other',
+                                        Path(str(command)).name, peak))
+        return pid, sts
+
+
+def profile_enable():
+    """开启剖析：内存分配跟踪 + 子进程资源统计"""
+
+    PROFILE['enabled'] = True
+    tracemalloc.start()
+    if hasattr(os, 'wait4'):
+        # subprocess.run 内部按模块属性取 Popen，替换后所有子进程都会记录
+        subprocess.Popen = RusagePopen
+
+
+def new_stage_profile():
+    return {'calls': 0, 'seconds': 0.0, 'peak_bytes': 0, 'stats': None}
+
+
+def profile_call(stage, func, *args, **kwargs):
+    """执行 func；剖析模式下记入该阶段的CPU热点和内存峰值"""
+
+    if not PROFILE['enabled']:
+        return func(*args, **kwargs)
+
+    import cProfile
+    import pstats
+
+    with PROFILE['lock']:
+        record = PROFILE['stages'].setdefault(stage, new_stage_profile())
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        PROFILE['local'].stage = stage
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            record['seconds'] += time.perf_counter() - start
+            record['calls'] += 1
+            record['peak_bytes'] = max(record['peak_bytes'], tracemalloc.get_traced_memory()[1] - base)
+            PROFILE['local'].stage = None
+            if record['stats'] is None:
+                record['stats'] = pstats.Stats(profiler)
+            else:
+                record['stats'].add(profiler)
+
+
+def format_size(size):
+    """字节数 -> 便于阅读的大小"""
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+
+def profile_summary():
+    """各阶段汇总表：调用次数、耗时、Python分配峰值、子进程数和最大峰值RSS"""
+
+    lines = [f"{'Stage':<12} {'Calls':>6} {'Seconds':>9} {'Py peak':>9} {'Children':>9} {'Child RSS':>10}"]
+    stage_names = list(PROFILE['stages']) + sorted(
+        {stage for stage, _, _ in PROFILE['children']} - set(PROFILE['stages']))
+    for stage in stage_names:
+        record = PROFILE['stages'].get(stage, new_stage_profile())
+        rss = [peak for s, _, peak in PROFILE['children'] if s == stage]
+        lines.append(f"{stage:<12} {record['calls']:>6} {record['seconds']:>9.2f} {format_size(record['peak_bytes']):>9} "
+                     f"{len(rss):>9} {format_size(max(rss)) if rss else '-':>10}")
+
+    if not hasattr(os, 'wait4'):
+        lines.append("(child process memory is not available on this platform)")
+    return '\n'.join(lines)
+
+
+def profile_report(top=15):
+    """文本报告：阶段汇总 + 各阶段热点函数"""
+
+    out = io.StringIO()
+    out.write(profile_summary() + '\n')
+    for stage, record in PROFILE['stages'].items():
+        if record['stats'] is None:
+            continue
+        out.write(f"\n{'='*70}\n[{stage}] top {top} functions by cumulative time\n{'='*70}\n")
+        record['stats'].stream = out
+        record['stats'].sort_stats('cumulative').print_stats(top)
+    return out.getvalue()
+
+
+def save_profile(folder, top=15):
+    """写出 report.txt 和各阶段的 .prof 文件，返回报告路径"""
+
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    for stage, record in PROFILE['stages'].items():
+        if record['stats'] is not None:
+            record['stats'].dump_stats(str(folder / f"{stage}.prof"))
+
+    report_path = folder / 'report.txt'
+    report_path.write_text(profile_report(top), encoding='utf-8')
+    return report_path
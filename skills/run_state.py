@@ -0,0 +1,130 @@
+"""
+运行状态（SQLite，崩溃后可续跑）
+- 数据库放在成品目录中：<output_final_folder>/.run_state.sqlite
+- 每篇文章（及每个语音版本）的每个阶段记录状态 running/done/failed 和产物路径
+- 每次状态变化单独提交（WAL模式），进程随时被杀也不会写坏
+- 多台机器共享同一目录时（--worker）改用普通日志模式，WAL不支持网络文件系统
+- 产物先写 .part 临时文件再原子改名，数据库标记为done时文件一定完整
+- 续跑时：状态为done且产物仍存在的阶段直接跳过，running/failed 的阶段重新执行
+"""
+
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+STATE_FILE_NAME = '.run_state.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stages (
+    article    TEXT NOT NULL,
+    variant    TEXT NOT NULL DEFAULT '',
+    stage      TEXT NOT NULL,
+    status     TEXT NOT NULL,
+    artifact   TEXT,
+    error      TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (article, variant, stage)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def open_state(folder, shared=False):
+    """打开（或创建）运行状态数据库（shared=True：可能被多台机器同时访问）
+
+    连接可在其他线程中使用（调用方需保证同一时刻只有一个线程访问，如专用的单线程executor）。
+    """
+
+    path = Path(folder) / STATE_FILE_NAME
+    conn = sqlite3.connect(str(path), isolation_level=None, timeout=30, check_same_thread=False)
+    conn.execute(f"PRAGMA journal_mode={'DELETE' if shared else 'WAL'}")
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def reset_state(conn):
+    """新的一次运行：清空上次的记录"""
+
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('DELETE FROM stages')
+        conn.execute('DELETE FROM meta')
+
+
+def save_run_args(conn, args):
+    """记录本次运行参数（续跑时沿用）"""
+
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        for key, value in args.items():
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+
+def load_run_args(conn):
+    """读取上次运行参数"""
+    return {key: json.loads(value) for key, value in conn.execute('SELECT key, value FROM meta')}
+
+
+def mark_stage(conn, article, variant, stage, status, artifact=None, error=None):
+    """记录一个阶段的状态（单条语句即一个事务，提交后才返回）"""
+
+    conn.execute(
+        'INSERT OR REPLACE INTO stages (article, variant, stage, status, artifact, error, updated_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (article, variant or '', stage, status, str(artifact) if artifact else None, error, time.time())
+    )
+
+
+def completed_artifact(conn, article, variant, stage):
+    """阶段已完成且产物仍存在时返回产物路径，否则返回None"""
+
+    row = conn.execute(
+        'SELECT status, artifact FROM stages WHERE article = ? AND variant = ? AND stage = ?',
+        (article, variant or '', stage)
+    ).fetchone()
+    if not row or row[0] != 'done':
+        return None
+    if row[1] is None:
+        return ''
+    return Path(row[1]) if Path(row[1]).exists() else None
+
+
+def state_summary(conn):
+    """各状态的阶段数，如 {'done': 120, 'failed': 2}"""
+    return dict(conn.execute('SELECT status, COUNT(*) FROM stages GROUP BY status'))
+
+
+# ============================================
+# 原子写文件
+# ============================================
+def partial_path(path):
+    """临时文件路径（保留扩展名，ffmpeg据此判断格式）"""
+    path = Path(path)
+    return path.with_name(f"{path.stem}.part{path.suffix}")
+
+
+def atomic_write_text(path, text):
+    """先写临时文件再改名，文件要么是旧的要么是完整的新内容"""
+
+    tmp_path = partial_path(path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def commit_partial(path):
+    """把 .part 临时文件改名为正式文件"""
+    os.replace(partial_path(path), path)
+
+
+def discard_partial(path):
+    """删除失败或中断时留下的 .part 临时文件"""
+    partial_path(path).unlink(missing_ok=True)
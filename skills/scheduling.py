@@ -0,0 +1,119 @@
+"""
+按预测耗时安排文章顺序（减少整批运行的"长尾"）
+- 预测模型：TTS耗时按需要合成的字数和分段数估算（走缓存的段落不计），混音耗时按音频时长估算
+- 排序：最长处理时间优先（LPT）——长文章先开始，短文章填补各worker的空档，
+  避免最后只剩一篇长文章在跑、其他worker空等
+- 预测整批耗时：按给定顺序把文章交给最早空闲的worker（列表调度），文章要等抓取完成才能开始；
+  对比原顺序和LPT顺序，运行结束后与实际耗时对照
+- 校准：每次正式运行记录TTS请求耗时、配音时长、混音耗时和成品大小，更新 .audio_cache/cost_model.json，
+  之后的排程和 --plan 预估都用校准后的模型
+"""
+
+import heapq
+import json
+import os
+from pathlib import Path
+
+COST_MODEL_FILE = Path('.audio_cache') / 'cost_model.json'
+
+# 默认预测模型（Edge TTS：约3000字/段，每段15~25秒；中文朗读约每分钟250字）
+DEFAULT_COST_MODEL = {
+    'tts_seconds_per_char': 0.006,         # 每个需要合成的字
+    'tts_seconds_per_segment': 1.5,        # 每个分段的请求开销
+    'chars_per_audio_minute': 250,         # 每分钟音频的字数
+    'mix_seconds_per_audio_minute': 0.6,   # 拼接+混音+编码，每分钟音频
+    'fetch_seconds': 1.0,                  # 每篇文章下载+解析（不含限速等待）
+    'voice_bytes_per_minute': 360000,      # 纯配音（Edge TTS 48kbps）每分钟字节数
+    'final_bytes_per_minute': {},          # 成品每分钟字节数（按编码方案，校准前按码率计算）
+    'calibrated_runs': 0,
+}
+
+
+def audio_minutes(chars, model=DEFAULT_COST_MODEL):
+    """按字数估算音频时长（分钟）"""
+    return chars / model['chars_per_audio_minute']
+
+
+def predict_cost(chars, segments, cached_chars=0, model=DEFAULT_COST_MODEL, tts_slots=1):
+    """预测一篇文章（一个版本）的处理耗时（秒）：TTS（各分段分摊到并发的TTS请求上）+ 混音"""
+
+    tts = (chars - cached_chars) * model['tts_seconds_per_char'] + segments * model['tts_seconds_per_segment']
+    parallel = max(1, min(segments, tts_slots))
+    return tts / parallel + audio_minutes(chars, model) * model['mix_seconds_per_audio_minute']
+
+
+def lpt_order(costs):
+    """最长处理时间优先：按预测耗时从大到小排列的下标（耗时相同的保持原顺序）"""
+    return sorted(range(len(costs)), key=lambda i: -costs[i])
+
+
+def simulate_makespan(jobs, workers):
+    """列表调度：jobs=[(可开始时刻, 耗时)]，按顺序交给最早空闲的worker，返回全部完成的时刻"""
+
+    free = [0.0] * max(1, workers)
+    end = 0.0
+    for release, cost in jobs:
+        start = max(heapq.heappop(free), release)
+        heapq.heappush(free, start + cost)
+        end = max(end, start + cost)
+    return end
+
+
+# ============================================
+# 校准
+# ============================================
+def new_cost_samples():
+    """一次运行中的测量值"""
+    return {'tts_seconds': 0.0, 'tts_chars': 0, 'tts_requests': 0, 'audio_seconds': 0.0, 'audio_chars': 0,
+            'voice_bytes': 0, 'mix_seconds': 0.0, 'mix_audio_seconds': 0.0, 'final_bytes': 0}
+
+
+def load_cost_model(path=COST_MODEL_FILE, model=DEFAULT_COST_MODEL):
+    """读取校准过的模型，没有则用给定的模型"""
+
+    try:
+        saved = json.loads(Path(path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return dict(model)
+    return {**model, **saved}
+
+
+def save_cost_model(model, path=COST_MODEL_FILE):
+    """保存模型（先写临时文件再改名）"""
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(model, ensure_ascii=False, indent=2), encoding='utf-8')
+    os.replace(tmp_path, path)
+
+
+def blend(old, measured):
+    """新测量值与已有校准值各占一半，减少单次运行的波动（还没有校准值时直接采用）"""
+    return measured if old is None else (old + measured) / 2
+
+
+def calibrate_cost_model(model, samples, output_profile):
+    """用本次运行的测量值校准模型，返回新模型（没有样本的项保持不变）"""
+
+    calibrated = model.get('calibrated_runs', 0) > 0
+    model = dict(model, final_bytes_per_minute=dict(model.get('final_bytes_per_minute', {})))
+
+    def update(key, measured):
+        model[key] = blend(model[key] if calibrated else None, measured)
+
+    if samples['tts_chars']:
+        overhead = samples['tts_requests'] * model['tts_seconds_per_segment']
+        update('tts_seconds_per_char', max(0.0, samples['tts_seconds'] - overhead) / samples['tts_chars'])
+    if samples['audio_seconds']:
+        update('chars_per_audio_minute', samples['audio_chars'] / (samples['audio_seconds'] / 60))
+        update('voice_bytes_per_minute', samples['voice_bytes'] / (samples['audio_seconds'] / 60))
+    if samples['mix_audio_seconds']:
+        minutes = samples['mix_audio_seconds'] / 60
+        update('mix_seconds_per_audio_minute', samples['mix_seconds'] / minutes)
+        sizes = model['final_bytes_per_minute']
+        sizes[output_profile] = blend(sizes.get(output_profile), samples['final_bytes'] / minutes)
+
+    if samples['tts_chars'] or samples['audio_seconds'] or samples['mix_audio_seconds']:
+        model['calibrated_runs'] = model.get('calibrated_runs', 0) + 1
+    return model
@@ -0,0 +1,204 @@
+"""
+分阶段流水线（asyncio）
+- 每个阶段有自己的worker数和有界输入队列：下游处理不过来时上游自动等待（背压）
+- 阶段函数：async def func(item) -> 下一阶段的item；返回列表则展开为多个下游任务，返回None则不再往下传
+- 阶段函数抛出异常时该任务记为失败，交给 on_error 回调，流水线继续处理其他任务
+- 输入可以是普通序列，也可以是异步迭代器（如从任务队列边领取边处理）
+- 阶段可指定优先级：排队中的任务按优先级（如预测耗时）而不是到达顺序处理
+- on_done/on_error 可以是普通函数或协程函数
+- 事件循环阻塞检查：阶段函数中的同步操作会卡住所有阶段，check 模式下记录超过阈值的阻塞及其来源
+- 每个阶段统计：输入/输出/失败数、忙碌时间、空等时间、队列最大长度
+"""
+
+import asyncio
+import inspect
+import itertools
+import logging
+import time
+
+# 队列结束标记
+STOP = object()
+
+
+def new_stage(name, func, workers=1, queue_size=None, priority=None):
+    """定义一个阶段（队列默认容量为worker数的2倍；priority(item) 给出时，队列中值大的先处理）"""
+    return {'name': name, 'func': func, 'workers': max(1, workers), 'queue_size': queue_size or max(1, workers) * 2,
+            'priority': priority}
+
+
+def new_metrics():
+    return {'in': 0, 'out': 0, 'failed': 0, 'busy': 0.0, 'idle': 0.0, 'max_queue': 0}
+
+
+async def run_pipeline(items, stages, on_done=None, on_error=None):
+    """运行流水线，返回 (最后一个阶段的输出列表, 各阶段统计, 总耗时秒)"""
+
+    queues = [
+        asyncio.PriorityQueue(maxsize=stage['queue_size']) if stage.get('priority') else
+        asyncio.Queue(maxsize=stage['queue_size'])
+        for stage in stages
+    ]
+    metrics = {stage['name']: new_metrics() for stage in stages}
+    results = []
+    order = itertools.count()
+
+    async def enqueue(i, item):
+        priority = stages[i].get('priority')
+        if priority:
+            # 结束标记排在最后；同优先级按入队顺序
+            key = float('inf') if item is STOP else -priority(item)
+            await queues[i].put((key, next(order), item))
+        else:
+            await queues[i].put(item)
+
+    async def dequeue(i):
+        item = await queues[i].get()
+        return item[2] if stages[i].get('priority') else item
+
+    async def put(i, item):
+        await enqueue(i, item)
+        m = metrics[stages[i]['name']]
+        m['max_queue'] = max(m['max_queue'], queues[i].qsize())
+
+    async def worker(i):
+        stage = stages[i]
+        m = metrics[stage['name']]
+        while True:
+            waited = time.perf_counter()
+            item = await dequeue(i)
+            m['idle'] += time.perf_counter() - waited
+            if item is STOP:
+                return
+
+            m['in'] += 1
+            started = time.perf_counter()
+            try:
+                output = await stage['func'](item)
+            except Exception as e:
+                m['failed'] += 1
+                if on_error:
+                    await maybe_await(on_error(stage['name'], item, e))
+                output = None
+            finally:
+                m['busy'] += time.perf_counter() - started
+
+            outputs = output if isinstance(output, list) else ([] if output is None else [output])
+            m['out'] += len(outputs)
+            for out in outputs:
+                if i + 1 < len(stages):
+                    await put(i + 1, out)
+                else:
+                    results.append(out)
+                    if on_done:
+                        await maybe_await(on_done(out))
+
+    async def run_stage(i):
+        await asyncio.gather(*(worker(i) for _ in range(stages[i]['workers'])))
+        # 本阶段全部结束后，通知下一阶段的每个worker退出
+        if i + 1 < len(stages):
+            for _ in range(stages[i + 1]['workers']):
+                await enqueue(i + 1, STOP)
+
+    async def feed():
+        if hasattr(items, '__aiter__'):
+            async for item in items:
+                await put(0, item)
+        else:
+            for item in items:
+                await put(0, item)
+        for _ in range(stages[0]['workers']):
+            await enqueue(0, STOP)
+
+    start = time.perf_counter()
+    await asyncio.gather(feed(), *(run_stage(i) for i in range(len(stages))))
+    return results, metrics, time.perf_counter() - start
+
+
+async def maybe_await(result):
+    """回调可以是普通函数或协程函数"""
+    if inspect.isawaitable(result):
+        await result
+
+
+# ============================================
+# 事件循环阻塞检查
+# ============================================
+# 默认阈值：事件循环被同步代码占用超过100毫秒即视为阻塞
+LOOP_BLOCK_THRESHOLD = 0.1
+
+# 探测间隔：每隔此时长醒来一次，实际醒来的延迟即阻塞时长
+LOOP_PROBE_INTERVAL = 0.01
+
+
+class SlowCallbackHandler(logging.Handler):
+    """收集asyncio调试模式报告的慢回调（"Executing <Task ...> took 0.250 seconds"）"""
+
+    def __init__(self, monitor):
+        super().__init__(logging.WARNING)
+        self.monitor = monitor
+
+    def emit(self, record):
+        message = record.getMessage()
+        if message.startswith('Executing '):
+            self.monitor['slow_callbacks'].append(message)
+
+
+def new_loop_monitor(threshold=LOOP_BLOCK_THRESHOLD):
+    return {'threshold': threshold, 'max_lag': 0.0, 'blocked': 0, 'probes': 0, 'slow_callbacks': []}
+
+
+async def watch_loop(monitor):
+    """定时醒来，醒来的延迟超过阈值就是事件循环被阻塞了"""
+
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LOOP_PROBE_INTERVAL)
+        lag = loop.time() - start - LOOP_PROBE_INTERVAL
+        monitor['probes'] += 1
+        monitor['max_lag'] = max(monitor['max_lag'], lag)
+        if lag > monitor['threshold']:
+            monitor['blocked'] += 1
+
+
+def start_loop_monitor(threshold=LOOP_BLOCK_THRESHOLD):
+    """开启阻塞检查：探测任务 + asyncio调试模式的慢回调报告（指出是哪个协程阻塞），返回 (monitor, 结束函数)"""
+
+    loop = asyncio.get_running_loop()
+    monitor = new_loop_monitor(threshold)
+    loop.set_debug(True)
+    loop.slow_callback_duration = threshold
+    handler = SlowCallbackHandler(monitor)
+    logger = logging.getLogger('asyncio')
+    logger.addHandler(handler)
+    task = asyncio.create_task(watch_loop(monitor))
+
+    def stop():
+        task.cancel()
+        logger.removeHandler(handler)
+        loop.set_debug(False)
+
+    return monitor, stop
+
+
+def print_loop_report(monitor, top=5):
+    """打印阻塞检查结果，返回是否通过"""
+
+    ok = monitor['blocked'] == 0 and not monitor['slow_callbacks']
+    print(f"  Event loop:      max lag {monitor['max_lag'] * 1000:.0f} ms, "
+          f"{monitor['blocked']} probe(s) over {monitor['threshold'] * 1000:.0f} ms - {'OK' if ok else 'BLOCKED'}")
+    for message in monitor['slow_callbacks'][:top]:
+        print(f"    - {message[:160]}")
+    return ok
+
+
+def print_stage_metrics(stages, metrics, wall_time):
+    """打印各阶段统计；利用率最高的阶段就是瓶颈"""
+
+    print(f"  {'Stage':<10} {'Workers':>7} {'In':>5} {'Out':>5} {'Fail':>5} {'Busy s':>8} {'Util':>6} {'MaxQ':>5}")
+    for stage in stages:
+        m = metrics[stage['name']]
+        capacity = wall_time * stage['workers']
+        util = m['busy'] / capacity * 100 if capacity > 0 else 0
+        print(f"  {stage['name']:<10} {stage['workers']:>7} {m['in']:>5} {m['out']:>5} {m['failed']:>5} "
+              f"{m['busy']:>8.1f} {util:>5.0f}% {m['max_queue']:>5}")
@@ -0,0 +1,221 @@
+"""
+分段流式输出（HLS）
+- 配音每合成好一段就与BGM底乐混音，送入ffmpeg的HLS封装，按固定时长切片并实时更新播放列表
+- 播放列表为EVENT类型：切片一写完就能播放，全部完成后追加 #EXT-X-ENDLIST
+- 结尾渐出要知道总长度：始终保留最后"渐出时长"的音频，等下一段到来或全部结束再输出
+- 自带本地播放检查：解析播放列表、核对切片、用ffmpeg完整解码一遍并核对总时长（需要numpy混音）
+
+用法（播放检查）：
+    python skills/stream_output.py audio_with_bgm/001_xxx_hls/index.m3u8
+    python skills/stream_output.py audio_with_bgm/001_xxx_hls/index.m3u8 --expect-duration 321.5 --partial
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+from audio_mix import mix_chunk
+
+# 每个切片的时长（秒）
+HLS_CHUNK_SECONDS = 6
+
+PLAYLIST_NAME = 'index.m3u8'
+
+
+# ============================================
+# HLS编码
+# ============================================
+def hls_output_args(output_dir, encode_args, chunk_seconds=HLS_CHUNK_SECONDS):
+    """HLS封装参数：AAC/MP3 用 MPEG-TS 切片，Opus 用 fMP4 切片"""
+
+    fmp4 = 'libopus' in encode_args
+    extension = 'm4s' if fmp4 else 'ts'
+    return [
+        *encode_args,
+        '-f', 'hls',
+        '-hls_time', str(chunk_seconds),
+        '-hls_playlist_type', 'event',
+        '-hls_segment_type', 'fmp4' if fmp4 else 'mpegts',
+        '-hls_segment_filename', str(Path(output_dir) / f"chunk_%05d.{extension}"),
+        str(Path(output_dir) / PLAYLIST_NAME)
+    ]
+
+
+def start_hls_encoder(output_dir, sample_rate, channels, encode_args, chunk_seconds=HLS_CHUNK_SECONDS):
+    """启动HLS编码进程，stdin 接收 f32le PCM"""
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-f', 'f32le', '-ar', str(sample_rate), '-ac', str(channels), '-i', '-',
+        *hls_output_args(output_dir, encode_args, chunk_seconds)
+    ]
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def first_chunk_ready(output_dir):
+    """播放列表中是否已经有可播放的切片"""
+
+    try:
+        text = (Path(output_dir) / PLAYLIST_NAME).read_text(encoding='utf-8')
+    except OSError:
+        return False
+    return '#EXTINF' in text
+
+
+# ============================================
+# 流式混音
+# ============================================
+def new_stream(encoder, bed, fade_frames):
+    """流式混音状态：bed 为内存映射的底乐（None 表示不加BGM）"""
+    return {'encoder': encoder, 'bed': bed, 'fade_frames': fade_frames, 'pending': None, 'pos': 0}
+
+
+def emit(stream, voice, fade_end):
+    """混音并写入编码器"""
+
+    if len(voice) == 0:
+        return
+    if stream['bed'] is None:
+        mixed = voice
+    else:
+        mixed = mix_chunk(voice, stream['bed'], stream['pos'], fade_end, stream['fade_frames'])
+    stream['encoder'].stdin.write(mixed.astype('<f4').tobytes())
+    stream['pos'] += len(voice)
+
+
+def stream_feed(stream, voice):
+    """送入一段配音 (帧数, 声道)；保留结尾 fade_frames 帧，其余立即输出"""
+
+    import numpy as np
+
+    if stream['pending'] is not None:
+        voice = np.concatenate([stream['pending'], voice])
+
+    keep = min(stream['fade_frames'], len(voice))
+    ready, stream['pending'] = voice[:len(voice) - keep], voice[len(voice) - keep:]
+
+    # 总长度还未知，此时输出的部分都在渐出区之前
+    emit(stream, ready, float('inf'))
+
+
+def stream_finish(stream):
+    """全部送入后：对保留的结尾做渐出，关闭编码器（写入 #EXT-X-ENDLIST）"""
+
+    pending = stream['pending']
+    if pending is not None:
+        emit(stream, pending, stream['pos'] + len(pending))
+        stream['pending'] = None
+
+    encoder = stream['encoder']
+    encoder.stdin.close()
+    error = encoder.stderr.read()
+    if encoder.wait() != 0:
+        raise RuntimeError(f"HLS encode failed: {error[:200]}")
+
+
+def stream_abort(stream):
+    """出错时结束编码进程"""
+
+    encoder = stream['encoder']
+    if encoder.poll() is None:
+        encoder.kill()
+        encoder.wait()
+
+
+# ============================================
+# 本地播放检查
+# ============================================
+def parse_playlist(playlist_path):
+    """解析播放列表，返回 (切片列表 [(时长, 文件名)], 是否已结束, 初始化段)"""
+
+    chunks = []
+    ended = False
+    init_segment = None
+    duration = None
+
+    with open(playlist_path, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f if line.strip()]
+
+    if not lines or lines[0] != '#EXTM3U':
+        raise ValueError(f"not an HLS playlist: {playlist_path}")
+
+    for line in lines[1:]:
+        if line.startswith('#EXTINF:'):
+            duration = float(line[len('#EXTINF:'):].split(',')[0])
+        elif line.startswith('#EXT-X-MAP:'):
+            init_segment = line.split('URI="', 1)[1].split('"', 1)[0]
+        elif line == '#EXT-X-ENDLIST':
+            ended = True
+        elif not line.startswith('#'):
+            chunks.append((duration, line))
+            duration = None
+
+    return chunks, ended, init_segment
+
+
+def check_playlist(playlist_path, expect_duration=None, partial=False, tolerance=0.5):
+    """像播放器一样检查本地播放列表，返回 (是否通过, 检查结果)
+
+    partial=True 时允许播放列表尚未结束（用于检查边合成边播放）。
+    """
+
+    playlist_path = Path(playlist_path)
+    report = {'playlist': str(playlist_path), 'errors': []}
+
+    try:
+        chunks, ended, init_segment = parse_playlist(playlist_path)
+    except (OSError, ValueError) as e:
+        report['errors'].append(str(e))
+        return False, report
+
+    report['chunks'] = len(chunks)
+    report['ended'] = ended
+    report['playlist_duration'] = round(sum(d or 0 for d, _ in chunks), 3)
+
+    if not chunks:
+        report['errors'].append('playlist has no chunks')
+    if not ended and not partial:
+        report['errors'].append('playlist has no #EXT-X-ENDLIST')
+    for name in ([init_segment] if init_segment else []) + [name for _, name in chunks]:
+        if not (playlist_path.parent / name).exists():
+            report['errors'].append(f"missing chunk: {name}")
+    if report['errors']:
+        return False, report
+
+    # 用ffmpeg按播放列表完整解码（与播放器读取方式相同）
+    cmd = ['ffmpeg', '-v', 'error', '-i', str(playlist_path), '-f', 's16le', '-ac', '1', '-ar', '8000', '-']
+    result = subprocess.run(cmd, capture_output=True)
+    report['decoded_duration'] = round(len(result.stdout) / 2 / 8000, 3)
+    if result.returncode != 0 or result.stderr.strip():
+        report['errors'].append(f"decode errors: {result.stderr[:200].decode('utf-8', 'replace')}")
+
+    if abs(report['decoded_duration'] - report['playlist_duration']) > tolerance + len(chunks) * 0.05:
+        report['errors'].append('decoded duration does not match playlist')
+    if expect_duration is not None and not partial and abs(report['decoded_duration'] - expect_duration) > tolerance:
+        report['errors'].append(f"expected {expect_duration:.2f}s of audio")
+
+    return not report['errors'], report
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Check a local HLS playlist the way a player would')
+    parser.add_argument('playlist', help='Path to index.m3u8')
+    parser.add_argument('--expect-duration', type=float, help='Expected total duration in seconds')
+    parser.add_argument('--partial', action='store_true', help='Allow a playlist that is still being written')
+
+    args = parser.parse_args()
+
+    ok, report = check_playlist(args.playlist, args.expect_duration, args.partial)
+    print("="*70)
+    print(f"  Playlist:         {report['playlist']}")
+    print(f"  Chunks:           {report.get('chunks', 0)} (ended: {report.get('ended', False)})")
+    print(f"  Playlist length:  {report.get('playlist_duration', 0):.2f}s")
+    print(f"  Decoded length:   {report.get('decoded_duration', 0):.2f}s")
+    for error in report['errors']:
+        print(f"  [!] {error}")
+    print(f"  Result:           {'OK' if ok else 'FAILED'}")
+    print("="*70)
+    sys.exit(0 if ok else 1)
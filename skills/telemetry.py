@@ -0,0 +1,225 @@
+"""
+运行指标（Prometheus文本格式）与时间线（Chrome trace）
+- 计数器和直方图都在进程内累计，不依赖 prometheus_client
+- 两种输出方式：本地HTTP端点 /metrics，或定时写入文本文件（node-exporter textfile collector）
+- 时间线：每篇文章每个阶段、每个TTS分段的起止时间，可在trace查看器中看到并发和空等
+- 阶段函数可能在线程中运行（asyncio.to_thread），所有更新都加锁
+
+用法：
+    python skills/article_to_audio_complete.py articles.xlsx --metrics-port 9108
+    python skills/article_to_audio_complete.py articles.xlsx --metrics-textfile /var/lib/node_exporter/article_audio.prom
+    python skills/article_to_audio_complete.py articles.xlsx --trace trace.json
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+PREFIX = 'article_audio_'
+
+# 耗时直方图的分桶（秒）：网络请求、TTS分段、ffmpeg编码都在这个范围内
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# 指标定义：名称 -> (类型, 说明)
+METRIC_HELP = {
+    'fetch_seconds': ('histogram', 'Article page download latency'),
+    'clean_seconds': ('histogram', 'HTML extraction and text cleaning time'),
+    'tts_segment_seconds': ('histogram', 'TTS latency per synthesized segment, including queueing for a TTS slot'),
+    'merge_seconds': ('histogram', 'Voice segment merge time'),
+    'mix_seconds': ('histogram', 'BGM mix and final encode time'),
+    'tts_chars_total': ('counter', 'Characters sent to TTS'),
+    'bytes_written_total': ('counter', 'Bytes of output files written'),
+    'retries_total': ('counter', 'Retried operations'),
+    'failures_total': ('counter', 'Failed pipeline items by stage and error class'),
+    'items_total': ('counter', 'Finished pipeline items (article x variant) by result'),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+
+def label_key(labels):
+    """标签排序后作为字典键"""
+    return tuple(sorted(labels.items()))
+
+
+def counter_inc(name, value=1, **labels):
+    """计数器加值"""
+
+    key = (name, label_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def histogram_observe(name, value, **labels):
+    """直方图记录一个观测值"""
+
+    key = (name, label_key(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {'buckets': [0] * len(SECONDS_BUCKETS), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(SECONDS_BUCKETS):
+            if value <= bound:
+                hist['buckets'][i] += 1
+        hist['sum'] += value
+        hist['count'] += 1
+
+
+@contextmanager
+def timed(name, **labels):
+    """计时并记入直方图（出错时也记录）"""
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram_observe(name, time.perf_counter() - start, **labels)
+
+
+def count_bytes(path, kind):
+    """记录写出的文件大小"""
+
+    try:
+        counter_inc('bytes_written_total', Path(path).stat().st_size, kind=kind)
+    except OSError:
+        pass
+
+
+def format_labels(labels, extra=None):
+    """{a="1",b="2"} 形式的标签（值中的引号、反斜杠、换行需转义）"""
+
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = [
+        (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in pairs
+    ]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def render_metrics():
+    """按Prometheus文本格式输出全部指标"""
+
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: dict(hist, buckets=list(hist['buckets'])) for key, hist in _histograms.items()}
+
+    lines = []
+    for name, (kind, help_text) in METRIC_HELP.items():
+        full_name = PREFIX + name
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {kind}")
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{full_name}{format_labels(labels)} {value}")
+        else:
+            for (metric, labels), hist in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                # 分桶计数在记录时已按"≤上界"累计
+                for bound, count in zip(SECONDS_BUCKETS, hist['buckets']):
+                    lines.append(f"{full_name}_bucket{format_labels(labels, ('le', bound))} {count}")
+                lines.append(f"{full_name}_bucket{format_labels(labels, ('le', '+Inf'))} {hist['count']}")
+                lines.append(f"{full_name}_sum{format_labels(labels)} {hist['sum']:.6f}")
+                lines.append(f"{full_name}_count{format_labels(labels)} {hist['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path):
+    """写入node-exporter文本文件（先写临时文件再改名，避免被读到一半）"""
+
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(render_metrics(), encoding='utf-8')
+    os.replace(tmp_path, path)
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """在后台线程启动 /metrics HTTP端点，返回server（进程退出时随之结束）"""
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render_metrics().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ============================================
+# 时间线（Chrome trace event 格式）
+# ============================================
+# 每条"泳道"对应trace中的一个线程：每篇文章（及版本）一条，每个TTS并发槽一条
+# 同一泳道内的区间只会顺序或嵌套出现，文章泳道上的空白就是在阶段队列中的等待
+TRACE = {'enabled': False, 'events': [], 'lanes': {}, 'start': 0.0}
+
+
+def trace_enable():
+    """开始记录时间线"""
+
+    TRACE.update(enabled=True, events=[], lanes={}, start=time.perf_counter())
+
+
+def lane_id(lane):
+    """泳道名 -> trace中的线程号（首次出现时分配）"""
+
+    with _lock:
+        if lane not in TRACE['lanes']:
+            TRACE['lanes'][lane] = len(TRACE['lanes']) + 1
+        return TRACE['lanes'][lane]
+
+
+@contextmanager
+def span(name, lane, **args):
+    """记录一个区间（未开启时间线时不做任何事）"""
+
+    if not TRACE['enabled']:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        event = {
+            'name': name, 'ph': 'X', 'pid': 1, 'tid': lane_id(lane),
+            'ts': round((start - TRACE['start']) * 1e6), 'dur': round((end - start) * 1e6),
+        }
+        if args:
+            event['args'] = args
+        with _lock:
+            TRACE['events'].append(event)
+
+
+def save_trace(path):
+    """写出trace文件（chrome://tracing 或 https://ui.perfetto.dev 打开）"""
+
+    metadata = [{'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': 'article_to_audio'}}]
+    for lane, tid in TRACE['lanes'].items():
+        metadata.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': lane}})
+        metadata.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'sort_index': tid}})
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': metadata + TRACE['events'], 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+    return len(TRACE['events'])
@@ -0,0 +1,245 @@
+"""
+多进程/多机任务队列（SQLite，基于租约）
+- 所有worker共用一个队列数据库（同一台机器，或多台机器共享的文件系统）
+- 领取任务时写入租约到期时间；处理期间定时续租（心跳）
+- worker死掉后租约过期，任务自动回到可领取状态，由其他worker接手
+- 领取、续租、完成都在 BEGIN IMMEDIATE 事务中进行，同一任务不会被两个worker同时持有
+- 数据库不用WAL（共享文件系统上WAL不可靠），并发靠SQLite文件锁
+
+本地自测（多个进程抢同一个队列，其中一个中途被杀掉）：
+    python skills/work_queue.py selftest --workers 4 --jobs 40
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import time
+from pathlib import Path
+
+QUEUE_FILE_NAME = '.work_queue.sqlite'
+
+# 租约时长（秒）；心跳间隔为其1/3
+DEFAULT_LEASE_SECONDS = 120
+
+# 同一任务最多尝试次数（超过后标记为failed，不再领取）
+DEFAULT_MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_key     TEXT PRIMARY KEY,
+    seq         INTEGER NOT NULL,
+    payload     TEXT NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'pending',
+    owner       TEXT,
+    lease_until REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, seq);
+"""
+
+
+def worker_name():
+    """worker标识：主机名:进程号"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def open_queue(path):
+    """打开（或创建）队列数据库（与 open_state 相同，连接可交给专用线程使用）"""
+
+    conn = sqlite3.connect(str(path), isolation_level=None, timeout=60, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=DELETE')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def enqueue_jobs(conn, jobs):
+    """加入任务 [(job_key, payload)]；已存在的保持原状态（多个worker重复加入无影响）"""
+
+    now = time.time()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        for seq, (key, payload) in enumerate(jobs):
+            conn.execute(
+                'INSERT OR IGNORE INTO jobs (job_key, seq, payload, updated_at) VALUES (?, ?, ?, ?)',
+                (key, seq, json.dumps(payload, ensure_ascii=False), now)
+            )
+
+
+def claim_job(conn, worker, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """领取一个任务：待处理的，或租约已过期的；返回 (job_key, payload)，没有可领取的返回None"""
+
+    now = time.time()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        # 租约过期且已用完尝试次数的任务直接判为失败
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', owner = NULL, error = 'lease expired', updated_at = ? "
+            "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+            (now, now, max_attempts)
+        )
+        row = conn.execute(
+            "SELECT job_key, payload FROM jobs "
+            "WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?) "
+            "ORDER BY seq LIMIT 1",
+            (now,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'leased', owner = ?, lease_until = ?, attempts = attempts + 1, "
+            "updated_at = ? WHERE job_key = ?",
+            (worker, now + lease_seconds, now, row[0])
+        )
+    return row[0], json.loads(row[1])
+
+
+def heartbeat(conn, job_keys, worker, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """为本worker持有的任务续租，返回已经失去租约的任务"""
+
+    now = time.time()
+    lost = []
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        for key in job_keys:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? "
+                "WHERE job_key = ? AND owner = ? AND status = 'leased'",
+                (now + lease_seconds, now, key, worker)
+            )
+            if cursor.rowcount == 0:
+                lost.append(key)
+    return lost
+
+
+def complete_job(conn, job_key, worker, ok=True, error=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """完成任务；失败且还有尝试次数时放回队列。租约已被别人接手则不修改，返回False"""
+
+    now = time.time()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute(
+            "SELECT attempts FROM jobs WHERE job_key = ? AND owner = ? AND status = 'leased'",
+            (job_key, worker)
+        ).fetchone()
+        if row is None:
+            return False
+        if ok:
+            status = 'done'
+        else:
+            status = 'pending' if row[0] < max_attempts else 'failed'
+        conn.execute(
+            "UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL, error = ?, updated_at = ? "
+            "WHERE job_key = ?",
+            (status, error, now, job_key)
+        )
+    return True
+
+
+def queue_summary(conn):
+    """各状态的任务数，如 {'done': 37, 'leased': 3}"""
+    return dict(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status'))
+
+
+def queue_open(conn):
+    """是否还有未结束的任务（待处理或被租用中）"""
+    row = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'leased')").fetchone()
+    return row[0] > 0
+
+
+# ============================================
+# 本地自测
+# ============================================
+def selftest_worker(queue_path, work_seconds, lease_seconds, die_after):
+    """自测worker：领取任务、模拟处理并心跳；die_after>0 时处理到第N个任务中途直接退出"""
+
+    conn = open_queue(queue_path)
+    worker = worker_name()
+    processed = 0
+    while True:
+        claimed = claim_job(conn, worker, lease_seconds)
+        if claimed is None:
+            if not queue_open(conn):
+                return
+            time.sleep(lease_seconds / 4)
+            continue
+
+        key, payload = claimed
+        if die_after and processed + 1 >= die_after:
+            # 模拟进程崩溃：不释放租约，也不再心跳
+            os._exit(1)
+
+        deadline = time.time() + work_seconds
+        while time.time() < deadline:
+            time.sleep(min(lease_seconds / 3, deadline - time.time()))
+            if heartbeat(conn, [key], worker, lease_seconds):
+                break
+
+        # 记录谁处理了哪个任务，用于检查是否重复处理
+        conn.execute('CREATE TABLE IF NOT EXISTS selftest_log (job_key TEXT, worker TEXT)')
+        conn.execute('INSERT INTO selftest_log VALUES (?, ?)', (key, worker))
+        complete_job(conn, key, worker)
+        processed += 1
+
+
+def run_selftest(workers=4, jobs=40, work_seconds=0.2, lease_seconds=1.0):
+    """启动多个worker进程抢同一个队列（第一个中途崩溃），检查每个任务都只完成一次"""
+
+    import tempfile
+    from multiprocessing import Process
+
+    with tempfile.TemporaryDirectory() as tmp:
+        queue_path = Path(tmp) / QUEUE_FILE_NAME
+        conn = open_queue(queue_path)
+        enqueue_jobs(conn, [(f"job{i:04d}", {'n': i}) for i in range(jobs)])
+
+        start = time.time()
+        procs = [
+            Process(target=selftest_worker, args=(queue_path, work_seconds, lease_seconds, 2 if i == 0 else 0))
+            for i in range(workers)
+        ]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+
+        summary = queue_summary(conn)
+        done_once = conn.execute(
+            'SELECT COUNT(DISTINCT job_key), COUNT(*) FROM selftest_log'
+        ).fetchone()
+        reclaimed = conn.execute('SELECT COUNT(*) FROM jobs WHERE attempts > 1').fetchone()[0]
+
+    ok = summary == {'done': jobs} and done_once == (jobs, jobs)
+    print("="*70)
+    print(f"  Workers:   {workers} (one killed mid-job)")
+    print(f"  Jobs:      {jobs} -> {summary}")
+    print(f"  Completed: {done_once[1]} records for {done_once[0]} jobs")
+    print(f"  Reclaimed: {reclaimed} job(s) after lease expiry")
+    print(f"  Wall time: {time.time() - start:.1f}s")
+    print(f"  Result:    {'OK' if ok else 'FAILED'}")
+    print("="*70)
+    return ok
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Lease-based SQLite work queue')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    test = sub.add_parser('selftest', help='Run several local worker processes against one queue')
+    test.add_argument('--workers', type=int, default=4)
+    test.add_argument('--jobs', type=int, default=40)
+
+    status = sub.add_parser('status', help='Show job counts of a queue database')
+    status.add_argument('queue', help='Path to the queue database')
+
+    args = parser.parse_args()
+
+    if args.command == 'selftest':
+        sys.exit(0 if run_selftest(args.workers, args.jobs) else 1)
+    else:
+        print(queue_summary(open_queue(args.queue)))